@@ -0,0 +1,146 @@
+"""Acknowledgement jitter benchmark
+
+    Drive the car with synthetic RC clients while a CPU-bound perception stand-in runs beside it, once in a
+single process (BFMC) and once in the multi-process runtime, against emulated serial and SPI back ends.
+Compare how long the Nucleo's acknowledgements of the moves take to be seen, from the serial write to the
+acknowledgement's callback, and the control loop's jitter.
+
+    python -m bfmc.benchmarks.ack_jitter --clients 2 --rate 100 --duration 5
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+from bfmc.process_runtime import AckMonitor, ProcessRuntime
+from bfmc.utils.connection_utils import *
+from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+from bfmc.benchmarks.load_generator import DEFAULT_PORT_OFFSET, SyntheticClient, parse_mix
+from bfmc.utils.stats import LatencyRecorder, format_latency_summary
+
+MIX = 'move=100'
+PERCEPTION_BATCH = 10000  # pure Python operations between two pose reads
+
+
+def perception_load(state, stop):
+    """perception_load
+
+        Stand-in for image processing: pure Python work reading the pose, until stop is set.
+    :param state: anything with get_pose (Odometry, RuntimeState)
+    :param stop: event
+    :return: None
+    """
+    while not stop.is_set():
+        state.get_pose()
+        sum(value * value for value in range(PERCEPTION_BATCH))
+
+
+def run_single_process(port, max_clients, perception, ready, stop, results):
+    """run_single_process
+
+        Car process: BFMC with the perception load on a thread, until stop is set.
+    :return: None
+    """
+    from bfmc.core import BFMC
+
+    logging.getLogger('bfmc').setLevel(logging.WARNING)
+    ack_monitor = AckMonitor()
+    serial_connection = SerialEmulator(write_callback=ack_monitor.on_write)
+    car = BFMC(port=port, max_clients=max_clients, serial_connection=serial_connection, spi=SpiEmulator())
+    for key in ("MCTL", "BRAK"):
+        car.serial_handler.readThread.addWaiter(key, car.ev1, ack_monitor.on_ack)
+    car.listen()
+
+    perception_stop = threading.Event()
+    if perception:
+        threading.Thread(target=perception_load, args=(car.odometer, perception_stop), daemon=True).start()
+    ready.set()
+
+    stop.wait()
+    perception_stop.set()
+    results.put({
+        'ack': ack_monitor.latency.summary(),
+        'acknowledged': ack_monitor.acknowledged,
+        'latency': car.get_latency_report(),
+        'control_loop': car.control_loop.get_statistics(),
+    })
+    car.shutdown()
+
+
+def drive(port, clients, rate, duration):
+    """drive
+
+        Run the synthetic clients against the car.
+    :return: send to response latency summary
+    :rtype: dict
+    """
+    mix = parse_mix(MIX)
+    round_trip = LatencyRecorder()
+    synthetic_clients = [SyntheticClient(port, rate, mix, duration, 5., seed, round_trip)
+                         for seed in range(clients)]
+    for synthetic_client in synthetic_clients:
+        synthetic_client.start()
+    for synthetic_client in synthetic_clients:
+        synthetic_client.join()
+    return round_trip.summary()
+
+
+def run(mode, clients, rate, duration, port, perception):
+    """run
+
+    :param mode: single or multi
+    :return: None
+    """
+    if mode == 'single':
+        ready = multiprocessing.Event()
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        car = multiprocessing.Process(target=run_single_process,
+                                      args=(port, clients, perception, ready, stop, results))
+        car.start()
+        ready.wait()
+        round_trip = drive(port, clients, rate, duration)
+        stop.set()
+        report = results.get()
+        car.join()
+        ack, acknowledged = report['ack'], report['acknowledged']
+        command, jitter = report['latency']['command'], report['control_loop']['jitter']
+        misses = report['control_loop']['deadline_misses']
+    else:
+        runtime = ProcessRuntime(port=port, max_clients=clients, serial_factory=SerialEmulator,
+                                 spi_factory=SpiEmulator, perception=perception_load if perception else None,
+                                 log_level=logging.WARNING)
+        runtime.start()
+        round_trip = drive(port, clients, rate, duration)
+        report = runtime.stop()
+        ack, acknowledged = report['io']['ack'], report['io']['acknowledged']
+        command, jitter = report['control']['latency']['command'], report['control']['control_loop']['jitter']
+        misses = report['control']['control_loop']['deadline_misses']
+
+    print("{:>6} process, perception {}: {} moves acknowledged  deadline misses: {}".format(
+        mode, 'on' if perception else 'off', acknowledged, misses))
+    for name, summary in (('write -> ack', ack), ('command', command), ('loop jitter', jitter),
+                          ('send -> response', round_trip)):
+        print("{:>17}: {}".format(name, format_latency_summary(summary)))
+    if ack['count']:
+        print("{:>17}: {:.2f} ms (p99 - p50)".format('ack jitter', (ack['p99'] - ack['p50']) * 1e3))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Single versus multi-process acknowledgement jitter benchmark')
+    parser.add_argument('--mode', choices=['single', 'multi', 'both'], default='both')
+    parser.add_argument('--clients', type=int, default=1, help='number of synthetic clients')
+    parser.add_argument('--rate', type=float, default=50., help='moves per second, per client')
+    parser.add_argument('--duration', type=float, default=5., help='seconds of load')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT + DEFAULT_PORT_OFFSET)
+    parser.add_argument('--no-perception', action='store_true', help='without the CPU-bound perception stand-in')
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.WARNING)
+    # Encoder.csv and the serial history are written to the working directory
+    os.chdir(tempfile.mkdtemp(prefix='bfmc_ack_'))
+    modes = ['single', 'multi'] if args.mode == 'both' else [args.mode]
+    for index, mode in enumerate(modes):
+        run(mode, args.clients, args.rate, args.duration, args.port + index, not args.no_perception)
@@ -0,0 +1,113 @@
+"""Backpressure benchmark
+
+    Drive an overloaded car with a fast-moving synthetic joystick, once at the RC's fixed rate and once
+with the rate adapted to the car's reported status, and compare the end-to-end command latency.
+
+    python -m bfmc.benchmarks.backpressure --service-time 0.02 --duration 5
+"""
+import argparse
+import logging
+import math
+import threading
+
+from time import monotonic, sleep
+
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import *
+from bfmc.utils.host import Host
+from bfmc.utils.rc_scheduler import MoveSendScheduler, RateController
+from bfmc.utils.stats import percentile
+
+POWER_LIMIT = 75
+STEERING_LIMIT = 27
+STEERING_FREQUENCY = 5.  # Hz, fast enough for every sample to be a significant change
+
+
+def serve(host, service_time):
+    """serve
+
+        Slow car: answer every command after service_time seconds.
+    :return: None
+    """
+    host.connect_with_client()
+    while True:
+        frame = host.get_frame()
+        if frame is None:
+            return
+        sleep(service_time)
+        if frame.request_id != NO_REQUEST_ID:
+            host.send_response(frame.request_id, RESPONSE_OK)
+
+
+def drive(port, duration, adaptive):
+    """drive
+
+        Run the synthetic RC against the car for the given duration.
+    :return: latencies of the answered commands, number of sent commands
+    """
+    client = AsyncClient('localhost', port, default_timeout=60.)
+    client.connect_to_host()
+
+    scheduler = MoveSendScheduler()
+    rate_controller = RateController(scheduler)
+    if adaptive:
+        client.status_callback = rate_controller.on_status
+
+    latencies = []
+    futures = []
+
+    def on_done(sent_at):
+        return lambda future: latencies.append(monotonic() - sent_at)
+
+    start = monotonic()
+    scheduler.reset()
+    while monotonic() - start < duration:
+        t = monotonic() - start
+        power = rate_controller.quantize(POWER_LIMIT)
+        steering = rate_controller.quantize(int(STEERING_LIMIT * math.sin(2 * math.pi * STEERING_FREQUENCY * t)))
+        if scheduler.should_send((power, steering)):
+            future = client.send_package_async("$i10$d{} {}".format(power, steering))
+            future.add_done_callback(on_done(monotonic()))
+            futures.append(future)
+        scheduler.wait_next_sample()
+
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    client.close()
+
+    return sorted(latencies), len(futures)
+
+
+def run(mode, port, duration, service_time):
+    """run
+
+    :return: None
+    """
+    host = Host('localhost', port)
+    host.start_server()
+    server_thread = threading.Thread(target=serve, args=(host, service_time), daemon=True)
+    server_thread.start()
+
+    latencies, sent = drive(port, duration, adaptive=(mode == 'adaptive'))
+    host.stop_server()
+
+    print("{:>9}: sent {:5d} ({:6.1f}/s)  latency p50 {:7.1f} ms  p95 {:7.1f} ms  max {:7.1f} ms".format(
+        mode, sent, sent / duration,
+        percentile(latencies, 50) * 1000, percentile(latencies, 95) * 1000, latencies[-1] * 1000))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='RC backpressure benchmark')
+    parser.add_argument('--port', type=int, default=18888)
+    parser.add_argument('--duration', type=float, default=5., help='seconds per mode')
+    parser.add_argument('--service-time', type=float, default=.02, help="car's seconds per command")
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.ERROR)
+
+    print("car capacity: {:.0f} commands/s".format(1. / args.service_time))
+    run('fixed', args.port, args.duration, args.service_time)
+    run('adaptive', args.port + 1, args.duration, args.service_time)
@@ -0,0 +1,101 @@
+"""Bring-up benchmark
+
+    Time BFMC's start-up against emulated serial and SPI back ends, with its steps run one after another and
+as a concurrent dependency graph: when the server accepts clients, when the car is ready to drive (the
+Nucleo is driven), when every step is done, and every step's timing. The SPI device takes a while to open
+and the emulated Nucleo may ignore the commands sent while it boots after the port opened (the bring-up
+resends them).
+
+    python -m bfmc.benchmarks.bring_up --spi-open .2 --nucleo-boot .3
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from time import monotonic, sleep
+
+from bfmc.core import BFMC
+from bfmc.utils.connection_utils import *
+from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+from bfmc.benchmarks.load_generator import DEFAULT_PORT_OFFSET
+
+
+class BootingSerialEmulator(SerialEmulator):
+    """BootingSerialEmulator
+
+        Nucleo ignoring the commands received while it boots.
+    """
+    def __init__(self, boot_time):
+        """Constructor
+
+        :param boot_time: seconds the Nucleo boots for, from now
+        """
+        SerialEmulator.__init__(self)
+        self.booted_at = monotonic() + boot_time
+
+    def __handle_command__(self, command, received_at):
+        """__handle_command__
+
+            Acknowledge a command, unless still booting.
+        :return: None
+        """
+        if received_at >= self.booted_at:
+            SerialEmulator.__handle_command__(self, command, received_at)
+
+
+class SlowSpiEmulator(SpiEmulator):
+    """SlowSpiEmulator
+
+        Driver board whose SPI device takes a while to open.
+    """
+    def __init__(self, open_time):
+        """Constructor
+
+        :param open_time: seconds open takes
+        """
+        SpiEmulator.__init__(self)
+        self.open_time = open_time
+
+    def open(self, bus, device):
+        """open
+
+        :return: None
+        """
+        sleep(self.open_time)
+        SpiEmulator.open(self, bus, device)
+
+
+def run(concurrent, port, nucleo_boot, spi_open):
+    """run
+
+    :param concurrent: concurrent bring-up if True, one step after another if False
+    :return: None
+    """
+    car = BFMC(port=port, serial_connection=BootingSerialEmulator(nucleo_boot), spi=SlowSpiEmulator(spi_open),
+               concurrent_bring_up=concurrent)
+    timings = car.bring_up.get_timings()
+    server, control = timings['server'], timings['control']
+
+    print("{}: server up after {:.1f} ms, ready to drive after {:.1f} ms, brought up in {:.1f} ms".format(
+        'concurrent' if concurrent else 'sequential', (server['started_at'] + server['duration']) * 1e3,
+        (control['started_at'] + control['duration']) * 1e3, car.bring_up.duration * 1e3))
+    for name, timing in timings.items():
+        print("{:>18}: +{:7.1f} ms  {:7.1f} ms  {} attempts".format(
+            name, timing['started_at'] * 1e3, timing['duration'] * 1e3, timing['attempts']))
+
+    car.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sequential versus concurrent bring-up benchmark')
+    parser.add_argument('--nucleo-boot', type=float, default=0., help="seconds the Nucleo ignores commands for")
+    parser.add_argument('--spi-open', type=float, default=.2, help="seconds the SPI device takes to open")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT + DEFAULT_PORT_OFFSET)
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.WARNING)
+    # Encoder.csv and the serial history are written to the working directory
+    os.chdir(tempfile.mkdtemp(prefix='bfmc_bring_up_'))
+    for index, concurrent in enumerate((False, True)):
+        run(concurrent, args.port + index, args.nucleo_boot, args.spi_open)
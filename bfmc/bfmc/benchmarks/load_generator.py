@@ -0,0 +1,355 @@
+"""Full-stack load generator
+
+    Start BFMC in its own process against emulated serial and SPI back ends, open synthetic clients
+replaying a configurable command mix at a target rate and report the delivered throughput, the drops,
+the latency percentiles and the car process' CPU and memory usage.
+
+    python -m bfmc.benchmarks.load_generator --clients 4 --rate 100 --mix move=90,brake=5,lights=5
+"""
+import argparse
+import bisect
+import logging
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+
+from time import monotonic, sleep
+
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import *
+from bfmc.utils.maneuvers import MANEUVER_PARKING, build_maneuver_package
+from bfmc.utils.spi import SPI_CMD_LIGHTS, build_spi_package
+from bfmc.utils.stats import LatencyRecorder, format_latency_summary
+from bfmc.utils.transport import TRANSPORT_TCP, TRANSPORT_UNIX, get_transport
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_PORT_OFFSET = 1000
+DEFAULT_MIX = 'move=90,brake=5,lights=5,parking=0'
+CONNECT_RETRIES = 50
+CONNECT_RETRY_DELAY = .1  # seconds
+
+
+def build_command(kind, rng):
+    """build_command
+
+        Build a random command of the given kind, as the RC would send it.
+    :param kind: one of move, brake, lights, parking, batch
+    :param rng: random generator
+    :type rng: random.Random
+    :return: package, or list of packages to be sent as one batch
+    :rtype: str or list of str
+    """
+    if kind == 'move':
+        return '$i10$d{} {}'.format(rng.randint(-75, 75), rng.randint(-27, 27))
+    if kind == 'brake':
+        return '$i13$d0'
+    if kind == 'lights':
+        return build_spi_package(SPI_CMD_LIGHTS, [rng.randint(0, 2)])
+    if kind == 'parking':
+        return build_maneuver_package(MANEUVER_PARKING)
+    if kind == 'batch':
+        return [build_command('lights', rng), build_command('move', rng)]
+    raise ValueError('Unknown command kind: {}'.format(kind))
+
+
+def parse_mix(mix):
+    """parse_mix
+
+    :param mix: command kinds and their weights, e.g. 'move=90,brake=10'
+    :type mix: str
+    :return: command kinds and their cumulative weights
+    :rtype: tuple of list
+    """
+    kinds = []
+    cumulative_weights = []
+    total = 0.
+    for item in mix.split(','):
+        kind, weight = item.split('=')
+        weight = float(weight)
+        if weight <= 0:
+            continue
+        build_command(kind.strip(), random.Random())
+        total += weight
+        kinds.append(kind.strip())
+        cumulative_weights.append(total)
+    if not kinds:
+        raise ValueError('Empty command mix!')
+    return kinds, cumulative_weights
+
+
+class ProcessMonitor:
+    """ProcessMonitor
+
+        Class used to measure a process' CPU time and memory through /proc (Linux only).
+    """
+    def __init__(self, pid):
+        """Constructor
+
+        :param pid: process ID
+        """
+        self.pid = pid
+        self.clock_ticks = os.sysconf('SC_CLK_TCK')
+
+    def cpu_time(self):
+        """cpu_time
+
+        :return: user and system CPU seconds used so far, None if unavailable
+        """
+        try:
+            with open('/proc/{}/stat'.format(self.pid)) as stat_file:
+                fields = stat_file.read().rsplit(')', 1)[1].split()
+        except (IOError, OSError, IndexError):
+            return None
+        # fields start at the process state (3rd field of the stat line): utime and stime are the 14th and 15th
+        return (int(fields[11]) + int(fields[12])) / float(self.clock_ticks)
+
+    def memory(self):
+        """memory
+
+        :return: current and peak resident set size, in kB, None if unavailable
+        """
+        rss = peak = None
+        try:
+            with open('/proc/{}/status'.format(self.pid)) as status_file:
+                for line in status_file:
+                    if line.startswith('VmRSS:'):
+                        rss = int(line.split()[1])
+                    elif line.startswith('VmHWM:'):
+                        peak = int(line.split()[1])
+        except (IOError, OSError, ValueError):
+            pass
+        return rss, peak
+
+
+def run_car(port, max_clients, log_level, ready, stop, results, transport=TRANSPORT_TCP):
+    """run_car
+
+        Car process: BFMC against emulated back ends, until stop is set.
+    :return: None
+    """
+    from bfmc.core import BFMC
+    from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+
+    os.chdir(tempfile.mkdtemp(prefix='bfmc_load_'))
+    logging.getLogger('bfmc').setLevel(log_level)
+
+    serial_connection = SerialEmulator()
+    spi = SpiEmulator()
+    car = BFMC(port=port, max_clients=max_clients, serial_connection=serial_connection, spi=spi,
+               transport=get_transport(transport), watch_driver_status=True)
+    car.listen()
+    ready.set()
+
+    stop.wait()
+    results.put({
+        'latency': car.get_latency_report(),
+        'served': car.connection.served_commands,
+        'serial_commands': serial_connection.commands,
+        'spi_transactions': spi.transactions,
+        'spi_worker': car.spi_worker.get_statistics(),
+        'status_poller': car.status_poller.get_statistics(),
+        'control_loop': car.control_loop.get_statistics(),
+    })
+    car.shutdown()
+
+
+class SyntheticClient(threading.Thread):
+    """SyntheticClient
+
+        Thread replaying a random command mix at a fixed rate through an AsyncClient.
+    """
+    def __init__(self, port, rate, mix, duration, timeout, seed, latency, transport=TRANSPORT_TCP):
+        """Constructor
+
+        :param port: car's port
+        :param rate: commands per second
+        :param mix: command kinds and their cumulative weights, as returned by parse_mix
+        :param duration: seconds of load
+        :param timeout: seconds after which a command without response counts as dropped
+        :param seed: random seed
+        :param latency: recorder of the send to response latencies
+        :type latency: LatencyRecorder
+        :param transport: car's transport name
+        """
+        threading.Thread.__init__(self, daemon=True)
+        self.port = port
+        self.transport = transport
+        self.period = 1. / rate
+        self.kinds, self.cumulative_weights = mix
+        self.duration = duration
+        self.timeout = timeout
+        self.rng = random.Random(seed)
+
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.delivered = 0
+        self.errors = 0
+        self.dropped = 0
+        self.late_sends = 0
+
+    def __connect__(self):
+        """__connect__
+
+        :return: connected client
+        :rtype: AsyncClient
+        """
+        for _ in range(CONNECT_RETRIES):
+            client = AsyncClient('localhost', self.port, default_timeout=self.timeout,
+                                 transport=get_transport(self.transport))
+            try:
+                client.connect_to_host()
+                return client
+            except OSError:
+                sleep(CONNECT_RETRY_DELAY)
+        raise ConnectionError('Client', 'Could not connect to the car!')
+
+    def __on_response__(self, sent_at):
+        """__on_response__
+
+        :param sent_at: monotonic time the command was sent at
+        :return: future's done callback
+        """
+        def on_response(future):
+            try:
+                response = future.result()
+            except Exception:
+                with self.lock:
+                    self.dropped += 1
+                return
+            self.latency.record(monotonic() - sent_at)
+            with self.lock:
+                if response == RESPONSE_ERROR.encode(ENCODING):
+                    self.errors += 1
+                else:
+                    self.delivered += 1
+        return on_response
+
+    def run(self):
+        """run
+
+        :return: None
+        """
+        client = self.__connect__()
+        total_weight = self.cumulative_weights[-1]
+
+        futures = []
+        start = monotonic()
+        tick = 0
+        while monotonic() - start < self.duration:
+            kind = self.kinds[bisect.bisect(self.cumulative_weights, self.rng.random() * total_weight)]
+            package = build_command(kind, self.rng)
+
+            sent_at = monotonic()
+            if isinstance(package, list):
+                future = client.send_batch_async(package, timestamp=sent_at)
+            else:
+                future = client.send_package_async(package, timestamp=sent_at)
+            future.add_done_callback(self.__on_response__(sent_at))
+            futures.append(future)
+            self.sent += 1
+
+            tick += 1
+            delay = start + tick * self.period - monotonic()
+            if delay > 0:
+                sleep(delay)
+            elif -delay > self.period:
+                self.late_sends += 1
+
+        for future in futures:
+            try:
+                future.result()
+            except Exception:
+                pass
+        client.close()
+
+
+def run(clients, rate, mix, duration, port, timeout, log_level, transport=TRANSPORT_TCP):
+    """run
+
+        Run the load and print the report.
+    :return: None
+    """
+    mix = parse_mix(mix)
+
+    ready = multiprocessing.Event()
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    car = multiprocessing.Process(target=run_car,
+                                  args=(port, clients, log_level, ready, stop, results, transport))
+    car.start()
+    ready.wait()
+
+    monitor = ProcessMonitor(car.pid)
+    cpu_start = monitor.cpu_time()
+    wall_start = monotonic()
+
+    round_trip = LatencyRecorder()
+    synthetic_clients = [SyntheticClient(port, rate, mix, duration, timeout, seed, round_trip, transport)
+                         for seed in range(clients)]
+    for synthetic_client in synthetic_clients:
+        synthetic_client.start()
+    for synthetic_client in synthetic_clients:
+        synthetic_client.join()
+
+    wall_time = monotonic() - wall_start
+    cpu_end = monitor.cpu_time()
+    rss, peak_rss = monitor.memory()
+
+    stop.set()
+    car_results = results.get()
+    car.join()
+
+    sent = sum(c.sent for c in synthetic_clients)
+    delivered = sum(c.delivered for c in synthetic_clients)
+    errors = sum(c.errors for c in synthetic_clients)
+    dropped = sum(c.dropped for c in synthetic_clients)
+    late_sends = sum(c.late_sends for c in synthetic_clients)
+
+    print("clients: {} ({})  target: {:.0f} cmd/s  offered: {:.0f} cmd/s  duration: {:.1f}s".format(
+        clients, transport, clients * rate, sent / duration, duration))
+    print("delivered: {:.0f} cmd/s ({} commands)  errors: {}  drops: {}  late sends: {}".format(
+        delivered / wall_time, delivered, errors, dropped, late_sends))
+    print("car: {} commands served, {} serial commands, {} SPI transactions".format(
+        car_results['served'], car_results['serial_commands'], car_results['spi_transactions']))
+    spi_worker = car_results['spi_worker']
+    print("SPI worker: {} frames in {} batches (avg {:.2f}, max {})  dropped: {}  max queue depth: {}".format(
+        spi_worker['frames_sent'], spi_worker['batches'], spi_worker['average_batch_size'],
+        spi_worker['max_batch_size'], spi_worker['frames_dropped'], spi_worker['max_queue_depth']))
+    status_poller = car_results['status_poller']
+    print("SPI status: {} polls  {} changes  errors: {}".format(
+        status_poller['polls'], status_poller['changes'], status_poller['errors']))
+    control_loop = car_results['control_loop']
+    print("control loop: {:.0f} Hz  {} setpoints  {} writes  deadline misses: {}  jitter: {}".format(
+        control_loop['frequency'], control_loop['setpoints'], control_loop['writes'],
+        control_loop['deadline_misses'], format_latency_summary(control_loop['jitter'])))
+    print("send -> response: {}".format(format_latency_summary(round_trip.summary())))
+    for stage in ('command', 'network', 'decode', 'write', 'spi', 'spi_queue', 'spi_status', 'control_jitter'):
+        print("car {:>14}: {}".format(stage, format_latency_summary(car_results['latency'][stage])))
+    if cpu_start is not None and cpu_end is not None:
+        print("car process: CPU {:.0f}%  RSS {:.1f} MB  peak RSS {:.1f} MB".format(
+            100. * (cpu_end - cpu_start) / wall_time, (rss or 0) / 1024., (peak_rss or 0) / 1024.))
+    else:
+        print("car process: CPU and memory usage unavailable")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BFMC full-stack load generator')
+    parser.add_argument('--clients', type=int, default=1, help='number of synthetic clients')
+    parser.add_argument('--rate', type=float, default=50., help='commands per second, per client')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='command kinds and weights (move, brake, lights, parking, batch)')
+    parser.add_argument('--duration', type=float, default=10., help='seconds of load')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT + DEFAULT_PORT_OFFSET)
+    parser.add_argument('--transport', default=TRANSPORT_TCP, choices=[TRANSPORT_TCP, TRANSPORT_UNIX],
+                        help="car's transport; the car runs in its own process, so it cannot be in-process")
+    parser.add_argument('--timeout', type=float, default=5., help='seconds after which a command is dropped')
+    parser.add_argument('--log-level', default='WARNING', help="car's log level, INFO includes logging costs")
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.WARNING)
+    run(args.clients, args.rate, args.mix, args.duration, args.port, args.timeout, args.log_level, args.transport)
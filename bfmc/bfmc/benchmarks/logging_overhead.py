@@ -0,0 +1,109 @@
+"""Logging overhead benchmark
+
+    Time the per-command logging of a move, as decode_command does it, with the file and console handlers
+written synchronously by the calling thread, behind the asynchronous rate-limited queue, and with the
+level disabled, formatting eagerly or behind an isEnabledFor check. The console is /dev/null.
+
+    python -m bfmc.benchmarks.logging_overhead --commands 20000
+"""
+import argparse
+import logging
+import os
+import tempfile
+
+from time import perf_counter
+
+from bfmc.utils.log_utils import start_async_logging
+
+
+def build_logger(name, log_file, console):
+    """build_logger
+
+        Logger set up the way bfmc's is: message only, to a file at INFO and to the console.
+    :return: logger
+    :rtype: logging.Logger
+    """
+    logger = logging.getLogger('bfmc_benchmark.{}'.format(name))
+    logger.propagate = False
+    formatter = logging.Formatter('%(message)s')
+    file_output = logging.FileHandler(log_file)
+    file_output.setFormatter(formatter)
+    file_output.setLevel(logging.INFO)
+    logger.addHandler(file_output)
+    console_output = logging.StreamHandler(console)
+    console_output.setFormatter(formatter)
+    logger.addHandler(console_output)
+    logger.setLevel(logging.DEBUG)
+    return logger
+
+
+def log_eagerly(logger, power, steering):
+    """log_eagerly
+
+        Call site before: the message is formatted whatever the level.
+    :return: None
+    """
+    logger.info("MOVE({}, {})".format(power, steering))
+
+
+def log_guarded(logger, power, steering):
+    """log_guarded
+
+        Call site after: the message is formatted only if the level is enabled.
+    :return: None
+    """
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("MOVE({}, {})".format(power, steering))
+
+
+def time_commands(logger, log, commands):
+    """time_commands
+
+    :return: seconds per command spent in the calling thread
+    :rtype: float
+    """
+    start = perf_counter()
+    for index in range(commands):
+        log(logger, float(index % 151 - 75), float(index % 55 - 27))
+    return (perf_counter() - start) / commands
+
+
+def run(commands):
+    """run
+
+    :param commands: commands logged per case
+    :return: None
+    """
+    directory = tempfile.mkdtemp(prefix='bfmc_logging_')
+    console = open(os.devnull, 'w')
+
+    cases = []
+    logger = build_logger('sync', os.path.join(directory, 'sync.txt'), console)
+    cases.append(('synchronous, eager', time_commands(logger, log_eagerly, commands), None))
+
+    logger = build_logger('async', os.path.join(directory, 'async.txt'), console)
+    listener = start_async_logging(logger)
+    per_command = time_commands(logger, log_guarded, commands)
+    drain_start = perf_counter()
+    listener.stop()
+    cases.append(('async, rate limited', per_command, perf_counter() - drain_start))
+
+    logger = build_logger('disabled', os.path.join(directory, 'disabled.txt'), console)
+    logger.setLevel(logging.WARNING)
+    cases.append(('disabled, eager', time_commands(logger, log_eagerly, commands), None))
+    cases.append(('disabled, guarded', time_commands(logger, log_guarded, commands), None))
+
+    for name, per_command, drain in cases:
+        line = "{:>20}: {:7.2f} us per command".format(name, per_command * 1e6)
+        if drain is not None:
+            line += "  (listener drained in {:.1f} ms)".format(drain * 1e3)
+        print(line)
+    console.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Per-command logging overhead benchmark')
+    parser.add_argument('--commands', type=int, default=20000, help='commands logged per case')
+    args = parser.parse_args()
+
+    run(args.commands)
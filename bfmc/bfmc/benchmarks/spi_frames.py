@@ -0,0 +1,42 @@
+"""SPI frame benchmark
+
+    Time the SPI frame builder: cached commands (lights, turn signals), uncached standard frames and
+extended frames built from a list or from bytes.
+
+    python -m bfmc.benchmarks.spi_frames --repeat 100000
+"""
+import argparse
+import timeit
+
+from bfmc.utils.spi import SPI_CMD_LIGHTS, build_spi_command, build_spi_frame
+
+EXTENDED_DATA_BYTES = 1000
+
+CASES = [
+    ('lights, cached', lambda: build_spi_command(SPI_CMD_LIGHTS, [2])),
+    ('lights, uncached', lambda: build_spi_frame(SPI_CMD_LIGHTS, [2])),
+    ('7 bytes, uncached', lambda: build_spi_command(1, [1, 2, 3, 4, 5, 6, 7])),
+    ('{} bytes from list'.format(EXTENDED_DATA_BYTES),
+     lambda data=list(range(256)) * 4: build_spi_command(2, data[:EXTENDED_DATA_BYTES])),
+    ('{} bytes from bytes'.format(EXTENDED_DATA_BYTES),
+     lambda data=bytes(range(256)) * 4: build_spi_command(2, memoryview(data)[:EXTENDED_DATA_BYTES])),
+]
+
+
+def run(repeat):
+    """run
+
+    :param repeat: builds per case
+    :return: None
+    """
+    for name, build in CASES:
+        best = min(timeit.repeat(build, number=repeat, repeat=3))
+        print("{:>22}: {:8.3f} us per frame".format(name, best / repeat * 1e6))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SPI frame builder benchmark')
+    parser.add_argument('--repeat', type=int, default=100000, help='builds per case')
+    args = parser.parse_args()
+
+    run(args.repeat)
@@ -0,0 +1,68 @@
+"""SPI throughput benchmark
+
+    Push bursts of frames to the emulated driver board, at the board's clock speed, once written inline one
+transaction per frame and once through the batching SPI worker, and compare the transactions and the
+frames per second.
+
+    python -m bfmc.benchmarks.spi_throughput --frames 5000 --burst 8
+"""
+import argparse
+import logging
+
+from time import monotonic, sleep
+
+from bfmc.utils.driver.core import BFMCDriverBoardSTM
+from bfmc.utils.emulator import SpiEmulator
+from bfmc.utils.spi import SPI_CMD_QUERY, SUPERSEDABLE_SPI_COMMANDS, build_spi_command
+from bfmc.utils.spi_worker import SpiWorker
+
+# commands of a burst, none superseding another
+BURST_COMMANDS = [cmd_id for cmd_id in range(2, 32) if cmd_id not in SUPERSEDABLE_SPI_COMMANDS]
+
+
+def run(mode, frames, burst, burst_period):
+    """run
+
+    :param mode: inline or worker
+    :return: None
+    """
+    spi = SpiEmulator()
+    driver = BFMCDriverBoardSTM(spi=spi)
+    worker = SpiWorker(driver)
+    if mode == 'worker':
+        worker.start()
+        send = worker.submit
+    else:
+        send = driver.send_spi_data
+
+    burst_frames = [build_spi_command(BURST_COMMANDS[index % len(BURST_COMMANDS)], [index % 256])
+                    for index in range(burst)]
+    start = monotonic()
+    for sent in range(0, frames, burst):
+        for frame in burst_frames[:frames - sent]:
+            send(frame)
+        if burst_period:
+            sleep(burst_period)
+    if mode == 'worker':
+        worker.stop()
+    wall_time = monotonic() - start
+
+    frames_written = spi.frames
+    transactions = spi.transactions
+    status = driver.query_spi_data(build_spi_command(SPI_CMD_QUERY, [0]), response_size=1)
+    print("{:>6}: {:6d} frames in {:6d} transactions (avg {:5.2f})  {:8.0f} frames/s  bus busy {:5.1f}%  "
+          "status {}".format(mode, frames_written, transactions, frames_written / float(transactions),
+                             frames_written / wall_time, 100. * spi.busy_time / wall_time, status))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='SPI throughput benchmark')
+    parser.add_argument('--frames', type=int, default=5000)
+    parser.add_argument('--burst', type=int, default=8, help='frames sent back to back')
+    parser.add_argument('--burst-period', type=float, default=.001, help='seconds between two bursts')
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.ERROR)
+
+    run('inline', args.frames, args.burst, args.burst_period)
+    run('worker', args.frames, args.burst, args.burst_period)
@@ -0,0 +1,96 @@
+"""Transport benchmark
+
+    Send commands through Host and AsyncClient over each transport, one request at a time and pipelined,
+and compare the round trips per second and their latency.
+
+    python -m bfmc.benchmarks.transports --commands 5000 --window 32
+"""
+import argparse
+import logging
+import threading
+
+from collections import deque
+from time import monotonic
+
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import *
+from bfmc.utils.host import Host
+from bfmc.utils.stats import LatencyRecorder, format_latency_summary
+from bfmc.utils.transport import TRANSPORTS, get_transport
+
+
+def serve(host):
+    """serve
+
+        Car without hardware: decode every command and answer it right away.
+    :return: None
+    """
+    host.connect_with_client()
+    while True:
+        frame = host.get_frame()
+        if frame is None:
+            return
+        payload_to_string(frame.payload)
+        if frame.request_id != NO_REQUEST_ID:
+            host.send_response(frame.request_id, RESPONSE_OK)
+
+
+def drive(client, commands, window):
+    """drive
+
+        Send the commands, keeping up to window of them in flight.
+    :return: commands per second, latency recorder
+    """
+    latency = LatencyRecorder(window=commands)
+    in_flight = deque()
+
+    start = monotonic()
+    for index in range(commands):
+        if len(in_flight) >= window:
+            sent_at, future = in_flight.popleft()
+            future.result()
+            latency.record(monotonic() - sent_at)
+        in_flight.append((monotonic(), client.send_package_async("$i10$d{} {}".format(index % 75, index % 27))))
+    while in_flight:
+        sent_at, future = in_flight.popleft()
+        future.result()
+        latency.record(monotonic() - sent_at)
+
+    return commands / (monotonic() - start), latency
+
+
+def run(transport_name, port, commands, window):
+    """run
+
+    :return: None
+    """
+    host = Host('localhost', port, transport=get_transport(transport_name))
+    if not host.start_server():
+        return
+    server_thread = threading.Thread(target=serve, args=(host,), daemon=True)
+    server_thread.start()
+
+    client = AsyncClient('localhost', port, default_timeout=10., transport=get_transport(transport_name))
+    client.connect_to_host()
+
+    for current_window in (1, window):
+        rate, latency = drive(client, commands, current_window)
+        print("{:>9} window {:3d}: {:8.0f} cmd/s  {}".format(
+            transport_name, current_window, rate, format_latency_summary(latency.summary())))
+
+    client.close()
+    server_thread.join()
+    host.stop_server()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Host/Client transport benchmark')
+    parser.add_argument('--port', type=int, default=18890)
+    parser.add_argument('--commands', type=int, default=5000, help='commands per transport and window')
+    parser.add_argument('--window', type=int, default=32, help='commands in flight when pipelined')
+    args = parser.parse_args()
+
+    logging.getLogger('bfmc').setLevel(logging.ERROR)
+
+    for port_offset, name in enumerate(sorted(TRANSPORTS)):
+        run(name, args.port + port_offset, args.commands, args.window)
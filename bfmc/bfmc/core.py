@@ -1,19 +1,53 @@
+import json
+import logging
 import threading
 
-from time import sleep
+from time import monotonic, sleep
 
+from bfmc import app_data_path
+from bfmc.utils.bring_up import BringUp
 from bfmc.utils.connection_utils import *
+from bfmc.utils.control_loop import CONTROL_LOOP_FREQUENCY, ControlLoop
 from bfmc.utils.host import Host
+from bfmc.utils.maneuvers import MANEUVER_PARKING, ManeuverEngine
+from bfmc.utils.odometry import Odometry, new_odometry_log_path
 
 from bfmc.utils.serial_handler import SerialHandler
 from bfmc.utils.save_encoder import SaveEncoder
+from bfmc.utils.session_log import RecordingSerial, RecordingSpi, SessionRecorder
+from bfmc.utils.spi import get_spi_passthrough_data
+from bfmc.utils.spi_worker import SpiWorker
+from bfmc.utils.stats import LatencyRecorder
 
-from bfmc.utils.driver.core import BFMCDriverBoardSTM
+from bfmc.utils.driver.core import BFMCDriverBoardSTM, open_spi_device
+from bfmc.utils.driver.patterns import LightPatternEngine
+from bfmc.utils.driver.status import SpiStatusPoller
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
 
-CRUISE_SPEED = 0.2
+CRUISE_SPEED = 0.2  # m/s, as every speed sent to the Nucleo and read back from the encoder
+
+BRAKE_SETPOINT = 'brake'
+
+BRING_UP_ACK_TIMEOUT = .2  # seconds the Nucleo has to acknowledge a bring-up command, before it is resent
+BRING_UP_ACK_ATTEMPTS = 5  # the Nucleo has 1 s in all, as before the bring-up was concurrent
+
+
+def map_power(power):
+    """map_power
+
+        Map the RC's power to the cruise speed, keeping its direction.
+    :param power: power requested by the RC
+    :type power: float
+    :return: speed to be sent to the Nucleo
+    :rtype: float
+    """
+    if power > 0:
+        return CRUISE_SPEED
+    elif power < 0:
+        return -CRUISE_SPEED
+    return 0
 
 
 class BFMC:
@@ -22,54 +56,221 @@ class BFMC:
         Class used to handle BFMC remote controlled device.
     """
 
-    def __init__(self, ip=None, port=DEFAULT_PORT):
+    def __init__(self, ip=None, port=DEFAULT_PORT, max_clients=ALLOWED_CONNECTIONS, serial_connection=None, spi=None,
+                 transport=None, control_frequency=CONTROL_LOOP_FREQUENCY, session_log=None, serve=True,
+                 wait_ready=True, concurrent_bring_up=True, odometry_log=False, watch_driver_status=False):
         """Constructor
+
+        :param ip: server's IP address
+        :param port: server's port
+        :param max_clients: maximum number of clients connected at once
+        :param serial_connection: serial connection to the Nucleo (e.g. an emulator), /dev/ttyACM0 if None
+        :param spi: SPI device of the driver board (e.g. an emulator), spidev's SpiDev if None
+        :param transport: clients' transport (see bfmc.utils.transport), TCP if None
+        :param control_frequency: frequency the Nucleo is driven at, in Hz
+        :param session_log: file every frame, command, serial line and SPI transfer is recorded to (see
+        bfmc.utils.session_log), not recorded if None
+        :param serve: start the server during the bring-up, clients can connect while the hardware comes up
+        :param wait_ready: return once every bring-up step finished, raising if a step needed to drive failed;
+        return at once if False, clients being accepted once the car is ready to drive (see bring_up)
+        :param concurrent_bring_up: run the independent bring-up steps at once, one after another if False
+        :param odometry_log: log every odometry sample to a new file in the logs folder (see
+        bfmc.utils.odometry.load_odometry_log), closed by shutdown
+        :param watch_driver_status: poll the driver board's register SPI_STATUS_REGISTER in background and log its
+        changes (see bfmc.utils.driver.status)
         """
         LOGGER.debug("Initializing BFMC...")
         self.lights_on = False
         print("ip: {}".format(ip))
         self.__ip__ = ip
         self.__port__ = port
-        self.connection = Host(ip=self.__ip__, port=self.__port__)
+        self.__max_clients__ = max_clients
+        self.__transport__ = transport
+        self.connection = Host(ip=self.__ip__, port=self.__port__, max_clients=self.__max_clients__,
+                               transport=self.__transport__)
 
         self.__listening__ = False
 
-        self.driver = BFMCDriverBoardSTM()
+        # latency of the commands sent with a timestamp, from their creation (e.g. joystick sample) to hardware
+        # write, and its stages: network up to the host, queueing and decoding, serial or SPI write
+        self.command_latency = LatencyRecorder()
+        self.network_latency = LatencyRecorder()
+        self.decode_latency = LatencyRecorder()
+        self.write_latency = LatencyRecorder()
+
+        self.session = SessionRecorder(session_log) if session_log is not None else None
+        self.__spi__ = spi
+        self.__serial_connection__ = serial_connection
+        self.__control_frequency__ = control_frequency
+        self.__odometry_log__ = odometry_log
+        self.__watch_driver_status__ = watch_driver_status
+        # the server is started by its bring-up step or by listen, whichever comes first
+        self.__server_lock__ = threading.Lock()
+
+        # driver board, brought up by the 'spi' step: its threads are started once, whatever the attempts
+        self.driver = None
+        self.spi_worker = None
+        self.light_patterns = None
+        self.status_poller = None
+
+        # waiters' events, set by every MCTL/BRAK (ev1) and ENPB (ev2) answer and never cleared by the read thread:
+        # only a wait following its own clear() (as the bring-up's) is a handshake. Commands are not waited for,
+        # the control loop rewrites its setpoint at a fixed rate.
+        self.ev1 = threading.Event()
+        self.ev2 = threading.Event()
+        self.__last_move__ = None
+
+        # hardware and server come up as a dependency graph: independent steps overlap, failing ones are retried
+        self.bring_up = BringUp(concurrent=concurrent_bring_up)
+        if serve:
+            self.bring_up.add('server', self.__start_server__, required=False)
+        # lights and status only: SPI commands are answered with an error until the driver board is up
+        self.bring_up.add('spi', self.__start_driver_board__, required=False)
+        self.bring_up.add('serial', self.__open_serial__)
+        self.bring_up.add('files', self.__open_files__)
+        self.bring_up.add('pid', self.__activate_pid__, requires=('serial',), attempts=BRING_UP_ACK_ATTEMPTS,
+                          retry_delay=0.)
+        self.bring_up.add('waiters', self.__add_waiters__, requires=('serial', 'files'), attempts=1)
+        # odometry only: the car drives without the encoder's values
+        self.bring_up.add('encoder_publisher', self.__activate_encoder_publisher__, requires=('waiters',),
+                          attempts=BRING_UP_ACK_ATTEMPTS, retry_delay=0., required=False)
+        # driving needs the Nucleo only, the driver board (lights, status) may come up later
+        self.bring_up.add('control', self.__start_control__, requires=('pid', 'waiters'), attempts=1)
+        self.bring_up.start()
+
+        if wait_ready:
+            self.bring_up.wait()
+            LOGGER.debug("BFMC initialized!")
+
+    def __start_server__(self):
+        """__start_server__
+
+            Bring-up step: start the server, clients connecting are queued until listening. Does nothing if
+        the server is on already.
+        :return: None
+        """
+        with self.__server_lock__:
+            if not self.connection.server_is_on and not self.connection.start_server():
+                raise ConnectionError('Server', "Failed to start Crawler's server!")
+
+    def __start_driver_board__(self):
+        """__start_driver_board__
+
+            Bring-up step: open the driver board's SPI device and start its worker and status poller. A retry
+        only redoes what failed.
+        :return: None
+        """
+        if self.driver is None:
+            spi = self.__spi__
+            if self.session is not None:
+                spi = RecordingSpi(spi if spi is not None else open_spi_device(), self.session)
+            self.driver = BFMCDriverBoardSTM(spi=spi)
+
+        if self.spi_worker is None:
+            # SPI transactions happen on the worker, off the network thread
+            spi_worker = SpiWorker(self.driver, sent_callback=self.__on_spi_sent__)
+            spi_worker.start()
+            self.spi_worker = spi_worker
+        # light sequences (e.g. startup blink) are timed on the car, started by a single command
+        if self.light_patterns is None:
+            self.light_patterns = LightPatternEngine(self.spi_worker.submit)
+        # queries are polled in background once read: status requests are answered from the poller's snapshot
+        if self.status_poller is None:
+            status_poller = SpiStatusPoller(self.spi_worker)
+            if self.__watch_driver_status__:
+                status_poller.watch_register()
+            status_poller.subscribe(self.__on_driver_status__)
+            status_poller.start()
+            self.status_poller = status_poller
+
+    def __driver_board_ready__(self):
+        """__driver_board_ready__
+
+        :return: True once the driver board is brought up, SPI commands are rejected until then
+        :rtype: bool
+        """
+        return self.bring_up.wait_for('spi', 0)
+
+    def __open_serial__(self):
+        """__open_serial__
 
-        self.serial_handler = SerialHandler()
+            Bring-up step: open the Nucleo's serial port and start reading it.
+        :return: None
+        """
+        self.serial_handler = SerialHandler(f_serialCon=self.__serial_connection__)
+        if self.session is not None:
+            recording_connection = RecordingSerial(self.serial_handler.serialCon, self.session)
+            self.serial_handler.serialCon = self.serial_handler.readThread.serialCon = recording_connection
         self.serial_handler.startReadThread()
 
+    def __open_files__(self):
+        """__open_files__
+
+            Bring-up step: open the encoder's file and the odometry.
+        :return: None
+        """
         self.e = SaveEncoder("Encoder.csv")
         self.e.open()
+        # pose dead-reckoned from the encoder and the steering written by the control loop
+        self.odometer = Odometry(log_path=new_odometry_log_path(app_data_path) if self.__odometry_log__ else None)
 
-        self.ev1 = threading.Event()
-        self.ev2 = threading.Event()
+    def __activate_pid__(self):
+        """__activate_pid__
 
+            Bring-up step: activate the Nucleo's PID, resent if not acknowledged in time (the board may
+        still be resetting after the port was opened).
+        :return: None
+        """
         LOGGER.info('Activating PID')
-        self.serial_handler.readThread.addWaiter("PIDA", self.ev1, print)
-        sent = self.serial_handler.sendPidActivation(True)
-        if sent:
-            confirmed = self.ev1.wait(timeout=1.0)
-            if confirmed:
-                print("Response was received!")
-            else:
+        confirmed = threading.Event()
+        self.serial_handler.readThread.addWaiter("PIDA", confirmed, print)
+        try:
+            if not self.serial_handler.sendPidActivation(True):
+                raise ConnectionError('Response', 'Sending problem!')
+            if not confirmed.wait(timeout=BRING_UP_ACK_TIMEOUT):
                 raise ConnectionError('Response', 'Response was not received!')
-        else:
-            print("Sending problem")
-            self.serial_handler.readThread.deleteWaiter("PIDA", self.ev1)
+        finally:
+            self.serial_handler.readThread.deleteWaiter("PIDA", confirmed)
+        print("Response was received!")
 
+    def __add_waiters__(self):
+        """__add_waiters__
+
+            Bring-up step: save the Nucleo's acknowledgements and the encoder's values, feed the odometry.
+        :return: None
+        """
         self.serial_handler.readThread.addWaiter("MCTL", self.ev1, self.e.save)
         self.serial_handler.readThread.addWaiter("BRAK", self.ev1, self.e.save)
         self.serial_handler.readThread.addWaiter("ENPB", self.ev2, self.e.save)
+        self.serial_handler.readThread.addWaiter("ENPB", self.ev2, self.odometer.on_message)
+
+    def __activate_encoder_publisher__(self):
+        """__activate_encoder_publisher__
 
-        sent = self.serial_handler.sendEncoderPublisher()
-        if sent:
-            confirmed = self.ev1.wait(timeout=1.0)
-            if confirmed:
-                print("Deactivate encoder was confirmed!")
-        else:
+            Bring-up step: activate the encoder's publisher, resent if neither acknowledged nor publishing in
+        time.
+        :return: None
+        """
+        self.ev2.clear()
+        if not self.serial_handler.sendEncoderPublisher():
+            raise ConnectionError('Response', 'Sending problem!')
+        if not self.ev2.wait(timeout=BRING_UP_ACK_TIMEOUT):
             raise ConnectionError('Response', 'Response was not received!')
-        LOGGER.debug("BFMC initialized!")
+        print("Encoder publisher was confirmed!")
+
+    def __start_control__(self):
+        """__start_control__
+
+            Bring-up step: start driving the Nucleo, the car is ready to drive.
+        :return: None
+        """
+        # moves and brakes only update the setpoint, the loop drives the Nucleo at a fixed rate
+        self.control_loop = ControlLoop(self.serial_handler, self.__map_power__, frequency=self.__control_frequency__,
+                                        sent_callback=self.__on_setpoint_sent__,
+                                        output_callback=self.odometer.on_output)
+        self.control_loop.start()
+        # parking and other scripted moves run in background, preempted by the RC's commands
+        self.maneuvers = ManeuverEngine(self.control_loop, self.odometer.get_distance)
 
     def connect_with_client(self):
         """connect_with_client
@@ -100,32 +301,36 @@ class BFMC:
             Listen to incoming ethernet packages and execute commands thread.
         :return: None
         """
-        if not self.connection.server_is_on:
-            self.connection.start_server()
+        try:
+            self.__start_server__()
+        except ConnectionError as err:
+            LOGGER.error(err)
+            return
+
+        # clients connect while the hardware comes up and are accepted once the car is ready to drive: the
+        # driver board (lights, status) may come up later
+        if not self.bring_up.wait_for('control'):
+            LOGGER.error("Car is not ready to drive, not listening!")
+            return
 
         if self.connection.__client__ is None:
             self.connection.connect_with_client()
+            if self.connection.max_clients > 1:
+                self.connection.accept_clients()
 
         self.connection.listening = True
 
         try:
             while self.connection.listening:
-                    incoming_package = self.connection.__get_package_from_client__()
-                    # LOGGER.info(incoming_package)
-                    decoded_package = incoming_package.decode('utf-8')
-                    # LOGGER.info("{}".format(decoded_package))
-
-                    if 'stop_listening' in decoded_package:
-                        self.connection.stop_listening()
-                        self.connection.stop_server()
-                        sleep(1)
-                        self.connection = Host(ip=self.__ip__, port=self.__port__)
-                        sleep(1)
-                        self.listen()
-
-                    if '$i' in decoded_package:
-                        if '$d' in decoded_package:
-                            self.decode_command(decoded_package)
+                    incoming_frame = self.connection.get_frame()
+                    if incoming_frame is None:
+                        raise ConnectionError('Client', 'Connection closed by client!')
+                    # LOGGER.info(incoming_frame)
+                    response = self.handle_frame(incoming_frame)
+                    if incoming_frame.request_id != NO_REQUEST_ID:
+                        self.connection.send_response(incoming_frame.request_id, response)
+                        if self.session is not None:
+                            self.session.record_response(incoming_frame.request_id, response)
         except Exception as err:
             error = 'Error occurred while listening! {}'.format(err)
             LOGGER.error(error)
@@ -134,132 +339,404 @@ class BFMC:
             LOGGER.info('Listening interrupted by user!')
             return
 
-    def decode_command(self, package):
+    def handle_frame(self, frame):
+        """handle_frame
+
+            Handle a frame received from client.
+        :param frame: frame received from client
+        :type frame: Frame
+        :return: response for the client
+        :rtype: str
+        """
+        if self.session is not None:
+            self.session.record_frame(frame, self.connection.current_frame_received_at)
+
+        if frame.kind == FRAME_KIND_BATCH:
+            try:
+                packages = unpack_batch(frame.payload)
+            except Exception as err:
+                LOGGER.info(err)
+                return RESPONSE_ERROR
+            if self.session is not None:
+                for package in packages:
+                    self.session.record_package(package)
+            return self.decode_batch(packages, frame.timestamp)
+
+        spi_data = get_spi_passthrough_data(frame.payload)
+        if spi_data is not None:
+            if self.session is not None:
+                self.session.record_package(spi_data)
+            return self.pass_spi_data_through(spi_data, frame.timestamp)
+
+        try:
+            package = payload_to_string(frame.payload)
+        except Exception as err:
+            LOGGER.info(err)
+            return RESPONSE_ERROR
+        if self.session is not None:
+            self.session.record_package(package)
+        return self.__decode_package__(package, frame.timestamp)
+
+    def __decode_package__(self, decoded_package, timestamp):
+        """__decode_package__
+
+            Handle a single package received from client.
+        :param decoded_package: package received from client
+        :type decoded_package: str
+        :param timestamp: package's creation time on the car's clock, if any
+        :return: response for the client
+        :rtype: str
+        """
+        # LOGGER.info("{}".format(decoded_package))
+
+        if 'stop_listening' in decoded_package:
+            self.connection.stop_listening()
+            self.connection.stop_server()
+            sleep(1)
+            self.connection = Host(ip=self.__ip__, port=self.__port__, max_clients=self.__max_clients__,
+                                   transport=self.__transport__)
+            sleep(1)
+            self.listen()
+
+        response = RESPONSE_ERROR
+        if '$i' in decoded_package:
+            if '$d' in decoded_package:
+                response = self.decode_command(decoded_package, timestamp)
+        return response
+
+    def decode_command(self, package, timestamp=None):
         """decode_command
             Transform UDP data to Crawler command.
         :param package: package received from client
         :type package: str
-        :return:
+        :param timestamp: package's creation time on the car's clock, if any
+        :type timestamp: float
+        :return: response for the client
+        :rtype: str
         """
         cmd_id = package[package.find("$i") + 2:package.find("$d")]
         data = package[package.find("$d") + 2:]
 
+        response = RESPONSE_OK
+
         try:
             cmd_id = int(cmd_id)
             if cmd_id == 13:
-                sent = self.serial_handler.sendBrake(0.0)
-                if sent:
-                    confirmed = self.ev1.wait(timeout=1.0)
-                    if confirmed:
-                        LOGGER.info("Braking was confirmed!")
-                    else:
-                        LOGGER.error('Response', 'Response was not received!')
-                else:
-                    LOGGER.info("Sending problem")
+                LOGGER.info("BRAKE")
+                self.__set_brake__(timestamp, self.connection.current_frame_received_at)
             elif cmd_id == 10:
                 power = float(data.split()[0])
-
-                if power > 0:
-                    power = CRUISE_SPEED
-                elif power < 0:
-                    power = -CRUISE_SPEED
-                else:
-                    power = 0
-
                 steering = float(data.split()[1])
-                LOGGER.info("MOVE({}, {})".format(power, steering))
+                if LOGGER.isEnabledFor(logging.INFO):
+                    LOGGER.info("MOVE({}, {})".format(power, steering))
+                self.__set_move__(power, steering, timestamp, self.connection.current_frame_received_at)
+            elif cmd_id == 11:
+                # named maneuver, the legacy package ($i11$d0) parks
+                name = data.strip()
+                self.maneuvers.start(name if name in self.maneuvers.maneuvers else MANEUVER_PARKING)
 
-                sent = self.serial_handler.sendMove(power, steering)
-                if sent:
-                    confirmed = self.ev1.wait(timeout=3.0)
-                    if not confirmed:
-                        LOGGER.info("Error getting confirmation via USART")
-                else:
-                    LOGGER.info("Error sending command via USART")
-            elif cmd_id == 50:
-                spi_data = []
-                for char in data:
-                    spi_data.append(ord(char))
-                LOGGER.info('Sending SPI data: {}'.format(spi_data))
-                self.driver.send_spi_data(spi_data)
+            elif cmd_id == 14:
+                if not self.__driver_board_ready__():
+                    raise ConnectionError('SPI', 'Driver board is not ready!')
+                pattern = data.split()
+                self.light_patterns.play(pattern[0], *[float(parameter) for parameter in pattern[1:]])
 
-            elif cmd_id == 11:
-                self.parking_maneuver()
+            elif cmd_id == 2:
+                response = json.dumps(self.get_latency_report())
 
             elif cmd_id == 1:
-                spi_data = []
-                for char in data:
-                    spi_data.append(ord(char))
-                LOGGER.info('CMD1: Sending SPI data: {}'.format(spi_data))
-                self.driver.send_spi_data(spi_data)
-                sleep(.001)
-                LOGGER.info('Expecting SPI data...')
-                received_data = self.driver.get_spi_data(buffer_size=1)
-                LOGGER.info('Received SPI data: {}'.format(received_data))
+                if not self.__driver_board_ready__():
+                    raise ConnectionError('SPI', 'Driver board is not ready!')
+                query = data.encode('latin-1')
+                status = self.status_poller.get(query)
+                if status is None:
+                    # not polled yet: read at once, answered from the poller's snapshot from then on
+                    LOGGER.info('CMD1: Sending SPI query: {}'.format(list(query)))
+                    status = self.status_poller.read(query)
+                response = ' '.join(str(byte) for byte in status.value)
 
         except Exception as err:
             LOGGER.info(err)
-            pass
+            response = RESPONSE_ERROR
 
         # LOGGER.info("CMD_ID: {}".format(cmd_id))
         # LOGGER.info("DATA: {}".format(data))
 
+        return response
+
+    def decode_batch(self, packages, timestamp=None):
+        """decode_batch
+            Apply several commands received in one frame as one unit: the last move or brake becomes the
+        setpoint and the SPI frames are queued together, the other commands follow one by one.
+        :param packages: packages received from client
+        :type packages: list of bytes or str
+        :param timestamp: packages' creation time on the car's clock, if any
+        :type timestamp: float
+        :return: response for the client
+        :rtype: str
+        """
+        setpoint = None
+        spi_data = []
+        other_packages = []
+
+        try:
+            for package in packages:
+                package_spi_data = get_spi_passthrough_data(package)
+                if package_spi_data is not None:
+                    spi_data.append(package_spi_data)
+                    continue
+
+                package = payload_to_string(package)
+                if '$i' not in package or '$d' not in package:
+                    raise ValueError('Invalid package in batch: {}'.format(package))
+                cmd_id = int(package[package.find("$i") + 2:package.find("$d")])
+                data = package[package.find("$d") + 2:]
+
+                if cmd_id == 10:
+                    setpoint = (float(data.split()[0]), float(data.split()[1]))
+                elif cmd_id == 13:
+                    setpoint = BRAKE_SETPOINT
+                else:
+                    other_packages.append(package)
+        except Exception as err:
+            LOGGER.info(err)
+            return RESPONSE_ERROR
+
+        response = RESPONSE_OK
+
+        if setpoint is not None:
+            if LOGGER.isEnabledFor(logging.INFO):
+                LOGGER.info("BATCH({})".format(setpoint))
+            received_at = self.connection.current_frame_received_at
+            if setpoint == BRAKE_SETPOINT:
+                self.__set_brake__(timestamp, received_at)
+            else:
+                self.__set_move__(setpoint[0], setpoint[1], timestamp, received_at)
+
+        if spi_data and not self.__driver_board_ready__():
+            LOGGER.info('Driver board is not ready, {} SPI packages rejected'.format(len(spi_data)))
+            response = RESPONSE_ERROR
+        elif spi_data:
+            context = (timestamp, self.connection.current_frame_received_at)
+            for package_spi_data in spi_data:
+                self.spi_worker.submit(package_spi_data, context=context)
+
+        for package in other_packages:
+            if self.decode_command(package, timestamp) == RESPONSE_ERROR:
+                response = RESPONSE_ERROR
+
+        return response
+
+    def pass_spi_data_through(self, spi_data, timestamp=None):
+        """pass_spi_data_through
+
+            Queue SPI frames received from client for the driver board, without copying them.
+        :param spi_data: one or several concatenated SPI frames
+        :type spi_data: memoryview or bytes
+        :param timestamp: frames' creation time on the car's clock, if any
+        :return: response for the client
+        :rtype: str
+        """
+        if not self.__driver_board_ready__():
+            LOGGER.info('Driver board is not ready, SPI data rejected')
+            return RESPONSE_ERROR
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info('Sending {} bytes of SPI data'.format(len(spi_data)))
+        self.spi_worker.submit(spi_data, context=(timestamp, self.connection.current_frame_received_at))
+        return RESPONSE_OK
+
+    def __set_move__(self, power, steering, timestamp=None, received_at=None):
+        """__set_move__
+
+            Set the RC's move as setpoint. A running maneuver is preempted, unless the move only repeats
+        the last one (the RC's keep-alive).
+        :param power: power requested by the RC
+        :param steering: steering, in degrees
+        :param timestamp: command's creation time on the car's clock, if any
+        :param received_at: time the command was received at, if any
+        :return: None
+        """
+        if self.maneuvers.running:
+            if (power, steering) == self.__last_move__:
+                return
+            self.maneuvers.preempt()
+        self.__last_move__ = (power, steering)
+        self.control_loop.set_move(power, steering, timestamp=timestamp, received_at=received_at)
+
+    def __set_brake__(self, timestamp=None, received_at=None):
+        """__set_brake__
+
+            Brake, preempting any maneuver.
+        :param timestamp: command's creation time on the car's clock, if any
+        :param received_at: time the command was received at, if any
+        :return: None
+        """
+        self.maneuvers.preempt()
+        self.__last_move__ = None
+        self.control_loop.set_brake(timestamp, received_at)
+
+    def __map_power__(self, power):
+        """__map_power__
+
+            Map the RC's power to the cruise speed, keeping its direction.
+        :param power: power requested by the RC
+        :type power: float
+        :return: speed to be sent to the Nucleo
+        :rtype: float
+        """
+        return map_power(power)
+
+    def __record_latency__(self, timestamp, write_started, received_at=None):
+        """__record_latency__
+
+            Record the latency of a command whose hardware write just happened.
+        :param timestamp: command's creation time on the car's clock, None if unknown
+        :param write_started: time the hardware write started at
+        :param received_at: time the command was received at, the current frame's if None
+        :return: None
+        """
+        now = monotonic()
+        self.write_latency.record(now - write_started)
+        if timestamp is None:
+            return
+
+        self.command_latency.record(now - timestamp)
+        if received_at is None:
+            received_at = self.connection.current_frame_received_at
+        if received_at is not None:
+            self.network_latency.record(received_at - timestamp)
+            self.decode_latency.record(write_started - received_at)
+
+    def __on_setpoint_sent__(self, setpoint, write_started):
+        """__on_setpoint_sent__
+
+            Record the latency of a setpoint, once the control loop wrote it to the Nucleo.
+        :param setpoint: written setpoint
+        :type setpoint: Setpoint
+        :param write_started: time the UART write started at
+        :return: None
+        """
+        self.__record_latency__(setpoint.timestamp, write_started, setpoint.received_at)
+
+    def __on_spi_sent__(self, context, write_started):
+        """__on_spi_sent__
+
+            SPI worker's callback: record the latency of a command whose frames were just written.
+        :param context: command's creation and reception time
+        :param write_started: time the SPI transaction started at
+        :return: None
+        """
+        timestamp, received_at = context
+        self.__record_latency__(timestamp, write_started, received_at)
+
+    def __on_driver_status__(self, status):
+        """__on_driver_status__
+
+            Log the changes of the driver board's status.
+        :param status: new status
+        :type status: SpiStatus
+        :return: None
+        """
+        LOGGER.info('Driver board status {}: {}'.format(list(status.query), list(status.value)))
+
+    def get_latency_report(self):
+        """get_latency_report
+
+            Get the rolling latency percentiles of the commands, per stage.
+        :return: latency summaries by stage, in seconds, without the SPI stages until the driver board is up
+        :rtype: dict
+        """
+        report = {
+            'command': self.command_latency.summary(),
+            'network': self.network_latency.summary(),
+            'decode': self.decode_latency.summary(),
+            'write': self.write_latency.summary(),
+            'control_jitter': self.control_loop.jitter.summary(),
+        }
+        if self.__driver_board_ready__():
+            report['spi'] = self.driver.transaction_time.summary()
+            report['spi_queue'] = self.spi_worker.queue_wait.summary()
+            report['spi_status'] = self.status_poller.read_time.summary()
+        return report
+
     def move(self, speed, angle, timeout=1):
         """move
 
-        :param speed:
-        :param angle:
-        :param timeout:
-        :return:
+            Set the control loop's setpoint, preempting any maneuver.
+        :param speed: speed sent to the Nucleo
+        :param angle: steering, in degrees
+        :param timeout: seconds to wait at most for the control loop to write the move to the Nucleo, no wait if None
+        :return: True once the move is written (or at once if not waiting), False on timeout
+        :rtype: bool
         """
-        sent = self.serial_handler.sendMove(speed, angle)
-        if sent:
-            confirmed = self.ev1.wait(timeout=timeout)
-            if not confirmed:
-                LOGGER.info("Error getting confirmation via USART")
-                return False
-        else:
-            LOGGER.info("Error sending command via USART")
+        self.maneuvers.preempt()
+        sequence = self.control_loop.set_move(speed=speed, steering=angle)
+        if timeout is None:
+            return True
+        if not self.control_loop.wait_applied(sequence, timeout):
+            LOGGER.info("Error getting the move written via USART")
             return False
         return True
 
     def brake(self, timeout=1):
         """brake
 
-        :param timeout:
-        :return:
+            Set the control loop's setpoint to braking, preempting any maneuver.
+        :param timeout: seconds to wait at most for the control loop to write the brake to the Nucleo, no wait if None
+        :return: True once the brake is written (or at once if not waiting), False on timeout
+        :rtype: bool
         """
-        sent = self.serial_handler.sendBrake(0.0)
-        if sent:
-            confirmed = self.ev1.wait(timeout=timeout)
-            if confirmed:
-                LOGGER.info("Braking was confirmed!")
-            else:
-                LOGGER.error('Response', 'Response was not received!')
-        else:
-            LOGGER.info("Sending problem")
+        self.maneuvers.preempt()
+        sequence = self.control_loop.set_brake()
+        if timeout is None:
+            return True
+        if not self.control_loop.wait_applied(sequence, timeout):
+            LOGGER.error("Braking was not written via USART!")
+            return False
+        return True
 
     def parking_maneuver(self):
-        """
+        """parking_maneuver
 
-        :return:
+            Start parking, in background.
+        :return: None
         """
-        LOGGER.info('Parking...')
-        parking_speed = 20
-        parking_angle = 22
-
-        reverse_time = 3
-
-        self.move(-parking_speed, parking_angle)
-        sleep(reverse_time)
-        self.move(-parking_speed, -parking_angle)
-        sleep(reverse_time / 3)
-        self.brake()
-
-        LOGGER.info('Parked!')
-
-
+        self.maneuvers.start(MANEUVER_PARKING)
 
+    def stop_recording(self):
+        """stop_recording
 
+            Close the session log, if recording.
+        :return: None
+        """
+        if self.session is not None:
+            self.session.close()
 
+    def shutdown(self):
+        """shutdown
 
+            Stop serving and driving, then close the hardware and the car's files. Parts not brought up are
+        skipped.
+        :return: None
+        """
+        self.bring_up.finished.wait()
+        self.connection.stop_listening()
+        if self.connection.server_is_on:
+            self.connection.stop_server()
+        if hasattr(self, 'maneuvers'):
+            self.maneuvers.preempt()
+        if hasattr(self, 'control_loop'):
+            self.control_loop.stop()
+        if self.light_patterns is not None:
+            self.light_patterns.stop()
+        if self.status_poller is not None:
+            self.status_poller.stop()
+        if self.spi_worker is not None:
+            self.spi_worker.stop()
+        if hasattr(self, 'serial_handler'):
+            self.serial_handler.close()
+        if hasattr(self, 'odometer'):
+            self.odometer.close()
+        if hasattr(self, 'e'):
+            self.e.close()
+        self.stop_recording()
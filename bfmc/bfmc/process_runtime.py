@@ -0,0 +1,711 @@
+"""Multi-process car runtime
+
+    Optional layout of the car in separate processes, so that Python code in one of them (e.g. perception)
+does not hold the GIL of the others:
+
+    network: host and command decoding, writes the setpoint and queues the SPI frames
+    control: control loop, samples the setpoint and queues the Nucleo's commands
+    I/O: serial and SPI writes, acknowledgements, encoder and odometry, publishes the pose
+    perception: optional, user provided, reads the pose and the control output
+
+    The processes exchange setpoints and telemetry through shared memory (see bfmc.utils.shared_state),
+never pickling on the data path: setpoints, control output and pose are seqlock snapshots, the serial
+commands and SPI frames are ring buffers. Only moves, brakes and SPI frames are handled in this mode: the
+other commands (e.g. maneuvers, light patterns, status queries) are answered with RESPONSE_UNSUPPORTED and
+logged once, the RC warns about them. Needs Python 3.8+.
+
+    python -m bfmc.process_runtime --port 25000
+"""
+import argparse
+import logging
+import math
+import multiprocessing
+import queue
+import struct
+import threading
+
+from collections import deque
+from time import monotonic
+
+from bfmc import app_data_path
+from bfmc.utils.connection_utils import *
+from bfmc.utils.control_loop import CONTROL_LOOP_FREQUENCY, ControlLoop
+from bfmc.utils.host import Host
+from bfmc.utils.log_utils import start_async_logging
+from bfmc.utils.odometry import Pose, new_odometry_log_path
+from bfmc.utils.shared_state import SharedRing, SharedSnapshot
+from bfmc.utils.spi import get_spi_passthrough_data
+from bfmc.utils.stats import LatencyRecorder
+from bfmc.utils.transport import TRANSPORT_TCP, get_transport
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+# power, speed, steering, brake, limited, timestamp, received_at; NaN stands for None
+SETPOINT_LAYOUT = struct.Struct('=ddd??dd')
+# braking, speed, steering last written by the control loop
+OUTPUT_LAYOUT = struct.Struct('=?dd')
+POSE_LAYOUT = struct.Struct('=7d')
+# timestamp and received_at of the SPI frames that follow
+SPI_CONTEXT = struct.Struct('=dd')
+
+SERIAL_RING_SLOTS = 64
+SERIAL_RING_SLOT_SIZE = 60  # longest MCTL or BRAK command, with room to spare
+SPI_RING_SLOTS = 64
+SPI_RING_SLOT_SIZE = 2048
+
+IO_IDLE_PERIOD = .05  # seconds the I/O process waits for work before publishing the pose anyway
+READY_TIMEOUT = 10.  # seconds
+STOP_TIMEOUT = 5.  # seconds
+
+ACKNOWLEDGED_COMMANDS = (b'#MCTL', b'#BRAK')
+
+
+def __to_double__(value):
+    """__to_double__
+
+    :return: value, NaN if None
+    :rtype: float
+    """
+    return float('nan') if value is None else float(value)
+
+
+def __from_double__(value):
+    """__from_double__
+
+    :return: value, None if NaN
+    """
+    return None if math.isnan(value) else value
+
+
+def parse_motion_command(message):
+    """parse_motion_command
+
+    :param message: command written to the Nucleo, e.g. '#MCTL:0.20;15.00;;'
+    :type message: str
+    :return: braking, speed and steering, None if not a move or a brake
+    :rtype: tuple
+    """
+    key, _, values = message.partition(':')
+    values = values.split(';')
+    try:
+        if key == '#MCTL':
+            return False, float(values[0]), float(values[1])
+        if key == '#BRAK':
+            return True, 0., float(values[0])
+    except (ValueError, IndexError):
+        pass
+    return None
+
+
+class AckMonitor:
+    """AckMonitor
+
+        Class used to measure how long the Nucleo takes to acknowledge moves and brakes, from the serial write
+    to the acknowledgement's callback. The line is in order, so acknowledgements match the writes first in,
+    first out.
+    """
+    def __init__(self):
+        """Constructor
+        """
+        self.__written__ = deque()
+        self.latency = LatencyRecorder()
+        self.acknowledged = 0
+        self.unmatched = 0
+
+    def on_write(self, now, data):
+        """on_write
+
+            Serial write callback (e.g. SerialEmulator's write_callback).
+        :param now: monotonic time of the write
+        :param data: written bytes
+        :type data: bytes
+        :return: None
+        """
+        if bytes(data[:5]) in ACKNOWLEDGED_COMMANDS:
+            self.__written__.append(now)
+
+    def on_ack(self, message):
+        """on_ack
+
+            Serial waiter callback of MCTL and BRAK.
+        :param message: acknowledgement's value
+        :return: None
+        """
+        now = monotonic()
+        try:
+            written = self.__written__.popleft()
+        except IndexError:
+            self.unmatched += 1
+            return
+        self.acknowledged += 1
+        self.latency.record(now - written)
+
+
+class RingSerialWriter:
+    """RingSerialWriter
+
+        Stand-in for the serial handler in the control process: commands are queued for the I/O process.
+    """
+    def __init__(self, ring, doorbell):
+        """Constructor
+
+        :param ring: serial commands' ring
+        :type ring: SharedRing
+        :param doorbell: event waking the I/O process up
+        """
+        self.ring = ring
+        self.doorbell = doorbell
+
+    def send(self, msg):
+        """send
+
+        :param msg: command for the Nucleo
+        :type msg: str
+        :return: None
+        """
+        if not self.ring.push(msg.encode('ascii')):
+            raise IOError('Serial ring is full!')
+        self.doorbell.set()
+
+
+class SharedControlLoop(ControlLoop):
+    """SharedControlLoop
+
+        Control loop taking its setpoint from a shared snapshot, written by the network process.
+    """
+    def __init__(self, setpoints, serial_handler, map_power, **kwargs):
+        """Constructor
+
+        :param setpoints: setpoint snapshot
+        :type setpoints: SharedSnapshot
+        :param serial_handler: where the commands are written
+        :param map_power: maps the RC's power to the speed sent to the Nucleo
+        :param kwargs: ControlLoop's keyword arguments
+        """
+        ControlLoop.__init__(self, serial_handler, map_power, **kwargs)
+        self.shared_setpoints = setpoints
+        self.__version__ = 0
+
+    def step(self):
+        """step
+
+            Take the latest setpoint, if a new one was written, then step as usual.
+        :return: None
+        """
+        values, version = self.shared_setpoints.read()
+        if version != self.__version__:
+            self.__version__ = version
+            power, speed, steering, brake, limited, timestamp, received_at = values
+            self.__set__(__from_double__(power), __from_double__(speed), steering, brake, limited,
+                         __from_double__(timestamp), __from_double__(received_at))
+        ControlLoop.step(self)
+
+
+class NetworkFrontEnd:
+    """NetworkFrontEnd
+
+        Network process' command handling: moves and brakes become the shared setpoint, SPI frames are
+    queued for the I/O process, the other commands are answered with RESPONSE_UNSUPPORTED.
+    """
+    def __init__(self, connection, setpoints, spi_ring, doorbell):
+        """Constructor
+
+        :param connection: clients' host
+        :type connection: Host
+        :param setpoints: setpoint snapshot, written only here
+        :type setpoints: SharedSnapshot
+        :param spi_ring: SPI frames' ring, written only here
+        :type spi_ring: SharedRing
+        :param doorbell: event waking the I/O process up
+        """
+        self.connection = connection
+        self.setpoints = setpoints
+        self.spi_ring = spi_ring
+        self.doorbell = doorbell
+        # commands answered as unsupported, logged the first time only
+        self.unsupported_commands = set()
+
+    def serve(self):
+        """serve
+
+            Handle the clients' frames until every client disconnected, then brake: the car does not keep
+        driving on the last setpoint without anyone to stop it.
+        :return: None
+        """
+        self.connection.connect_with_client()
+        if self.connection.max_clients > 1:
+            self.connection.accept_clients()
+
+        try:
+            while True:
+                frame = self.connection.get_frame()
+                if frame is None:
+                    LOGGER.info('Connection closed by client!')
+                    return
+                response = self.decode_frame(frame)
+                if frame.request_id != NO_REQUEST_ID:
+                    self.connection.send_response(frame.request_id, response)
+        finally:
+            self.set_brake()
+
+    def decode_frame(self, frame):
+        """decode_frame
+
+        :param frame: frame received from a client
+        :type frame: Frame
+        :return: response for the client
+        :rtype: str
+        """
+        try:
+            if frame.kind == FRAME_KIND_BATCH:
+                return self.decode_batch(unpack_batch(frame.payload), frame.timestamp)
+            spi_data = get_spi_passthrough_data(frame.payload)
+            if spi_data is not None:
+                return self.pass_spi_data_through(spi_data, frame.timestamp)
+            return self.decode_command(payload_to_string(frame.payload), frame.timestamp)
+        except Exception as err:
+            # a malformed frame is answered, it does not end serving
+            LOGGER.info(err)
+            return RESPONSE_ERROR
+
+    def decode_command(self, package, timestamp=None):
+        """decode_command
+
+        :param package: package received from client
+        :type package: str
+        :param timestamp: package's creation time on the car's clock, if any
+        :return: response for the client
+        :rtype: str
+        """
+        if '$i' not in package or '$d' not in package:
+            return RESPONSE_ERROR
+        data = package[package.find("$d") + 2:]
+        try:
+            cmd_id = int(package[package.find("$i") + 2:package.find("$d")])
+            if cmd_id == 10:
+                self.set_move(float(data.split()[0]), float(data.split()[1]), timestamp)
+            elif cmd_id == 13:
+                self.set_brake(timestamp)
+            else:
+                if cmd_id not in self.unsupported_commands:
+                    self.unsupported_commands.add(cmd_id)
+                    LOGGER.warning('Command {} is not supported by the multi-process runtime!'.format(cmd_id))
+                return RESPONSE_UNSUPPORTED
+        except Exception as err:
+            LOGGER.info(err)
+            return RESPONSE_ERROR
+        return RESPONSE_OK
+
+    def decode_batch(self, packages, timestamp=None):
+        """decode_batch
+
+            The last move or brake of the batch becomes the setpoint, the SPI frames are queued together.
+        :param packages: packages received from client
+        :type packages: list of bytes or str
+        :param timestamp: packages' creation time on the car's clock, if any
+        :return: response for the client
+        :rtype: str
+        """
+        setpoint = None
+        response = RESPONSE_OK
+        # decode every package first: a malformed batch is rejected before any of it is applied
+        decoded_packages = []
+        for package in packages:
+            spi_data = get_spi_passthrough_data(package)
+            decoded_packages.append(payload_to_string(package) if spi_data is None else spi_data)
+        for package in decoded_packages:
+            if isinstance(package, memoryview):
+                if self.pass_spi_data_through(package, timestamp) == RESPONSE_ERROR:
+                    response = RESPONSE_ERROR
+                continue
+            if '$i10$d' in package or '$i13$d' in package:
+                setpoint = package
+            else:
+                package_response = self.decode_command(package, timestamp)
+                if package_response != RESPONSE_OK:
+                    response = package_response
+        if setpoint is not None and self.decode_command(setpoint, timestamp) == RESPONSE_ERROR:
+            response = RESPONSE_ERROR
+        return response
+
+    def set_move(self, power, steering, timestamp=None):
+        """set_move
+
+        :param power: power requested by the RC
+        :param steering: steering, in degrees
+        :param timestamp: command's creation time on the car's clock, if any
+        :return: None
+        """
+        self.setpoints.write(power, float('nan'), steering, False, True, __to_double__(timestamp),
+                             __to_double__(self.connection.current_frame_received_at))
+
+    def set_brake(self, timestamp=None):
+        """set_brake
+
+        :param timestamp: command's creation time on the car's clock, if any
+        :return: None
+        """
+        self.setpoints.write(float('nan'), 0., 0., True, False, __to_double__(timestamp),
+                             __to_double__(self.connection.current_frame_received_at))
+
+    def pass_spi_data_through(self, spi_data, timestamp=None):
+        """pass_spi_data_through
+
+        :param spi_data: one or several concatenated SPI frames
+        :type spi_data: memoryview or bytes
+        :param timestamp: frames' creation time on the car's clock, if any
+        :return: response for the client
+        :rtype: str
+        """
+        message = SPI_CONTEXT.pack(__to_double__(timestamp),
+                                   __to_double__(self.connection.current_frame_received_at)) + bytes(spi_data)
+        try:
+            queued = self.spi_ring.push(message)
+        except ValueError as err:
+            LOGGER.info(err)
+            return RESPONSE_ERROR
+        if not queued:
+            LOGGER.warning('SPI ring is full, frames dropped!')
+            return RESPONSE_ERROR
+        self.doorbell.set()
+        return RESPONSE_OK
+
+
+def run_network(port, max_clients, transport, setpoints_name, spi_ring_name, doorbell, ready, log_level):
+    """run_network
+
+        Network process, terminated by the runtime.
+    :return: None
+    """
+    logging.getLogger('bfmc').setLevel(log_level)
+    connection = Host(ip=None, port=port, max_clients=max_clients, transport=get_transport(transport))
+    network = NetworkFrontEnd(connection, SharedSnapshot(SETPOINT_LAYOUT, setpoints_name),
+                              SharedRing(spi_ring_name), doorbell)
+    connection.start_server()
+    ready.set()
+    network.serve()
+
+
+def run_control(frequency, setpoints_name, output_name, serial_ring_name, doorbell, stop, results, log_level):
+    """run_control
+
+        Control process, until stop is set.
+    :return: None
+    """
+    from bfmc.core import map_power
+
+    logging.getLogger('bfmc').setLevel(log_level)
+    output = SharedSnapshot(OUTPUT_LAYOUT, output_name)
+    command_latency = LatencyRecorder()
+    network_latency = LatencyRecorder()
+    decode_latency = LatencyRecorder()
+
+    def on_setpoint_sent(setpoint, write_started):
+        if setpoint.timestamp is None:
+            return
+        command_latency.record(monotonic() - setpoint.timestamp)
+        if setpoint.received_at is not None:
+            network_latency.record(setpoint.received_at - setpoint.timestamp)
+            decode_latency.record(write_started - setpoint.received_at)
+
+    control_loop = SharedControlLoop(SharedSnapshot(SETPOINT_LAYOUT, setpoints_name),
+                                     RingSerialWriter(SharedRing(serial_ring_name), doorbell), map_power,
+                                     frequency=frequency, sent_callback=on_setpoint_sent,
+                                     output_callback=output.write)
+    control_loop.start()
+    stop.wait()
+    control_loop.stop()
+    results.put(('control', {
+        'control_loop': control_loop.get_statistics(),
+        'latency': {
+            'command': command_latency.summary(),
+            'network': network_latency.summary(),
+            'decode': decode_latency.summary(),
+            'control_jitter': control_loop.jitter.summary(),
+        },
+    }))
+
+
+def run_io(serial_factory, spi_factory, serial_ring_name, spi_ring_name, pose_name, doorbell, ready, stop,
+           results, odometry_log_path, log_level):
+    """run_io
+
+        I/O process: owns the serial port and the SPI device, until stop is set.
+    :param odometry_log_path: file every odometry sample is logged to, not logged if None
+    :return: None
+    """
+    from bfmc.utils.driver.core import BFMCDriverBoardSTM
+    from bfmc.utils.odometry import Odometry
+    from bfmc.utils.save_encoder import SaveEncoder
+    from bfmc.utils.serial_handler import SerialHandler
+    from bfmc.utils.spi_worker import SpiWorker
+
+    logging.getLogger('bfmc').setLevel(log_level)
+    serial_ring = SharedRing(serial_ring_name)
+    spi_ring = SharedRing(spi_ring_name)
+    pose = SharedSnapshot(POSE_LAYOUT, pose_name)
+
+    write_latency = LatencyRecorder()
+    spi_command_latency = LatencyRecorder()
+
+    def on_spi_sent(context, write_started):
+        timestamp, _ = context
+        if timestamp is not None:
+            spi_command_latency.record(monotonic() - timestamp)
+
+    driver = BFMCDriverBoardSTM(spi=spi_factory() if spi_factory is not None else None)
+    spi_worker = SpiWorker(driver, sent_callback=on_spi_sent)
+    spi_worker.start()
+
+    serial_handler = SerialHandler(f_serialCon=serial_factory() if serial_factory is not None else None)
+    serial_handler.startReadThread()
+    encoder = SaveEncoder("Encoder.csv")
+    encoder.open()
+    acknowledged = threading.Event()
+    published = threading.Event()
+
+    LOGGER.info('Activating PID')
+    serial_handler.readThread.addWaiter("PIDA", acknowledged, print)
+    if serial_handler.sendPidActivation(True) and not acknowledged.wait(timeout=1.0):
+        raise ConnectionError('Response', 'Response was not received!')
+
+    ack_monitor = AckMonitor()
+    odometer = Odometry(log_path=odometry_log_path)
+    for key in ("MCTL", "BRAK"):
+        serial_handler.readThread.addWaiter(key, acknowledged, encoder.save)
+        serial_handler.readThread.addWaiter(key, acknowledged, ack_monitor.on_ack)
+    serial_handler.readThread.addWaiter("ENPB", published, encoder.save)
+    serial_handler.readThread.addWaiter("ENPB", published, odometer.on_message)
+    if not serial_handler.sendEncoderPublisher():
+        raise ConnectionError('Response', 'Response was not received!')
+    ready.set()
+
+    while not stop.is_set():
+        doorbell.wait(timeout=IO_IDLE_PERIOD)
+        # cleared before draining: a message pushed meanwhile rings again and is handled on the next pass
+        doorbell.clear()
+        for message in serial_ring.pop_all():
+            write_started = monotonic()
+            ack_monitor.on_write(write_started, message)
+            message = message.decode('ascii')
+            try:
+                serial_handler.send(message)
+            except Exception as err:
+                LOGGER.error("Error occurred while writing to the Nucleo! {}".format(err))
+                continue
+            write_latency.record(monotonic() - write_started)
+            motion = parse_motion_command(message)
+            if motion is not None:
+                odometer.on_output(*motion)
+
+        for message in spi_ring.pop_all():
+            timestamp, received_at = SPI_CONTEXT.unpack_from(message)
+            spi_worker.submit(message[SPI_CONTEXT.size:],
+                              context=(__from_double__(timestamp), __from_double__(received_at)))
+
+        current = odometer.pose
+        if current.updated_at is not None:
+            pose.write(*current)
+
+    # the Nucleo keeps driving on its last command: stop the car before letting the port go
+    serial_handler.sendBrake(0.0)
+    spi_worker.stop()
+    serial_handler.close()
+    odometer.close()
+    encoder.close()
+    results.put(('io', {
+        'ack': ack_monitor.latency.summary(),
+        'acknowledged': ack_monitor.acknowledged,
+        'unmatched_acks': ack_monitor.unmatched,
+        'spi_worker': spi_worker.get_statistics(),
+        'latency': {
+            'write': write_latency.summary(),
+            'spi_command': spi_command_latency.summary(),
+            'spi': driver.transaction_time.summary(),
+            'spi_queue': spi_worker.queue_wait.summary(),
+        },
+    }))
+
+
+def run_perception(perception, output_name, pose_name, stop):
+    """run_perception
+
+        Perception process: runs the user's callable with read access to the car's state.
+    :return: None
+    """
+    perception(RuntimeState(output_name, pose_name), stop)
+
+
+class RuntimeState:
+    """RuntimeState
+
+        Read-only view of the car's shared state, from any process.
+    """
+    def __init__(self, output_name, pose_name):
+        """Constructor
+
+        :param output_name: control output snapshot's name
+        :param pose_name: pose snapshot's name
+        """
+        self.__output__ = SharedSnapshot(OUTPUT_LAYOUT, output_name)
+        self.__pose__ = SharedSnapshot(POSE_LAYOUT, pose_name)
+
+    def get_output(self):
+        """get_output
+
+        :return: braking, speed and steering last written to the Nucleo, None before the first write
+        :rtype: tuple
+        """
+        return self.__output__.read()[0]
+
+    def get_pose(self):
+        """get_pose
+
+        :return: car's latest pose, None before the first encoder sample
+        :rtype: Pose
+        """
+        values = self.__pose__.read()[0]
+        return Pose(*values) if values is not None else None
+
+
+class ProcessRuntime:
+    """ProcessRuntime
+
+        Class used to run the car as separate network, control, I/O and (optional) perception processes.
+    The runtime owns the shared memory; the processes attach to it by name.
+    """
+    def __init__(self, port=DEFAULT_PORT, max_clients=ALLOWED_CONNECTIONS, transport=TRANSPORT_TCP,
+                 control_frequency=CONTROL_LOOP_FREQUENCY, serial_factory=None, spi_factory=None, perception=None,
+                 odometry_log=False, log_level=logging.INFO):
+        """Constructor
+
+        :param port: server's port
+        :param max_clients: maximum number of clients connected at once
+        :param transport: clients' transport name (see bfmc.utils.transport), not in-process
+        :param control_frequency: frequency the Nucleo is driven at, in Hz
+        :param serial_factory: builds the serial connection to the Nucleo in the I/O process (e.g. an emulator),
+        /dev/ttyACM0 if None
+        :param spi_factory: builds the driver board's SPI device in the I/O process, spidev's SpiDev if None
+        :param perception: called in its own process with a RuntimeState and the stop event, if given
+        :param odometry_log: log every odometry sample to a new file in the logs folder (see
+        bfmc.utils.odometry.load_odometry_log)
+        :param log_level: processes' log level
+        """
+        self.setpoints = SharedSnapshot(SETPOINT_LAYOUT)
+        self.output = SharedSnapshot(OUTPUT_LAYOUT)
+        self.pose = SharedSnapshot(POSE_LAYOUT)
+        self.serial_ring = SharedRing(slots=SERIAL_RING_SLOTS, slot_size=SERIAL_RING_SLOT_SIZE)
+        self.spi_ring = SharedRing(slots=SPI_RING_SLOTS, slot_size=SPI_RING_SLOT_SIZE)
+
+        self.__doorbell__ = multiprocessing.Event()
+        self.__stop__ = multiprocessing.Event()
+        self.__results__ = multiprocessing.Queue()
+        network_ready = multiprocessing.Event()
+        io_ready = multiprocessing.Event()
+        self.__ready__ = (io_ready, network_ready)
+
+        self.io_process = multiprocessing.Process(
+            target=run_io, name='bfmc-io',
+            args=(serial_factory, spi_factory, self.serial_ring.name, self.spi_ring.name, self.pose.name,
+                  self.__doorbell__, io_ready, self.__stop__, self.__results__,
+                  new_odometry_log_path(app_data_path) if odometry_log else None, log_level))
+        self.control_process = multiprocessing.Process(
+            target=run_control, name='bfmc-control',
+            args=(control_frequency, self.setpoints.name, self.output.name, self.serial_ring.name,
+                  self.__doorbell__, self.__stop__, self.__results__, log_level))
+        self.network_process = multiprocessing.Process(
+            target=run_network, name='bfmc-network', daemon=True,
+            args=(port, max_clients, transport, self.setpoints.name, self.spi_ring.name, self.__doorbell__,
+                  network_ready, log_level))
+        self.perception_process = None
+        if perception is not None:
+            self.perception_process = multiprocessing.Process(
+                target=run_perception, name='bfmc-perception', daemon=True,
+                args=(perception, self.output.name, self.pose.name, self.__stop__))
+
+        self.state = RuntimeState(self.output.name, self.pose.name)
+
+    def start(self, timeout=READY_TIMEOUT):
+        """start
+
+            Start the processes and wait for the Nucleo and the server to be ready.
+        :param timeout: seconds
+        :return: None
+        """
+        self.io_process.start()
+        if not self.__ready__[0].wait(timeout):
+            self.stop()
+            raise ConnectionError('Response', 'I/O process did not start!')
+        self.control_process.start()
+        self.network_process.start()
+        if not self.__ready__[1].wait(timeout):
+            self.stop()
+            raise ConnectionError('Server', 'Network process did not start!')
+        if self.perception_process is not None:
+            self.perception_process.start()
+        LOGGER.info('Multi-process runtime started')
+
+    def stop(self):
+        """stop
+
+            Stop the processes and free the shared memory.
+        :return: statistics of the control and I/O processes
+        :rtype: dict
+        """
+        self.__stop__.set()
+        report = {}
+        for process in (self.control_process, self.io_process):
+            if process.is_alive():
+                try:
+                    name, statistics = self.__results__.get(timeout=STOP_TIMEOUT)
+                except queue.Empty:
+                    LOGGER.error('No statistics from {}!'.format(process.name))
+                    continue
+                report[name] = statistics
+        for process in (self.network_process, self.perception_process):
+            if process is not None and process.is_alive():
+                process.terminate()
+        for process in (self.network_process, self.perception_process, self.control_process, self.io_process):
+            if process is not None and process.pid is not None:
+                process.join(STOP_TIMEOUT)
+
+        for block in (self.setpoints, self.output, self.pose, self.serial_ring, self.spi_ring):
+            block.close()
+        return report
+
+    def get_output(self):
+        """get_output
+
+        :return: braking, speed and steering last written to the Nucleo, None before the first write
+        :rtype: tuple
+        """
+        return self.state.get_output()
+
+    def get_pose(self):
+        """get_pose
+
+        :return: car's latest pose, None before the first encoder sample
+        :rtype: Pose
+        """
+        return self.state.get_pose()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BFMC multi-process runtime')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--clients', type=int, default=ALLOWED_CONNECTIONS, help='clients connected at once')
+    parser.add_argument('--frequency', type=float, default=CONTROL_LOOP_FREQUENCY, help='control loop, in Hz')
+    parser.add_argument('--odometry-log', action='store_true', help='log the odometry to the logs folder')
+    args = parser.parse_args()
+
+    # file and console writes happen on a background thread, chatty call sites are rate limited
+    start_async_logging(LOGGER)
+    runtime = ProcessRuntime(port=args.port, max_clients=args.clients, control_frequency=args.frequency,
+                             odometry_log=args.odometry_log)
+    runtime.start()
+    try:
+        runtime.network_process.join()
+    except KeyboardInterrupt:
+        LOGGER.info('Interrupted by user!')
+    runtime.stop()
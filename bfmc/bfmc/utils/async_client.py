@@ -0,0 +1,351 @@
+import heapq
+import json
+import logging
+import threading
+
+from concurrent.futures import Future, TimeoutError
+from time import monotonic, sleep
+
+from bfmc.utils.client import Client
+from bfmc.utils.clock_sync import CLOCK_SYNC_PERIOD, ClockSync
+from bfmc.utils.connection_utils import *
+from bfmc.utils.stats import LatencyRecorder
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+DEFAULT_REQUEST_TIMEOUT = 1.0  # seconds
+READER_IDLE_TIMEOUT = 0.1  # seconds
+
+
+class AsyncClient(Client):
+    """AsyncClient
+
+        Client with pipelined requests: every request gets its own ID and a future, several requests
+    can be in flight at once and responses are matched by ID, even when they arrive out of order.
+    """
+
+    def __init__(self, host, port=DEFAULT_PORT, default_timeout=DEFAULT_REQUEST_TIMEOUT, max_in_flight=None,
+                 transport=None):
+        """Constructor
+
+        :param host: remote host's name or ip to connect to as string
+                     example: '192.168.100.15'
+        :param port: host's communication port as integer
+                     example: 1369
+        :param default_timeout: seconds to wait for a response if no timeout is given per request
+        :param max_in_flight: maximum number of requests awaiting a response, unlimited if None
+        :param transport: host's transport (see bfmc.utils.transport), TCP if None
+        """
+        super(AsyncClient, self).__init__(host, port, transport=transport)
+
+        self.default_timeout = default_timeout
+
+        self.__pending__ = {}
+        self.__deadlines__ = []
+        self.__lock__ = threading.Lock()
+        self.__send_lock__ = threading.Lock()
+        self.__in_flight__ = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+        self.__reader__ = None
+        self.reading = False
+
+        self.last_status = None
+        self.status_callback = None
+
+        self.clock = ClockSync()
+        self.response_latency = LatencyRecorder()
+
+    @property
+    def in_flight(self):
+        """in_flight
+
+            Number of requests awaiting a response.
+        :rtype: int
+        """
+        return len(self.__pending__)
+
+    def connect_to_host(self):
+        """connect_to_host
+
+            Method establishes connection to the host and starts reading responses.
+        :return: None
+        """
+        super(AsyncClient, self).connect_to_host()
+        self.reading = True
+        self.__reader__ = threading.Thread(target=self.__read__, daemon=True)
+        self.__reader__.start()
+
+    def send_package(self, package, request_id=NO_REQUEST_ID, timestamp=None, kind=FRAME_KIND_COMMAND):
+        """send_package
+
+            Sends a package to the server. Safe to be called from several threads.
+        :param package: package to be sent
+        :param request_id: request's ID, NO_REQUEST_ID if no response is expected
+        :param timestamp: package's creation time on the host's monotonic clock, sent along if given
+        :param kind: frame kind, one of FRAME_KIND_*
+        :return: True if ok, error occurred otherwise
+        """
+        with self.__send_lock__:
+            return super(AsyncClient, self).send_package(package, request_id=request_id, timestamp=timestamp,
+                                                         kind=kind)
+
+    def send_package_async(self, package, timeout=None, timestamp=None, kind=FRAME_KIND_COMMAND):
+        """send_package_async
+
+            Sends a package to the server without waiting for the response.
+        :param package: package to be sent
+        :param timeout: seconds to wait for the response, default_timeout if None
+        :param timestamp: package's creation time on the host's monotonic clock, sent along if given
+        :param kind: frame kind, one of FRAME_KIND_*
+        :return: future resolved with server's response, or failing with TimeoutError
+        :rtype: Future
+        """
+        if timeout is None:
+            timeout = self.default_timeout
+
+        if self.__in_flight__ is not None:
+            self.__in_flight__.acquire()
+
+        future = Future()
+        with self.__lock__:
+            request_id = self.next_request_id()
+            sent_at = monotonic()
+            self.__pending__[request_id] = (future, sent_at)
+            heapq.heappush(self.__deadlines__, (sent_at + timeout, request_id))
+
+        sent = self.send_package(package, request_id=request_id, timestamp=timestamp, kind=kind)
+        if sent is not True:
+            self.__resolve__(request_id, error=ConnectionError('Request', sent))
+
+        return future
+
+    def send_batch_async(self, packages, timeout=None, timestamp=None):
+        """send_batch_async
+
+            Sends several packages to the server in one frame, without waiting for the response.
+        The car applies them as one unit and answers once for all of them.
+        :param packages: packages to be sent
+        :type packages: list of str or bytes
+        :param timeout: seconds to wait for the response, default_timeout if None
+        :param timestamp: packages' creation time on the host's monotonic clock, sent along if given
+        :return: future resolved with server's response, or failing with TimeoutError
+        :rtype: Future
+        """
+        return self.send_package_async(self.pack_packages(packages), timeout=timeout, timestamp=timestamp,
+                                       kind=FRAME_KIND_BATCH)
+
+    def send_package_and_get_response(self, package, timeout=None):
+        """send_package_and_get_response
+
+            Method sends a package to the server and awaits a response.
+        :return: None or server's response
+        """
+        try:
+            return self.send_package_async(package, timeout=timeout).result()
+        except Exception as err:
+            LOGGER.warning("Request failed! {}".format(err))
+            return None
+
+    def get_frame(self):
+        """get_frame
+
+            Frames are consumed by the reader thread, use send_package_async instead.
+        """
+        raise RuntimeError('AsyncClient frames are consumed by the reader thread!')
+
+    def close(self):
+        """close
+
+            Stop reading responses, close the connection and fail the pending requests.
+        :return: None
+        """
+        self.reading = False
+        try:
+            super(AsyncClient, self).close()
+        except Exception as err:
+            LOGGER.warning(err)
+
+        if self.__reader__ is not None and self.__reader__ is not threading.current_thread():
+            self.__reader__.join()
+
+        with self.__lock__:
+            request_ids = list(self.__pending__)
+        for request_id in request_ids:
+            self.__resolve__(request_id, error=ConnectionError('Request', 'Connection closed!'))
+
+    def __resolve__(self, request_id, response=None, error=None):
+        """__resolve__
+
+            Complete a pending request.
+        :param request_id: request's ID
+        :param response: server's response
+        :param error: exception to fail the request with, if any
+        :return: None
+        """
+        with self.__lock__:
+            pending = self.__pending__.pop(request_id, None)
+        if pending is None:
+            return
+        future, sent_at = pending
+
+        if self.__in_flight__ is not None:
+            self.__in_flight__.release()
+
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            self.response_latency.record(monotonic() - sent_at)
+            future.set_result(response)
+
+    def __expire_requests__(self):
+        """__expire_requests__
+
+            Fail the requests whose deadline passed.
+        :return: seconds until the next deadline, None if there is no pending request
+        """
+        now = monotonic()
+        expired = []
+        with self.__lock__:
+            while self.__deadlines__:
+                deadline, request_id = self.__deadlines__[0]
+                if request_id not in self.__pending__:
+                    heapq.heappop(self.__deadlines__)
+                elif deadline <= now:
+                    heapq.heappop(self.__deadlines__)
+                    expired.append(request_id)
+                else:
+                    break
+            next_deadline = self.__deadlines__[0][0] - now if self.__deadlines__ else None
+
+        for request_id in expired:
+            self.__resolve__(request_id, error=TimeoutError('Request {} timed out!'.format(request_id)))
+
+        return next_deadline
+
+    def handle_frame(self, frame):
+        """handle_frame
+
+            Handle a frame received from the server.
+        :param frame: received frame
+        :type frame: Frame
+        :return: None
+        """
+        if frame.kind == FRAME_KIND_RESPONSE and frame.request_id != NO_REQUEST_ID:
+            self.__resolve__(frame.request_id, response=frame.payload)
+        elif frame.kind == FRAME_KIND_STATUS:
+            self.last_status = HostStatus(*STATUS_PAYLOAD.unpack(frame.payload))
+            if self.status_callback is not None:
+                self.status_callback(self.last_status)
+        elif frame.kind == FRAME_KIND_PONG:
+            received_at = monotonic()
+            sent_at, host_received_at, host_sent_at = PONG_PAYLOAD.unpack(frame.payload)
+            self.clock.add_sample(sent_at, host_received_at, host_sent_at, received_at)
+
+    def send_ping(self):
+        """send_ping
+
+            Send a clock synchronization ping carrying its send time, on the client's clock; the host answers
+        with it and its own receive and send times.
+        :return: True if ok, error occurred otherwise
+        """
+        try:
+            with self.__send_lock__:
+                self.channel.send_frame(FRAME_KIND_PING, NO_REQUEST_ID, PING_PAYLOAD.pack(monotonic()))
+            return True
+        except Exception as err:
+            error = "Error occurred while sending ping to server: " + str(err)
+            LOGGER.warning(error)
+            return error
+
+    def start_clock_sync(self, period=CLOCK_SYNC_PERIOD):
+        """start_clock_sync
+
+            Keep estimating the host's clock offset and drift in background.
+        :param period: seconds between two pings
+        :return: None
+        """
+        clock_sync_thread = threading.Thread(target=self.__clock_sync__, args=(period,), daemon=True)
+        clock_sync_thread.start()
+
+    def __clock_sync__(self, period):
+        """__clock_sync__
+
+            Thread pinging the host every period.
+        :return: None
+        """
+        while self.reading:
+            if self.send_ping() is not True:
+                return
+            sleep(period)
+
+    def remote_time(self, local_time=None):
+        """remote_time
+
+            Convert a local monotonic time, e.g. a joystick sample time, to the host's clock.
+        :param local_time: local monotonic time, now if None
+        :return: time on the host's clock, None while the clock is not synchronized
+        """
+        if local_time is None:
+            local_time = monotonic()
+        return self.clock.to_remote(local_time)
+
+    def get_latency_report(self, timeout=None):
+        """get_latency_report
+
+            Get host's rolling latency percentiles, per stage.
+        :param timeout: seconds to wait for the report, default_timeout if None
+        :return: latency summaries by stage, None if not available
+        :rtype: dict
+        """
+        response = self.send_package_and_get_response(LATENCY_REPORT_PACKAGE, timeout=timeout)
+        if not response:
+            return None
+        response = payload_to_string(response, self.encoding)
+        if response == RESPONSE_ERROR:
+            return None
+        return json.loads(response)
+
+    def __read__(self):
+        """__read__
+
+            Reader thread: match responses with their requests and apply timeouts.
+        :return: None
+        """
+        while self.reading:
+            next_deadline = self.__expire_requests__()
+            if next_deadline is None or next_deadline > READER_IDLE_TIMEOUT:
+                next_deadline = READER_IDLE_TIMEOUT
+
+            try:
+                frames = self.channel.receive_frames(timeout=next_deadline)
+            except (OSError, ValueError) as err:
+                if self.reading:
+                    LOGGER.warning("Error occurred while reading responses: {}".format(err))
+                break
+
+            if frames is None:
+                if self.reading:
+                    LOGGER.warning("Connection closed by server!")
+                break
+
+            for frame in frames:
+                self.handle_frame(frame)
+
+        self.reading = False
+        with self.__lock__:
+            request_ids = list(self.__pending__)
+        for request_id in request_ids:
+            self.__resolve__(request_id, error=ConnectionError('Request', 'Connection lost!'))
+
+
+if __name__ == '__main__':
+    c = AsyncClient(host='192.168.100.9', port=8888)
+    c.connect_to_host()
+    while 1:
+        x = input()
+        futures = [c.send_package_async(package) for package in x.split(';')]
+        for f in futures:
+            LOGGER.info("Resp: {}".format(f.result()))
@@ -0,0 +1,212 @@
+import logging
+import threading
+
+from time import monotonic, sleep
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+BRING_UP_ATTEMPTS = 3  # attempts per step, retried after a failure
+BRING_UP_RETRY_DELAY = .1  # seconds between two attempts of a step
+
+
+class BringUpStep:
+    """BringUpStep
+
+        Start-up step of a BringUp: a function run once the steps it requires succeeded, retried a bounded
+    number of times if it raises.
+    """
+    def __init__(self, name, function, requires=(), attempts=BRING_UP_ATTEMPTS, retry_delay=BRING_UP_RETRY_DELAY,
+                 required=True):
+        """Constructor
+
+        :param name: step's name, as logged
+        :param function: called without arguments, raises if the step failed
+        :param requires: steps that must succeed first
+        :param attempts: maximum number of calls of the function
+        :param retry_delay: seconds between two calls
+        :param required: the bring-up fails with the step if True, only the steps requiring it are skipped if False
+        """
+        self.name = name
+        self.function = function
+        self.requires = tuple(requires)
+        self.attempts = attempts
+        self.retry_delay = retry_delay
+        self.required = required
+
+        self.done = threading.Event()
+        self.succeeded = False
+        self.skipped = False
+        self.error = None
+        self.attempts_made = 0
+        # since the bring-up's start, in seconds
+        self.started_at = None
+        self.duration = None
+
+
+class BringUp:
+    """BringUp
+
+        Dependency graph of start-up steps (open devices, activate the Nucleo's PID, start the server...).
+    Every step runs on its own thread as soon as the steps it requires succeeded, so independent steps
+    overlap and the slowest chain of steps sets the start-up time instead of their sum. Steps are added
+    after the steps they require, so the graph has no cycle. The timing of every step is logged.
+    """
+    def __init__(self, concurrent=True):
+        """Constructor
+
+        :param concurrent: run the independent steps at once, one after another in the order they were added
+                           if False (e.g. to debug the hardware's start-up)
+        """
+        self.concurrent = concurrent
+
+        self.__steps__ = {}
+        self.__lock__ = threading.Lock()
+        self.__remaining__ = 0
+        self.finished = threading.Event()
+        self.started_at = None
+        self.duration = None
+
+    def add(self, name, function, requires=(), attempts=BRING_UP_ATTEMPTS, retry_delay=BRING_UP_RETRY_DELAY,
+            required=True):
+        """add
+
+            Add a step, see BringUpStep.
+        :param requires: names of the steps that must succeed first, already added
+        :return: step
+        :rtype: BringUpStep
+        """
+        if name in self.__steps__:
+            raise ValueError('Bring-up step added twice: {}'.format(name))
+        for requirement in requires:
+            if requirement not in self.__steps__:
+                raise ValueError('Bring-up step {} requires an unknown step: {}'.format(name, requirement))
+        step = BringUpStep(name, function, [self.__steps__[requirement] for requirement in requires], attempts,
+                           retry_delay, required)
+        self.__steps__[name] = step
+        return step
+
+    def start(self):
+        """start
+
+            Start running the steps, in background if concurrent.
+        :return: None
+        """
+        self.started_at = monotonic()
+        self.__remaining__ = len(self.__steps__)
+        if not self.__steps__:
+            self.__finish__()
+            return
+
+        if not self.concurrent:
+            for step in self.__steps__.values():
+                self.__run_step__(step)
+            return
+
+        for step in self.__steps__.values():
+            threading.Thread(target=self.__run_step__, args=(step,), daemon=True,
+                             name='bring-up {}'.format(step.name)).start()
+
+    def __run_step__(self, step):
+        """__run_step__
+
+            Wait for the steps required, then call the step's function until it succeeds or runs out of attempts.
+        :param step: step
+        :type step: BringUpStep
+        :return: None
+        """
+        for requirement in step.requires:
+            requirement.done.wait()
+        failed = [requirement.name for requirement in step.requires if not requirement.succeeded]
+
+        step.started_at = monotonic() - self.started_at
+        if failed:
+            step.skipped = True
+            step.error = RuntimeError('Bring-up step {} skipped, failed: {}'.format(step.name, ', '.join(failed)))
+            LOGGER.error(step.error)
+        else:
+            while step.attempts_made < step.attempts:
+                step.attempts_made += 1
+                try:
+                    step.function()
+                    step.succeeded = True
+                    break
+                except Exception as err:
+                    step.error = err
+                    LOGGER.warning('Bring-up step {} failed (attempt {}/{}): {}'.format(
+                        step.name, step.attempts_made, step.attempts, err))
+                    if step.attempts_made < step.attempts:
+                        sleep(step.retry_delay)
+            step.duration = monotonic() - self.started_at - step.started_at
+            if step.succeeded:
+                LOGGER.info('Bring-up step {}: {:.1f} ms from +{:.1f} ms ({} attempts)'.format(
+                    step.name, step.duration * 1e3, step.started_at * 1e3, step.attempts_made))
+            else:
+                LOGGER.error('Bring-up step {} failed after {} attempts: {}'.format(
+                    step.name, step.attempts_made, step.error))
+        step.done.set()
+
+        with self.__lock__:
+            self.__remaining__ -= 1
+            last = self.__remaining__ == 0
+        if last:
+            self.__finish__()
+
+    def __finish__(self):
+        """__finish__
+
+        :return: None
+        """
+        self.duration = monotonic() - self.started_at
+        LOGGER.info('Bring-up finished in {:.1f} ms'.format(self.duration * 1e3))
+        self.finished.set()
+
+    def wait_for(self, name, timeout=None):
+        """wait_for
+
+            Wait for a step to finish.
+        :param name: step's name
+        :param timeout: seconds, waits for ever if None
+        :return: True if the step succeeded
+        :rtype: bool
+        """
+        step = self.__steps__[name]
+        step.done.wait(timeout)
+        return step.succeeded
+
+    def wait(self, timeout=None):
+        """wait
+
+            Wait for every step to finish.
+        :param timeout: seconds, waits for ever if None
+        :return: True if every required step succeeded, False if not finished in time
+        :rtype: bool
+        """
+        if not self.finished.wait(timeout):
+            return False
+        for step in self.__steps__.values():
+            if step.required and not step.succeeded:
+                raise step.error
+        return True
+
+    @property
+    def ready(self):
+        """ready
+
+            Every step finished and the required ones succeeded.
+        :rtype: bool
+        """
+        return self.finished.is_set() and all(step.succeeded for step in self.__steps__.values() if step.required)
+
+    def get_timings(self):
+        """get_timings
+
+        :return: steps' start (since the bring-up's start) and duration in seconds, attempts and result, by name
+        :rtype: dict
+        """
+        return {name: {
+            'started_at': step.started_at,
+            'duration': step.duration,
+            'attempts': step.attempts_made,
+            'succeeded': step.succeeded,
+        } for name, step in self.__steps__.items()}
@@ -1,7 +1,7 @@
 import logging
-import socket as py_socket
 
 from bfmc.utils.connection_utils import *
+from bfmc.utils.transport import TcpTransport
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
@@ -13,7 +13,7 @@ class Client:
         Class used to handle internet connection on the crawler's controller as client(master).
     """
 
-    def __init__(self, host, port=DEFAULT_PORT):
+    def __init__(self, host, port=DEFAULT_PORT, transport=None):
         """Constructor
 
             Constructor
@@ -21,12 +21,14 @@ class Client:
                      example: '192.168.100.15'
         :param port: host's communication port as integer
                      example: 1369
+        :param transport: host's transport (see bfmc.utils.transport), TCP if None
         """
         try:
             LOGGER.debug("Initiating client...")
 
-            # create the socket object
-            self.socket = py_socket.socket(py_socket.AF_INET, py_socket.SOCK_STREAM)
+            # connection to the host, opened by connect_to_host
+            self.transport = transport if transport is not None else TcpTransport()
+            self.channel = None
 
             # setting host and port
             self.host = host
@@ -34,6 +36,9 @@ class Client:
 
             self.encoding = ENCODING
 
+            self.__pending_frames__ = []
+            self.__last_request_id__ = NO_REQUEST_ID
+
             LOGGER.debug("Client initiated!")
 
         except Exception as err:
@@ -60,47 +65,123 @@ class Client:
         :return: None
         """
         LOGGER.debug("Connecting to host...")
-        self.socket.connect((self.host, self.port))
+        self.channel = self.transport.connect(self.host, self.port)
         LOGGER.debug("Connected to {}!".format(self.host))
 
-    def send_package(self, package):
+    def next_request_id(self):
+        """next_request_id
+
+            Generate a new request ID.
+        :return: request ID
+        :rtype: int
+        """
+        self.__last_request_id__ = self.__last_request_id__ % MAX_REQUEST_ID + 1
+        return self.__last_request_id__
+
+    def send_package(self, package, request_id=NO_REQUEST_ID, timestamp=None, kind=FRAME_KIND_COMMAND):
         """send_package
 
             Sends a package to the server.
         :param package: package to be sent
+        :param request_id: request's ID, NO_REQUEST_ID if no response is expected
+        :param timestamp: package's creation time on the host's monotonic clock, sent along if given
+        :param kind: frame kind, one of FRAME_KIND_*
         :return: True if ok, error occurred otherwise
         """
         try:
-            package = self.string_to_bytes(package)
-            LOGGER.info('PACKAGE: {}'.format(package))
-            self.socket.send(package)
+            if isinstance(package, str) and self.transport.serializes:
+                package = self.string_to_bytes(package)
+            if LOGGER.isEnabledFor(logging.INFO):
+                LOGGER.info('PACKAGE: {}'.format(package))
+            self.channel.send_frame(kind, request_id, package, timestamp)
             return True
         except Exception as err:
             error = "Error occurred while sending package to server: " + str(err)
             LOGGER.warning(error)
             return error
 
-    def get_response(self):
-        """get_response
+    def pack_packages(self, packages):
+        """pack_packages
 
-            Get server's response.
-        :return: None or server's response
+            Pack several packages into one batch payload.
+        :param packages: packages to be applied as one unit
+        :type packages: list of str or bytes
+        :return: batch payload, the packages themselves if they are not serialized
+        :rtype: bytes or list
+        """
+        if not self.transport.serializes:
+            return list(packages)
+        return pack_batch([self.string_to_bytes(package) if isinstance(package, str) else package
+                           for package in packages])
+
+    def send_batch(self, packages, request_id=NO_REQUEST_ID, timestamp=None):
+        """send_batch
+
+            Sends several packages to the server in one frame; the car applies them as one unit.
+        :param packages: packages to be sent
+        :type packages: list of str or bytes
+        :param request_id: request's ID, NO_REQUEST_ID if no response is expected
+        :param timestamp: packages' creation time on the host's monotonic clock, sent along if given
+        :return: True if ok, error occurred otherwise
+        """
+        return self.send_package(self.pack_packages(packages), request_id=request_id, timestamp=timestamp,
+                                 kind=FRAME_KIND_BATCH)
+
+    def get_frame(self):
+        """get_frame
+
+            Get server's next frame.
+        :return: None or server's frame
+        :rtype: Frame
         """
         try:
-            response = self.socket.recv(BUFFER_SIZE)
+            while not self.__pending_frames__:
+                frames = self.channel.receive_frames()
+                if frames is None:
+                    return None
+                self.__pending_frames__.extend(frames)
         except Exception as err:
             LOGGER.warning(err)
-            response = None
-        return response
+            return None
+        return self.__pending_frames__.pop(0)
+
+    def get_response(self, request_id=None):
+        """get_response
+
+            Get server's response.
+        :param request_id: only return the response to this request, any if None
+        :return: None or server's response
+        """
+        while True:
+            frame = self.get_frame()
+            if frame is None:
+                return None
+            if frame.kind != FRAME_KIND_RESPONSE:
+                continue
+            if request_id is None or frame.request_id == request_id:
+                return frame.payload
+
+    def close(self):
+        """close
+
+            Close the connection to the host.
+        :return: None
+        """
+        if self.channel is not None:
+            self.channel.close()
 
     def send_package_and_get_response(self, package):
         """send_package_and_get_response
 
             Method sends a package to the server and awaits a response.
+        Responses to other requests received in the meantime are discarded.
+        For several requests in flight, use AsyncClient.
         :return: None or server's response
         """
-        self.send_package(package)
-        response = self.get_response()
+        request_id = self.next_request_id()
+        if self.send_package(package, request_id=request_id) is not True:
+            return None
+        response = self.get_response(request_id=request_id)
         return response
 
 
@@ -0,0 +1,104 @@
+import threading
+
+from collections import deque, namedtuple
+
+from bfmc.utils.stats import LatencyRecorder
+
+CLOCK_SYNC_PERIOD = 1.  # seconds between two pings
+CLOCK_SYNC_WINDOW = 64  # ping samples kept for the estimate
+CLOCK_SYNC_MIN_SAMPLES = 4  # samples kept after dropping the slowest round trips
+
+ClockSample = namedtuple('ClockSample', ['local_time', 'offset', 'delay'])
+
+
+class ClockSync:
+    """ClockSync
+
+        Class used to estimate the offset and drift of a remote monotonic clock, NTP style.
+    Every ping gives the local send and receive times t0 and t3 and the remote receive and send times
+    t1 and t2. Only the samples with the shortest round trips are kept, as they carry the least queueing,
+    and a line is fitted through their offsets: its slope is the drift between the two clocks.
+    """
+    def __init__(self, window=CLOCK_SYNC_WINDOW):
+        """Constructor
+
+        :param window: ping samples kept for the estimate
+        :type window: int
+        """
+        self.__samples__ = deque(maxlen=window)
+        self.__lock__ = threading.Lock()
+
+        self.offset = None
+        self.drift = 0.
+        self.reference = 0.
+
+        self.round_trip = LatencyRecorder()
+
+    @property
+    def synchronized(self):
+        """synchronized
+
+        :return: True if an offset estimate is available
+        :rtype: bool
+        """
+        return self.offset is not None
+
+    def add_sample(self, t0, t1, t2, t3):
+        """add_sample
+
+            Add a ping exchange to the estimate.
+        :param t0: local time the ping was sent at
+        :param t1: remote time the ping was received at
+        :param t2: remote time the answer was sent at
+        :param t3: local time the answer was received at
+        :return: None
+        """
+        delay = (t3 - t0) - (t2 - t1)
+        offset = ((t1 - t0) + (t2 - t3)) / 2.
+        self.round_trip.record(delay)
+
+        with self.__lock__:
+            self.__samples__.append(ClockSample((t0 + t3) / 2., offset, delay))
+            self.__estimate__()
+
+    def __estimate__(self):
+        """__estimate__
+
+            Fit offset and drift through the samples with the shortest round trips.
+        :return: None
+        """
+        samples = sorted(self.__samples__, key=lambda sample: sample.delay)
+        samples = samples[:max(CLOCK_SYNC_MIN_SAMPLES, len(samples) // 2)]
+
+        reference = sum(sample.local_time for sample in samples) / len(samples)
+        offset = sum(sample.offset for sample in samples) / len(samples)
+
+        spread = sum((sample.local_time - reference) ** 2 for sample in samples)
+        drift = 0.
+        if len(samples) >= CLOCK_SYNC_MIN_SAMPLES and spread > 0:
+            drift = sum((sample.local_time - reference) * (sample.offset - offset) for sample in samples) / spread
+
+        self.reference = reference
+        self.drift = drift
+        self.offset = offset
+
+    def offset_at(self, local_time):
+        """offset_at
+
+        :param local_time: local monotonic time
+        :return: remote clock minus local clock at the given time
+        :rtype: float
+        """
+        return self.offset + self.drift * (local_time - self.reference)
+
+    def to_remote(self, local_time):
+        """to_remote
+
+            Convert a local monotonic time to the remote clock.
+        :param local_time: local monotonic time
+        :return: remote monotonic time, None if not synchronized yet
+        """
+        with self.__lock__:
+            if self.offset is None:
+                return None
+            return local_time + self.offset_at(local_time)
@@ -1,5 +1,8 @@
 import logging
 import socket as py_socket
+import struct
+
+from collections import namedtuple
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
@@ -15,6 +18,47 @@ ENCODING = 'utf-8'
 LOST_CONNECTION_PACKAGES_LIMIT = 25
 LOST_CONNECTION_PACKAGE = ""
 
+# every package travels inside a frame: magic, kind, flags, request id, payload length
+FRAME_MAGIC = 0xBF
+FRAME_HEADER = struct.Struct('!BBHII')
+MAX_FRAME_PAYLOAD = 1 << 20  # bytes
+
+# optional header extensions, following the header in flag order
+FLAG_TIMESTAMP = 0x0001
+FRAME_TIMESTAMP = struct.Struct('!d')  # package's creation time on the receiver's monotonic clock, in seconds
+
+FRAME_KIND_COMMAND = 1
+FRAME_KIND_RESPONSE = 2
+FRAME_KIND_STATUS = 3
+FRAME_KIND_PING = 4
+FRAME_KIND_PONG = 5
+FRAME_KIND_BATCH = 6
+
+# batch payload: packages applied as one unit, each preceded by its length
+BATCH_ITEM_HEADER = struct.Struct('!H')
+
+# status reported by the host: queued commands, average service time (s), commands served since last status
+STATUS_PAYLOAD = struct.Struct('!IfI')
+STATUS_PERIOD = .1  # seconds
+
+# ping: its send time, on the client's clock (the frame's timestamp is reserved to the receiver's clock)
+PING_PAYLOAD = struct.Struct('!d')
+# answer to a ping: ping's send time (client's clock), receive and answer time (host's clock)
+PONG_PAYLOAD = struct.Struct('!ddd')
+
+LATENCY_REPORT_PACKAGE = '$i2$d'
+
+NO_REQUEST_ID = 0
+MAX_REQUEST_ID = 0xFFFFFFFF
+
+RESPONSE_OK = 'ok'
+RESPONSE_ERROR = 'error'
+RESPONSE_UNSUPPORTED = 'unsupported'  # command not handled by the car's runtime (e.g. bfmc.process_runtime)
+
+Frame = namedtuple('Frame', ['kind', 'request_id', 'payload', 'timestamp'])
+Frame.__new__.__defaults__ = (None,)
+HostStatus = namedtuple('HostStatus', ['queue_depth', 'service_time', 'served'])
+
 
 def get_local_machine_ip_addresses():
     """__get_local_machine_ip_addresses__
@@ -35,3 +79,129 @@ def get_local_machine_ip_addresses():
         LOGGER.error(error)
 
     return ip_list
+
+
+def pack_frame(kind, request_id, payload, timestamp=None):
+    """pack_frame
+
+        Wrap a package into a frame ready to be sent over the socket.
+    :param kind: frame kind, one of FRAME_KIND_*
+    :type kind: int
+    :param request_id: request's ID, NO_REQUEST_ID if no response is expected
+    :type request_id: int
+    :param payload: package to be wrapped
+    :type payload: bytes
+    :param timestamp: package's creation time on the receiver's monotonic clock, if any
+    :type timestamp: float
+    :return: frame
+    :rtype: bytes
+    """
+    if timestamp is None:
+        return FRAME_HEADER.pack(FRAME_MAGIC, kind, 0, request_id, len(payload)) + payload
+    return (FRAME_HEADER.pack(FRAME_MAGIC, kind, FLAG_TIMESTAMP, request_id, len(payload)) +
+            FRAME_TIMESTAMP.pack(timestamp) + payload)
+
+
+class FrameReader:
+    """FrameReader
+
+        Class used to split a socket's byte stream into frames.
+    A single recv may hold several frames or only a part of one, so incoming data is buffered
+    until complete frames are available.
+    """
+    def __init__(self):
+        """Constructor
+        """
+        self.__buffer__ = bytearray()
+
+    def feed(self, data):
+        """feed
+
+            Append received data and extract the complete frames.
+        :param data: data received from the socket
+        :type data: bytes
+        :return: complete frames, in order of arrival
+        :rtype: list of Frame
+        """
+        self.__buffer__ += data
+        frames = []
+        offset = 0
+        buffer_length = len(self.__buffer__)
+
+        while buffer_length - offset >= FRAME_HEADER.size:
+            magic, kind, flags, request_id, length = FRAME_HEADER.unpack_from(self.__buffer__, offset)
+            if magic != FRAME_MAGIC or length > MAX_FRAME_PAYLOAD:
+                self.__buffer__ = bytearray()
+                raise ConnectionError('Frame', 'Invalid frame received!')
+
+            payload_start = offset + FRAME_HEADER.size
+            if flags & FLAG_TIMESTAMP:
+                payload_start += FRAME_TIMESTAMP.size
+            payload_end = payload_start + length
+            if payload_end > buffer_length:
+                break
+
+            timestamp = None
+            if flags & FLAG_TIMESTAMP:
+                timestamp, = FRAME_TIMESTAMP.unpack_from(self.__buffer__, offset + FRAME_HEADER.size)
+
+            frames.append(Frame(kind, request_id, bytes(self.__buffer__[payload_start:payload_end]), timestamp))
+            offset = payload_end
+
+        if offset:
+            del self.__buffer__[:offset]
+
+        return frames
+
+
+def pack_batch(packages):
+    """pack_batch
+
+        Pack several packages into one batch payload.
+    :param packages: packages to be applied as one unit
+    :type packages: list of bytes
+    :return: batch payload
+    :rtype: bytes
+    """
+    return b''.join(BATCH_ITEM_HEADER.pack(len(package)) + package for package in packages)
+
+
+def unpack_batch(payload):
+    """unpack_batch
+
+        Split a batch payload into its packages.
+    :param payload: batch payload, or its packages if handed over in-process
+    :type payload: bytes or list
+    :return: packages, in order, as views of the payload
+    :rtype: list of memoryview
+    """
+    if isinstance(payload, (list, tuple)):
+        return list(payload)
+    payload = memoryview(payload)
+    packages = []
+    offset = 0
+    while offset < len(payload):
+        if offset + BATCH_ITEM_HEADER.size > len(payload):
+            raise ConnectionError('Frame', 'Invalid batch received!')
+        length, = BATCH_ITEM_HEADER.unpack_from(payload, offset)
+        offset += BATCH_ITEM_HEADER.size
+        if offset + length > len(payload):
+            raise ConnectionError('Frame', 'Invalid batch received!')
+        packages.append(payload[offset:offset + length])
+        offset += length
+    return packages
+
+
+def payload_to_string(payload, encoding=ENCODING):
+    """payload_to_string
+
+        Decode a payload. Payloads handed over in-process are not serialized and may already be strings.
+    :param payload: frame's payload
+    :type payload: bytes or memoryview or str
+    :param encoding: character encoding key
+    :return: payload as string
+    :rtype: str
+    """
+    if isinstance(payload, str):
+        return payload
+    return str(payload, encoding)
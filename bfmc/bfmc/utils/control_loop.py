@@ -0,0 +1,255 @@
+import logging
+import threading
+
+from collections import namedtuple
+from time import monotonic
+
+from bfmc.utils.serial_handler import MessageConverter
+from bfmc.utils.stats import LatencyRecorder
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+CONTROL_LOOP_FREQUENCY = 50.  # Hz
+MAX_SPEED_STEP = .05  # speed change per period
+MAX_STEERING_STEP = 5.  # degrees per period
+
+# latest command: RC power (mapped to a speed by the loop) or speed, steering in degrees, braking, whether
+# rate limits apply, creation and reception times for the latency figures, sequence number
+Setpoint = namedtuple('Setpoint', ['power', 'speed', 'steering', 'brake', 'limited', 'timestamp', 'received_at',
+                                   'sequence'])
+
+
+def step_towards(value, target, max_step):
+    """step_towards
+
+    :param value: current value
+    :param target: value to be reached
+    :param max_step: largest change allowed, None for no limit
+    :return: value moved towards target by max_step at most
+    :rtype: float
+    """
+    if max_step is None or abs(target - value) <= max_step:
+        return target
+    return value + max_step if target > value else value - max_step
+
+
+class ControlLoop:
+    """ControlLoop
+
+        Thread driving the Nucleo at a fixed rate. Commands received from the network only replace the
+    latest setpoint; every period the loop samples it, maps the power to a speed, limits how fast speed
+    and steering change and writes MCTL, at most once per period and only if the output changed. Braking
+    and scripted moves (maneuvers) skip the rate limits.
+    """
+    def __init__(self, serial_handler, map_power, frequency=CONTROL_LOOP_FREQUENCY, max_speed_step=MAX_SPEED_STEP,
+                 max_steering_step=MAX_STEERING_STEP, sent_callback=None, output_callback=None):
+        """Constructor
+
+        :param serial_handler: Nucleo's serial handler
+        :type serial_handler: SerialHandler
+        :param map_power: maps the RC's power to the speed sent to the Nucleo
+        :param frequency: loop frequency, in Hz
+        :param max_speed_step: largest speed change per period, None for no limit
+        :param max_steering_step: largest steering change per period, in degrees, None for no limit
+        :param sent_callback: called with the setpoint and the write start time, once per setpoint written
+        :param output_callback: called with braking, speed and steering after every write (e.g. odometry)
+        """
+        self.serial_handler = serial_handler
+        self.map_power = map_power
+        self.period = 1. / frequency
+        self.max_speed_step = max_speed_step
+        self.max_steering_step = max_steering_step
+        self.sent_callback = sent_callback
+        self.output_callback = output_callback
+
+        self.setpoint = None
+        self.__sequence__ = 0
+        self.__lock__ = threading.Lock()
+        # latest setpoint the output was written for (or already matched), see wait_applied
+        self.applied_sequence = 0
+        self.__applied__ = threading.Condition()
+        self.__stopped__ = threading.Event()
+        self.__thread__ = None
+
+        # output last written to the Nucleo
+        self.speed = 0.
+        self.steering = 0.
+        self.braking = False
+        self.__written__ = None
+        self.__reported_sequence__ = 0
+
+        self.ticks = 0
+        self.writes = 0
+        self.write_errors = 0
+        self.deadline_misses = 0
+        self.setpoints = 0
+        # wake-up lateness against the loop's timeline
+        self.jitter = LatencyRecorder()
+
+    def set_move(self, power=None, steering=0., speed=None, limited=True, timestamp=None, received_at=None):
+        """set_move
+
+            Replace the setpoint with a move.
+        :param power: RC's power, mapped to a speed by the loop
+        :param steering: steering, in degrees
+        :param speed: speed sent to the Nucleo as it is, instead of a mapped power
+        :param limited: False to reach the setpoint at once, skipping the rate limits
+        :param timestamp: command's creation time on the car's clock, if any
+        :param received_at: time the command was received at, if any
+        :return: setpoint's sequence number, see wait_applied
+        :rtype: int
+        """
+        return self.__set__(power, speed, float(steering), False, limited, timestamp, received_at)
+
+    def set_brake(self, timestamp=None, received_at=None):
+        """set_brake
+
+            Replace the setpoint with braking.
+        :param timestamp: command's creation time on the car's clock, if any
+        :param received_at: time the command was received at, if any
+        :return: setpoint's sequence number, see wait_applied
+        :rtype: int
+        """
+        return self.__set__(None, 0., 0., True, False, timestamp, received_at)
+
+    def __set__(self, power, speed, steering, brake, limited, timestamp, received_at):
+        """__set__
+
+        :return: setpoint's sequence number
+        :rtype: int
+        """
+        with self.__lock__:
+            self.__sequence__ += 1
+            self.setpoints += 1
+            self.setpoint = Setpoint(power, speed, steering, brake, limited, timestamp, received_at,
+                                     self.__sequence__)
+            return self.__sequence__
+
+    def wait_applied(self, sequence, timeout=None):
+        """wait_applied
+
+            Wait for the loop to write a setpoint to the Nucleo, or a later one.
+        :param sequence: setpoint's sequence number, as returned by set_move or set_brake
+        :param timeout: seconds to wait at most, forever if None
+        :return: True if applied, False on timeout
+        :rtype: bool
+        """
+        with self.__applied__:
+            return self.__applied__.wait_for(lambda: self.applied_sequence >= sequence, timeout)
+
+    def __mark_applied__(self, sequence):
+        """__mark_applied__
+
+        :param sequence: setpoint's sequence number
+        :return: None
+        """
+        with self.__applied__:
+            self.applied_sequence = sequence
+            self.__applied__.notify_all()
+
+    def start(self):
+        """start
+
+        :return: None
+        """
+        self.__stopped__.clear()
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def stop(self):
+        """stop
+
+        :return: None
+        """
+        self.__stopped__.set()
+        if self.__thread__ is not None:
+            self.__thread__.join()
+
+    def step(self):
+        """step
+
+            Sample the setpoint and write the resulting output if it changed.
+        :return: None
+        """
+        setpoint = self.setpoint
+        if setpoint is None:
+            return
+
+        if setpoint.brake:
+            output = (True, 0., 0.)
+        else:
+            speed = setpoint.speed if setpoint.speed is not None else self.map_power(setpoint.power)
+            if setpoint.limited:
+                output = (False, step_towards(self.speed, speed, self.max_speed_step),
+                          step_towards(self.steering, setpoint.steering, self.max_steering_step))
+            else:
+                output = (False, speed, setpoint.steering)
+
+        if output == self.__written__:
+            if setpoint.sequence != self.applied_sequence:
+                self.__mark_applied__(setpoint.sequence)
+            return
+
+        braking, speed, steering = output
+        message = MessageConverter.BRAKE(steering) if braking else MessageConverter.MCTL(speed, steering)
+        write_started = monotonic()
+        try:
+            self.serial_handler.send(message)
+        except Exception as err:
+            self.write_errors += 1
+            LOGGER.error("Error occurred while writing to the Nucleo! {}".format(err))
+            return
+
+        self.braking, self.speed, self.steering = output
+        self.__written__ = output
+        self.writes += 1
+        if setpoint.sequence != self.applied_sequence:
+            self.__mark_applied__(setpoint.sequence)
+        if self.output_callback is not None:
+            self.output_callback(*output)
+
+        if setpoint.sequence != self.__reported_sequence__:
+            self.__reported_sequence__ = setpoint.sequence
+            if self.sent_callback is not None:
+                self.sent_callback(setpoint, write_started)
+
+    def __run__(self):
+        """__run__
+
+            Loop thread, on a drift-free timeline. A step ending past the next deadline is a miss; periods
+        missed entirely are skipped.
+        :return: None
+        """
+        next_tick = monotonic()
+        while True:
+            delay = next_tick - monotonic()
+            if self.__stopped__.wait(max(delay, 0.)):
+                return
+            self.jitter.record(monotonic() - next_tick)
+
+            self.step()
+            self.ticks += 1
+
+            next_tick += self.period
+            late = monotonic() - next_tick
+            if late > 0:
+                skipped = int(late / self.period)
+                self.deadline_misses += 1 + skipped
+                next_tick += skipped * self.period
+
+    def get_statistics(self):
+        """get_statistics
+
+        :return: loop counters and jitter summary
+        :rtype: dict
+        """
+        return {
+            'frequency': 1. / self.period,
+            'ticks': self.ticks,
+            'setpoints': self.setpoints,
+            'writes': self.writes,
+            'write_errors': self.write_errors,
+            'deadline_misses': self.deadline_misses,
+            'jitter': self.jitter.summary(),
+        }
@@ -1,12 +1,30 @@
 import logging
-import spidev
 
+from time import monotonic
+
+try:
+    import spidev
+except ImportError:
+    spidev = None  # the driver board is emulated
+
+from bfmc.utils.emulator import SpiEmulator
+from bfmc.utils.spi import build_spi_command
+from bfmc.utils.stats import LatencyRecorder
 from bfmc.version import __version__
 
 LOGGER = logging.getLogger('crawler')
 LOGGER.setLevel(logging.INFO)
 
-NOB_TO_N = {0: 0, 1: 1, 2: 2, 3: 4, 4: 4, 5: 8, 6: 8, 7: 8, 8: 8}
+
+def open_spi_device():
+    """open_spi_device
+
+    :return: spidev's SpiDev, an emulator if spidev is not available
+    """
+    if spidev is None:
+        LOGGER.warning("spidev is not available, the driver board is emulated!")
+        return SpiEmulator()
+    return spidev.SpiDev()
 
 
 class BFMCDriverBoardSTM:
@@ -14,8 +32,21 @@ class BFMCDriverBoardSTM:
 
         Class used to handle Crawler's Driver Board.
     """
-    def __init__(self):
-        self.SPI = spidev.SpiDev()
+    def __init__(self, spi=None):
+        """Constructor
+
+        :param spi: SPI device (e.g. an emulator), spidev's SpiDev if None
+        """
+        if spi is None:
+            spi = open_spi_device()
+        self.SPI = spi
+
+        # query transfer buffers by request and response length, reused so a query does not allocate its
+        # transfer list
+        self.__query_buffers__ = {}
+        # duration of every SPI transaction
+        self.transaction_time = LatencyRecorder()
+
         self.__init_SPI__()
 
     def __init_SPI__(self):
@@ -33,66 +64,63 @@ class BFMCDriverBoardSTM:
 
             Send specified data over SPI module.
         :param data: data to be sent
-        :type data: list
+        :type data: list or bytes or bytearray or memoryview
         :return: None
         """
         # LOGGER.info("Sending SPI {}".format(len(data)))
-        self.SPI.xfer(data)
+        transaction_started = monotonic()
+        self.SPI.xfer(data if isinstance(data, list) else list(data))
+        self.transaction_time.record(monotonic() - transaction_started)
 
     def get_spi_data(self, buffer_size):
         """get_spi_data
 
-            Get data over SPI module.
+            Get data over SPI module, in a single transaction.
         :param buffer_size: number of bytes to be read
         :type buffer_size: int
         :return: data received
-        :rtype: list
+        :rtype: list of int
         """
-        data = []
-        for data_index in range(buffer_size):
-            data.append(self.SPI.readbytes(1))
+        transaction_started = monotonic()
+        data = self.SPI.readbytes(buffer_size)
+        self.transaction_time.record(monotonic() - transaction_started)
 
         return data
 
+    def query_spi_data(self, data, response_size):
+        """query_spi_data
+
+            Send a request and read its response in a single full-duplex transaction: the request is followed
+        by response_size dummy bytes, during which the driver board clocks its response out.
+        :param data: request to be sent
+        :type data: list of int or bytes
+        :param response_size: number of bytes to be read
+        :type response_size: int
+        :return: data received after the request
+        :rtype: list of int
+        """
+        request_size = len(data)
+
+        # xfer2 returns what it read in a new list: only the request is rewritten, the dummy bytes stay zero
+        buffer = self.__query_buffers__.get((request_size, response_size))
+        if buffer is None:
+            buffer = self.__query_buffers__[(request_size, response_size)] = [0] * (request_size + response_size)
+        buffer[:request_size] = data
+
+        transaction_started = monotonic()
+        received = self.SPI.xfer2(buffer)
+        self.transaction_time.record(monotonic() - transaction_started)
+
+        return received[request_size:]
+
     def send_spi_command(self, cmd_id, data):
         """send_spi_command
 
             Send SPI command.
         :param cmd_id: command's ID in range [0, 31]
         :type cmd_id: int
-        :param data: list of 8 bits data to be sent, maximum 1024 bytes
+        :param data: list of 8 bits data to be sent, maximum 1022 bytes
         :type data: list of int
         :return: None
         """
-        number_of_data_bytes = len(data)
-
-        if number_of_data_bytes <= 7:
-            extend = 0
-            n = NOB_TO_N[number_of_data_bytes + 1]
-            data_0_byte = False
-            frame_length = 1 << n
-        else:
-            number_of_data_bytes += 1
-            extend = 1
-            n = (number_of_data_bytes & 0b1100000000) >> 8
-            data_0_byte = number_of_data_bytes & 0xFF
-            data_frame_length = number_of_data_bytes + 1
-            frame_length = data_frame_length + 1
-
-        LOGGER.info("FRAME L: {}".format(frame_length))
-        header_byte = (cmd_id << 3) | (extend << 2) | n
-
-        spi_data = [header_byte]
-
-        if data_0_byte:
-            spi_data.append(data_0_byte)
-
-        spi_data.extend(data)
-        if extend == 0:
-            while len(spi_data) < frame_length:
-                spi_data.append(0)
-
-        # for spi_byte in spi_data:
-        #     LOGGER.info("{0:08b}: {1} {2}".format(spi_byte, spi_byte, chr(spi_byte)))
-
-        self.send_spi_data(spi_data)
+        self.send_spi_data(build_spi_command(cmd_id, data))
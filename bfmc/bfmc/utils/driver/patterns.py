@@ -0,0 +1,174 @@
+import logging
+import threading
+
+from time import monotonic
+
+from bfmc.utils.spi import LIGHTS_STATE_HIGH_BEAM, LIGHTS_STATE_OFF, SPI_CMD_LIGHTS, SPI_CMD_TURN_SIGNALS, \
+    TURNING_SIGNAL_REQUEST_HAZARD, TURNING_SIGNAL_REQUEST_OFF, build_spi_command
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+LIGHT_PATTERN_PACKAGE = '$i14$d'  # followed by the pattern's name and its parameters, space separated
+
+LIGHT_PATTERN_BLINK = 'blink'
+LIGHT_PATTERN_HAZARD = 'hazard'
+LIGHT_PATTERN_STOP = 'stop'
+
+BLINK_COUNT = 5
+BLINK_PERIOD = .0512  # seconds the lights stay on, then off
+HAZARD_DURATION = 3.  # seconds
+
+
+def blink_pattern(count=BLINK_COUNT, period=BLINK_PERIOD, state=LIGHTS_STATE_HIGH_BEAM):
+    """blink_pattern
+
+        Lights on and off, count times.
+    :param count: number of blinks
+    :param period: seconds the lights stay on, then off
+    :param state: lights state while on
+    :return: pattern's steps
+    :rtype: list of tuple
+    """
+    return [(SPI_CMD_LIGHTS, int(state), float(period)),
+            (SPI_CMD_LIGHTS, LIGHTS_STATE_OFF, float(period))] * int(count)
+
+
+def hazard_pattern(duration=HAZARD_DURATION):
+    """hazard_pattern
+
+        Hazard lights for a while.
+    :param duration: seconds
+    :return: pattern's steps
+    :rtype: list of tuple
+    """
+    return [(SPI_CMD_TURN_SIGNALS, TURNING_SIGNAL_REQUEST_HAZARD, float(duration)),
+            (SPI_CMD_TURN_SIGNALS, TURNING_SIGNAL_REQUEST_OFF, 0.)]
+
+
+LIGHT_PATTERNS = {
+    LIGHT_PATTERN_BLINK: blink_pattern,
+    LIGHT_PATTERN_HAZARD: hazard_pattern,
+}
+
+
+def build_light_pattern_package(name, *parameters):
+    """build_light_pattern_package
+
+        Build the RC package starting a light pattern on the car.
+    :param name: pattern's name, LIGHT_PATTERN_STOP to stop the running pattern
+    :param parameters: pattern's parameters, defaults used if none
+    :return: package
+    :rtype: str
+    """
+    return LIGHT_PATTERN_PACKAGE + ' '.join([name] + [str(parameter) for parameter in parameters])
+
+
+class LightPatternEngine:
+    """LightPatternEngine
+
+        Class used to play light patterns on the driver board, timed locally on the car. A pattern is a list
+    of steps (SPI command ID, value, seconds to hold it); starting a pattern preempts the running one.
+    """
+    def __init__(self, send_spi_data):
+        """Constructor
+
+        :param send_spi_data: called with every SPI frame to be written, e.g. SpiWorker.submit
+        """
+        self.send_spi_data = send_spi_data
+
+        self.__steps__ = None
+        self.__generation__ = 0
+        self.__condition__ = threading.Condition()
+
+        self.current_pattern = None
+        self.patterns_played = 0
+        self.patterns_preempted = 0
+
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def play(self, name, *parameters):
+        """play
+
+            Start a named pattern, preempting the running one.
+        :param name: pattern's name, one of LIGHT_PATTERNS or LIGHT_PATTERN_STOP
+        :param parameters: pattern's parameters
+        :return: None
+        """
+        if name == LIGHT_PATTERN_STOP:
+            self.stop()
+            return
+        if name not in LIGHT_PATTERNS:
+            raise ValueError('Unknown light pattern: {}'.format(name))
+        self.play_steps(LIGHT_PATTERNS[name](*parameters), name=name)
+
+    def play_steps(self, steps, name=None):
+        """play_steps
+
+            Start a pattern, preempting the running one.
+        :param steps: pattern's steps: SPI command ID, value, seconds to hold it
+        :type steps: list of tuple
+        :param name: pattern's name, for the logs
+        :return: None
+        """
+        frames = [(build_spi_command(cmd_id, [value]), hold) for cmd_id, value, hold in steps]
+        with self.__condition__:
+            if self.__steps__:
+                self.patterns_preempted += 1
+            self.__steps__ = frames
+            self.__generation__ += 1
+            self.current_pattern = name
+            self.__condition__.notify()
+
+    def stop(self):
+        """stop
+
+            Stop the running pattern, leaving the lights as they are.
+        :return: None
+        """
+        with self.__condition__:
+            if self.__steps__:
+                self.patterns_preempted += 1
+            self.__steps__ = None
+            self.__generation__ += 1
+            self.current_pattern = None
+            self.__condition__.notify()
+
+    @property
+    def playing(self):
+        """playing
+
+        :return: True while a pattern is running
+        :rtype: bool
+        """
+        return bool(self.__steps__)
+
+    def __run__(self):
+        """__run__
+
+            Thread playing the patterns, each step on a drift-free timeline.
+        :return: None
+        """
+        while True:
+            with self.__condition__:
+                while not self.__steps__:
+                    self.__condition__.wait()
+                steps = self.__steps__
+                generation = self.__generation__
+
+            deadline = monotonic()
+            for frame, hold in steps:
+                self.send_spi_data(frame)
+                deadline += hold
+                with self.__condition__:
+                    while self.__generation__ == generation and monotonic() < deadline:
+                        self.__condition__.wait(deadline - monotonic())
+                    if self.__generation__ != generation:
+                        break
+            else:
+                with self.__condition__:
+                    if self.__generation__ == generation:
+                        self.__steps__ = None
+                        self.current_pattern = None
+                        self.patterns_played += 1
@@ -0,0 +1,268 @@
+import logging
+import threading
+
+from collections import namedtuple
+from time import monotonic
+
+from bfmc.utils.spi import SPI_CMD_QUERY, build_spi_command
+from bfmc.utils.stats import LatencyRecorder
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+# register queried by the RC's special command: nothing documents it as side-effect free, so it is only polled
+# in background once watched (see watch_register)
+SPI_STATUS_REGISTER = 13
+SPI_STATUS_PERIOD = .05  # seconds between two polls
+SPI_STATUS_RESPONSE_SIZE = 1  # bytes
+# queries watched on a client's behalf: at most this many, each one dropped once not read for the expiry
+SPI_STATUS_MAX_CLIENT_QUERIES = 8
+SPI_STATUS_CLIENT_QUERY_EXPIRY = 5.  # seconds
+
+# latest value read for a query: query frame, value, time it was read at, number of changes seen
+SpiStatus = namedtuple('SpiStatus', ['query', 'value', 'read_at', 'changes'])
+
+
+class SpiStatusPoller:
+    """SpiStatusPoller
+
+        Thread polling the driver board's status registers at a fixed rate, in turn with the other SPI
+    transactions. The latest value of every register is kept as a snapshot, readable at any time without
+    touching the bus, and subscribers are only called when a value changes. Queries watched on a client's
+    behalf are bounded in number and expire once no one reads them, so clients cannot grow the SPI load.
+    """
+    def __init__(self, spi_worker, period=SPI_STATUS_PERIOD, response_size=SPI_STATUS_RESPONSE_SIZE,
+                 max_client_queries=SPI_STATUS_MAX_CLIENT_QUERIES, client_query_expiry=SPI_STATUS_CLIENT_QUERY_EXPIRY):
+        """Constructor
+
+        :param spi_worker: SPI worker the queries are sent through
+        :type spi_worker: SpiWorker
+        :param period: seconds between two polls
+        :param response_size: bytes read per query
+        :param max_client_queries: queries watched on a client's behalf at once, the least recently read one is
+                                   dropped for a new one
+        :param client_query_expiry: seconds after which a query watched on a client's behalf and not read since
+                                    is dropped
+        """
+        self.spi_worker = spi_worker
+        self.period = period
+        self.response_size = response_size
+        self.max_client_queries = max_client_queries
+        self.client_query_expiry = client_query_expiry
+
+        self.__queries__ = []
+        # queries watched on a client's behalf: last time read (or watched)
+        self.__client_queries__ = {}
+        self.__snapshots__ = {}
+        self.__subscribers__ = []
+        self.__lock__ = threading.Lock()
+        self.__stopped__ = threading.Event()
+        self.__thread__ = None
+
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+        self.expired = 0
+        self.read_time = LatencyRecorder()
+
+    def watch(self, query, client=False):
+        """watch
+
+            Poll a query from now on.
+        :param query: query frame, e.g. build_spi_command(SPI_CMD_QUERY, [register])
+        :type query: bytes
+        :param client: watched on a client's behalf: polled as long as it is read, see max_client_queries
+        :return: None
+        """
+        query = bytes(query)
+        with self.__lock__:
+            if client and query not in self.__queries__:
+                if len(self.__client_queries__) >= self.max_client_queries:
+                    self.__forget__(min(self.__client_queries__, key=self.__client_queries__.get))
+                self.__client_queries__[query] = monotonic()
+            elif not client:
+                # watched for good
+                self.__client_queries__.pop(query, None)
+            if query not in self.__queries__:
+                self.__queries__ = self.__queries__ + [query]
+
+    def __forget__(self, query):
+        """__forget__
+
+            Stop polling a query watched on a client's behalf, under the lock.
+        :param query: query frame
+        :return: None
+        """
+        del self.__client_queries__[query]
+        self.__queries__ = [watched for watched in self.__queries__ if watched != query]
+        self.__snapshots__.pop(query, None)
+        self.expired += 1
+
+    def __expire__(self):
+        """__expire__
+
+            Stop polling the queries watched on a client's behalf that were not read recently.
+        :return: None
+        """
+        if not self.__client_queries__:
+            return
+        deadline = monotonic() - self.client_query_expiry
+        with self.__lock__:
+            for query, read_at in list(self.__client_queries__.items()):
+                if read_at < deadline:
+                    self.__forget__(query)
+
+    def watch_register(self, register=SPI_STATUS_REGISTER):
+        """watch_register
+
+            Poll a status register from now on.
+        :param register: register's number
+        :return: query frame, the snapshot's key
+        :rtype: bytes
+        """
+        query = build_spi_command(SPI_CMD_QUERY, [register])
+        self.watch(query)
+        return query
+
+    def subscribe(self, callback):
+        """subscribe
+
+            Get notified of every change, from the poller's thread.
+        :param callback: called with the new SpiStatus
+        :return: None
+        """
+        with self.__lock__:
+            self.__subscribers__ = self.__subscribers__ + [callback]
+
+    def unsubscribe(self, callback):
+        """unsubscribe
+
+        :param callback: callback given to subscribe
+        :return: None
+        """
+        with self.__lock__:
+            self.__subscribers__ = [subscriber for subscriber in self.__subscribers__ if subscriber != callback]
+
+    def get(self, query):
+        """get
+
+            Latest value read for a query, without touching the bus.
+        :param query: query frame
+        :return: latest status, None if not read yet
+        :rtype: SpiStatus
+        """
+        query = bytes(query)
+        with self.__lock__:
+            if query in self.__client_queries__:
+                self.__client_queries__[query] = monotonic()
+            return self.__snapshots__.get(query)
+
+    def read(self, query):
+        """read
+
+            Read a query at once, through the worker, and poll it on a client's behalf from then on.
+        :param query: query frame
+        :return: status just read, or the poller's if it read it meanwhile
+        :rtype: SpiStatus
+        """
+        query = bytes(query)
+        value = tuple(self.spi_worker.query(query, self.response_size))
+        self.watch(query, client=True)
+        with self.__lock__:
+            return self.__snapshots__.setdefault(query, SpiStatus(query, value, monotonic(), 0))
+
+    @property
+    def snapshot(self):
+        """snapshot
+
+            Latest status of the watched queries.
+        :return: statuses by query frame
+        :rtype: dict
+        """
+        return dict(self.__snapshots__)
+
+    def start(self):
+        """start
+
+            Start polling in background.
+        :return: None
+        """
+        self.__stopped__.clear()
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def stop(self):
+        """stop
+
+        :return: None
+        """
+        self.__stopped__.set()
+        if self.__thread__ is not None:
+            self.__thread__.join()
+
+    def poll(self):
+        """poll
+
+            Read every watched query once and publish the changes.
+        :return: None
+        """
+        self.__expire__()
+        for query in self.__queries__:
+            read_started = monotonic()
+            try:
+                value = self.spi_worker.query(query, self.response_size)
+            except Exception as err:
+                self.errors += 1
+                LOGGER.warning("Error occurred while polling the driver board's status! {}".format(err))
+                continue
+            read_at = monotonic()
+            self.read_time.record(read_at - read_started)
+            self.polls += 1
+
+            value = tuple(value)
+            with self.__lock__:
+                if query not in self.__queries__:
+                    # dropped meanwhile
+                    continue
+                previous = self.__snapshots__.get(query)
+                if previous is not None and previous.value == value:
+                    continue
+
+                changes = previous.changes + 1 if previous is not None else 0
+                status = SpiStatus(query, value, read_at, changes)
+                self.__snapshots__[query] = status
+            if previous is not None:
+                self.changes += 1
+            for subscriber in self.__subscribers__:
+                subscriber(status)
+
+    def __run__(self):
+        """__run__
+
+            Poller thread, on a drift-free timeline.
+        :return: None
+        """
+        next_poll = monotonic()
+        while not self.__stopped__.is_set():
+            self.poll()
+            next_poll += self.period
+            delay = next_poll - monotonic()
+            if delay < 0:
+                # overrun: skip the missed polls instead of bursting
+                next_poll = monotonic()
+                delay = 0
+            self.__stopped__.wait(delay)
+
+    def get_statistics(self):
+        """get_statistics
+
+        :return: polls, changes, errors, expired client queries and read time summary
+        :rtype: dict
+        """
+        return {
+            'polls': self.polls,
+            'changes': self.changes,
+            'errors': self.errors,
+            'expired': self.expired,
+            'read_time': self.read_time.summary(),
+        }
@@ -0,0 +1,343 @@
+import logging
+import threading
+
+from collections import deque
+from time import monotonic, sleep
+
+from bfmc.utils.encoder import ENCODER_DISTANCE_PER_ROTATION
+from bfmc.utils.spi import SPI_CMD_LIGHTS, SPI_CMD_QUERY, SPI_CMD_TURN_SIGNALS, decode_spi_frame, \
+    get_spi_frame_length
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+SERIAL_BAUDRATE = 460800
+SERIAL_BITS_PER_BYTE = 10  # start bit, 8 data bits, stop bit
+NUCLEO_RESPONSE_DELAY = .0005  # seconds the Nucleo takes to handle a command
+
+SERIAL_COMMAND_END = b'\r\n'
+
+ENCODER_PUBLISH_PERIOD = .1  # seconds between two ENPB messages, once the encoder publisher is activated
+
+SPI_BITS_PER_BYTE = 8
+
+
+class SerialEmulator:
+    """SerialEmulator
+
+        Class used to emulate the Nucleo board behind the serial port.
+    It offers the part of pyserial's Serial used by SerialHandler and acknowledges every command the way
+    the firmware does, after the time needed to transfer the command, handle it and transfer the answer.
+    Once activated, the encoder publisher reports the rotation speed matching the latest commanded speed.
+    """
+    def __init__(self, baudrate=SERIAL_BAUDRATE, response_delay=NUCLEO_RESPONSE_DELAY, write_callback=None):
+        """Constructor
+
+        :param baudrate: emulated line speed, in bits per second
+        :param response_delay: seconds the emulated Nucleo takes to handle a command
+        :param write_callback: called with the monotonic time and the data of every write, if given
+        """
+        self.baudrate = baudrate
+        self.response_delay = response_delay
+        self.write_callback = write_callback
+
+        self.is_open = True
+
+        self.__command__ = bytearray()
+        self.__scheduled__ = deque()
+        self.__rx__ = bytearray()
+        self.__lock__ = threading.RLock()
+        self.__line_free_at__ = 0.
+
+        self.speed = 0.
+        self.encoder_publishing = False
+        self.__next_encoder_at__ = None
+
+        self.bytes_written = 0
+        self.commands = 0
+
+    def __transfer_time__(self, number_of_bytes):
+        """__transfer_time__
+
+        :param number_of_bytes: bytes to be transferred
+        :return: seconds needed to transfer the bytes over the line
+        :rtype: float
+        """
+        return number_of_bytes * SERIAL_BITS_PER_BYTE / float(self.baudrate)
+
+    def write(self, data):
+        """write
+
+            Write data to the emulated Nucleo.
+        :param data: data to be written
+        :type data: bytes
+        :return: number of bytes written
+        :rtype: int
+        """
+        now = monotonic()
+        if self.write_callback is not None:
+            self.write_callback(now, data)
+
+        with self.__lock__:
+            self.bytes_written += len(data)
+            self.__command__ += data
+
+            received_at = now + self.__transfer_time__(len(data))
+            while SERIAL_COMMAND_END in self.__command__:
+                end = self.__command__.index(SERIAL_COMMAND_END)
+                command = bytes(self.__command__[:end])
+                del self.__command__[:end + len(SERIAL_COMMAND_END)]
+                self.__handle_command__(command, received_at)
+
+        return len(data)
+
+    def __handle_command__(self, command, received_at):
+        """__handle_command__
+
+            Acknowledge a command, e.g. b'#MCTL:0.20;10.00;;' is answered with b'@MCTL:ack;;'.
+        :param command: command without its line ending
+        :param received_at: monotonic time the command is completely received
+        :return: None
+        """
+        if not command.startswith(b'#') or len(command) < 5:
+            return
+        self.commands += 1
+        key = command[1:5]
+        if key == b'MCTL':
+            self.speed = float(command[6:].split(b';')[0])
+        elif key == b'BRAK':
+            self.speed = 0.
+        elif key == b'ENPB':
+            self.encoder_publishing = command[6:7] == b'1'
+            self.__next_encoder_at__ = received_at + ENCODER_PUBLISH_PERIOD
+        self.respond(b'@' + key + b':ack;;' + SERIAL_COMMAND_END, received_at + self.response_delay)
+
+    def respond(self, response, at=None):
+        """respond
+
+            Send a message from the emulated Nucleo.
+        :param response: message, including its line ending
+        :type response: bytes
+        :param at: monotonic time the Nucleo sends it at, now if None
+        :return: None
+        """
+        if at is None:
+            at = monotonic()
+        with self.__lock__:
+            start = max(at, self.__line_free_at__)
+            self.__line_free_at__ = start + self.__transfer_time__(len(response))
+            self.__scheduled__.append((self.__line_free_at__, response))
+
+    def __collect__(self):
+        """__collect__
+
+            Move the responses completely transferred by now to the receive buffer.
+        :return: None
+        """
+        now = monotonic()
+        while self.encoder_publishing and self.__next_encoder_at__ <= now:
+            # commanded in m/s, like the speeds read back from the encoder
+            rotation_speed = self.speed / ENCODER_DISTANCE_PER_ROTATION
+            self.respond('@ENPB:{:.2f};;'.format(rotation_speed).encode() + SERIAL_COMMAND_END,
+                         self.__next_encoder_at__)
+            self.__next_encoder_at__ = max(self.__next_encoder_at__ + ENCODER_PUBLISH_PERIOD,
+                                           now - ENCODER_PUBLISH_PERIOD)
+        while self.__scheduled__ and self.__scheduled__[0][0] <= now:
+            self.__rx__ += self.__scheduled__.popleft()[1]
+
+    def inWaiting(self):
+        """inWaiting
+
+        :return: number of bytes available for reading
+        :rtype: int
+        """
+        with self.__lock__:
+            self.__collect__()
+            return len(self.__rx__)
+
+    @property
+    def in_waiting(self):
+        """in_waiting
+
+        :return: number of bytes available for reading
+        :rtype: int
+        """
+        return self.inWaiting()
+
+    def read(self, size=1):
+        """read
+
+            Read the available bytes, up to size.
+        :param size: maximum number of bytes to be read
+        :return: bytes read
+        :rtype: bytes
+        """
+        with self.__lock__:
+            self.__collect__()
+            data = bytes(self.__rx__[:size])
+            del self.__rx__[:size]
+        return data
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        self.is_open = False
+
+
+class SpiEmulator:
+    """SpiEmulator
+
+        Class used to emulate the driver board behind the SPI bus. It offers the part of spidev's SpiDev
+    used by BFMCDriverBoardSTM, decodes the written frames with the header rules of build_spi_command,
+    keeps the state of the lights and turn signals and answers queries in the bytes clocked after them.
+    Every transaction lasts the time needed to clock its bytes at max_speed_hz.
+    """
+    def __init__(self, read_handler=None, model_transfer_time=True, write_callback=None):
+        """Constructor
+
+        :param read_handler: called with the command ID and data of every frame, returns the bytes the board
+                             answers with, or None; answers SPI_CMD_QUERY with the status byte if None
+        :param model_transfer_time: block every transaction for its transfer time, as spidev does
+        :param write_callback: called with the monotonic time, the command ID and the data of every frame
+        """
+        self.max_speed_hz = 0
+        self.mode = 0
+        self.is_open = False
+
+        self.read_handler = read_handler if read_handler is not None else self.__answer_query__
+        self.model_transfer_time = model_transfer_time
+        self.write_callback = write_callback
+
+        self.lights_state = 0
+        self.turn_signals_state = 0
+
+        self.__frame__ = bytearray()
+        self.__tx__ = deque()
+        self.__lock__ = threading.RLock()
+        self.__bus_free_at__ = 0.
+
+        self.transactions = 0
+        self.bytes_transferred = 0
+        self.frames = 0
+        self.frames_by_command = {}
+        self.busy_time = 0.
+
+    def open(self, bus, device):
+        """open
+
+        :param bus: SPI bus
+        :param device: chip select
+        :return: None
+        """
+        self.is_open = True
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        self.is_open = False
+
+    def __transfer_time__(self, number_of_bytes):
+        """__transfer_time__
+
+        :param number_of_bytes: bytes to be transferred
+        :return: seconds needed to clock the bytes, 0 if the clock is not set
+        :rtype: float
+        """
+        if not self.max_speed_hz:
+            return 0.
+        return number_of_bytes * SPI_BITS_PER_BYTE / float(self.max_speed_hz)
+
+    def __answer_query__(self, cmd_id, data):
+        """__answer_query__
+
+            Default read handler: answer SPI_CMD_QUERY with the status byte, lights state in the lower
+        two bits and turn signals state in the next two.
+        :return: answer, None if the command is not a query
+        """
+        if cmd_id != SPI_CMD_QUERY:
+            return None
+        return bytes((self.lights_state | self.turn_signals_state << 2,))
+
+    def __handle_frame__(self, frame):
+        """__handle_frame__
+
+            Apply a complete frame to the emulated board.
+        :param frame: complete SPI frame
+        :type frame: bytes
+        :return: None
+        """
+        cmd_id, data = decode_spi_frame(frame)
+        self.frames += 1
+        self.frames_by_command[cmd_id] = self.frames_by_command.get(cmd_id, 0) + 1
+
+        if cmd_id == SPI_CMD_LIGHTS and data:
+            self.lights_state = data[0]
+        elif cmd_id == SPI_CMD_TURN_SIGNALS and data:
+            self.turn_signals_state = data[0]
+
+        if self.write_callback is not None:
+            self.write_callback(monotonic(), cmd_id, data)
+
+        answer = self.read_handler(cmd_id, data)
+        if answer:
+            self.__tx__.extend(answer)
+
+    def xfer(self, data, *args):
+        """xfer
+
+            Full-duplex transfer. Zero bytes between frames are idle bytes, e.g. the bytes clocked to read
+        an answer.
+        :param data: bytes to be written, list or bytes-like
+        :return: bytes read while writing
+        :rtype: list of int
+        """
+        with self.__lock__:
+            started = monotonic()
+            duration = self.__transfer_time__(len(data))
+            self.__bus_free_at__ = max(started, self.__bus_free_at__) + duration
+            self.busy_time += duration
+            self.transactions += 1
+            self.bytes_transferred += len(data)
+
+            received = []
+            frame = self.__frame__
+            for byte in data:
+                received.append(self.__tx__.popleft() if self.__tx__ else 0)
+                if not frame and byte == 0:
+                    continue
+                frame.append(byte)
+                if len(frame) == get_spi_frame_length(frame[0], frame[1] if len(frame) > 1 else None):
+                    self.__handle_frame__(bytes(frame))
+                    del frame[:]
+            bus_free_at = self.__bus_free_at__
+
+        if self.model_transfer_time:
+            delay = bus_free_at - monotonic()
+            if delay > 0:
+                sleep(delay)
+        return received
+
+    xfer2 = xfer
+
+    def writebytes(self, data):
+        """writebytes
+
+        :param data: bytes to be written
+        :return: None
+        """
+        self.xfer(data)
+
+    writebytes2 = writebytes
+
+    def readbytes(self, length):
+        """readbytes
+
+        :param length: number of bytes to be read
+        :return: bytes read
+        :rtype: list of int
+        """
+        return self.xfer([0] * length)
@@ -0,0 +1,75 @@
+import logging
+import threading
+
+from time import monotonic
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+# meters travelled per rotation published by the Nucleo (ENPB), 65 mm wheel: calibrate on the car
+ENCODER_DISTANCE_PER_ROTATION = .2042
+
+
+class EncoderOdometer:
+    """EncoderOdometer
+
+        Class used to integrate the rotation speed published by the Nucleo's encoder (ENPB) into the
+    distance travelled, forwards and backwards alike.
+    """
+    def __init__(self, distance_per_rotation=ENCODER_DISTANCE_PER_ROTATION):
+        """Constructor
+
+        :param distance_per_rotation: meters travelled per published rotation
+        """
+        self.distance_per_rotation = distance_per_rotation
+
+        self.__lock__ = threading.Lock()
+        self.distance = 0.
+        self.speed = 0.
+        self.updated_at = None
+        self.messages = 0
+
+    def on_message(self, message):
+        """on_message
+
+            Serial waiter callback of ENPB messages.
+        :param message: message's value, e.g. '1.25;', acknowledgements are ignored
+        :type message: str
+        :return: None
+        """
+        try:
+            rotation_speed = float(message.strip().rstrip(';'))
+        except ValueError:
+            return
+        self.update(rotation_speed * self.distance_per_rotation)
+
+    def update(self, speed, now=None):
+        """update
+
+            Integrate the previous speed up to now and keep the new one.
+        :param speed: speed, in m/s
+        :param now: monotonic time of the measurement, read from the clock if None
+        :return: None
+        """
+        if now is None:
+            now = monotonic()
+        with self.__lock__:
+            if self.updated_at is not None:
+                self.distance += abs(self.speed) * (now - self.updated_at)
+            self.speed = speed
+            self.updated_at = now
+            self.messages += 1
+
+    def get_distance(self, now=None):
+        """get_distance
+
+        :param now: monotonic time, read from the clock if None
+        :return: distance travelled so far, extrapolated at the latest speed, in meters
+        :rtype: float
+        """
+        if now is None:
+            now = monotonic()
+        with self.__lock__:
+            if self.updated_at is None:
+                return self.distance
+            return self.distance + abs(self.speed) * (now - self.updated_at)
@@ -1,33 +1,56 @@
 import logging
+import queue
 import threading
 import socket as py_socket
 
-from time import sleep
+from time import monotonic, sleep
 
 from bfmc.utils.connection_utils import *
+from bfmc.utils.transport import TcpTransport
 
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
 
+SERVICE_TIME_SMOOTHING = .2
+# frames received and not yet served: beyond, the receivers stop reading and TCP's window closes on the clients
+FRAME_QUEUE_SIZE = 32
+
 
 class Host:
     """Host
     
         Class used to handle Crawler's server application.
     """
-    def __init__(self, ip, port):
+    def __init__(self, ip, port, max_clients=ALLOWED_CONNECTIONS, transport=None):
         """Constructor
         :param ip: Crawler's server IP address
         :type ip: str
         :param port: Crawler's communication port
         :type port: int
+        :param max_clients: maximum number of clients connected at once
+        :type max_clients: int
+        :param transport: clients' transport (see bfmc.utils.transport), TCP if None
         """
         self.__ip__ = ip
         self.__port__ = port
+        self.max_clients = max_clients
+        self.transport = transport if transport is not None else TcpTransport()
 
         self.__connection__ = None
         self.__client__ = None
+        self.__clients__ = []
+        self.__current_client__ = None
+        self.__frames__ = queue.Queue(maxsize=FRAME_QUEUE_SIZE)
+        self.__send_lock__ = threading.Lock()
+        self.__clients_lock__ = threading.Lock()
+        self.__reporting_status__ = False
+
+        self.__serving_since__ = None
+        self.current_frame_received_at = None
+        self.service_time = 0.
+        self.served_commands = 0
+        self.__reported_commands__ = 0
 
         self.server_is_on = False
         self.echo_mode_on = False
@@ -35,6 +58,15 @@ class Host:
 
         self.encoding = ENCODING
 
+    @property
+    def queue_depth(self):
+        """queue_depth
+
+            Number of frames received from the client and not yet served.
+        :rtype: int
+        """
+        return self.__frames__.qsize()
+
     def start_server(self):
         """start_server
 
@@ -44,16 +76,19 @@ class Host:
         """
         LOGGER.info("Starting Crawler's server...")
         try:
-            self.__connection__ = py_socket.socket(py_socket.AF_INET, py_socket.SOCK_STREAM)
-            self.__connection__.bind(("", self.__port__))
+            self.__connection__ = self.transport.listen(self.__port__, max(ALLOWED_CONNECTIONS, self.max_clients))
         except Exception as err:
             error = "Failed to start Crawler's server! {}".format(err)
             LOGGER.error(error)
             return False
 
-        self.__connection__.listen(ALLOWED_CONNECTIONS)
         self.server_is_on = True
 
+        if not self.transport.network:
+            LOGGER.info("Crawler's server is running on {} and waiting for client connection!"
+                        .format(self.__connection__.address))
+            return True
+
         machine_ips = get_local_machine_ip_addresses()
         if len(machine_ips) > 0:
             LOGGER.info("Crawler's server is running and waiting for client connection!")
@@ -88,15 +123,164 @@ class Host:
 
         return True
 
+    def get_frame(self):
+        """get_frame
+
+            Get a frame from client. Responses sent until the next call go to the client of this frame.
+        The time spent by the caller between two calls is the service time of the previous frame.
+        :return: frame or None if all clients closed their connection
+        :rtype: Frame
+        """
+        if self.__serving_since__ is not None:
+            service_time = monotonic() - self.__serving_since__
+            self.service_time += SERVICE_TIME_SMOOTHING * (service_time - self.service_time)
+            self.served_commands += 1
+            self.__serving_since__ = None
+
+        client, frame, received_at = self.__frames__.get()
+        while frame is None:
+            with self.__clients_lock__:
+                if not self.__clients__:
+                    # the connections are gone: keep answering None to any further call, until a client connects
+                    if self.__frames__.empty():
+                        self.__frames__.put_nowait((None, None, None))
+                    return None
+            # a client connected since, the marker of the closed connections is dropped
+            client, frame, received_at = self.__frames__.get()
+
+        self.__current_client__ = client
+        self.current_frame_received_at = received_at
+        self.__serving_since__ = monotonic()
+        return frame
+
+    def __receive__(self, client):
+        """__receive__
+
+            Thread receiving the client's frames into the command queue. The queue is bounded: while it is full,
+        the thread blocks and the client's frames wait in the socket, so a client sending faster than the
+        commands are served is slowed down by TCP instead of growing the queue.
+        :param client: client's connection
+        :return: None
+        """
+        while True:
+            try:
+                frames = client.receive_frames()
+            except (OSError, ConnectionError) as err:
+                LOGGER.warning("Error occurred while receiving from client: {}".format(err))
+                frames = None
+
+            if frames is None:
+                self.__remove_client__(client)
+                return
+
+            received_at = monotonic()
+            # pings are answered before the frames received with them are queued, which may block: the client's
+            # clock estimate does not depend on how far behind the commands are served
+            for frame in frames:
+                if frame.kind == FRAME_KIND_PING:
+                    sent_at, = PING_PAYLOAD.unpack(frame.payload) if len(frame.payload) == PING_PAYLOAD.size else (0.,)
+                    self.__send_frame__(FRAME_KIND_PONG, frame.request_id,
+                                        PONG_PAYLOAD.pack(sent_at, received_at, monotonic()), client=client)
+            for frame in frames:
+                if frame.kind != FRAME_KIND_PING:
+                    self.__frames__.put((client, frame, received_at))
+
+    def __add_client__(self, client):
+        """__add_client__
+
+            Start serving a connected client.
+        :param client: client's connection
+        :return: None
+        """
+        with self.__clients_lock__:
+            if not self.__clients__:
+                self.__serving_since__ = None
+            self.__clients__.append(client)
+            self.__client__ = client
+
+            start_reporting = not self.__reporting_status__
+            self.__reporting_status__ = True
+
+        threading.Thread(target=self.__receive__, args=(client,), daemon=True).start()
+        if start_reporting:
+            threading.Thread(target=self.__report_status__, daemon=True).start()
+
+    def __remove_client__(self, client):
+        """__remove_client__
+
+            Stop serving a disconnected client.
+        :param client: client's connection
+        :return: None
+        """
+        with self.__clients_lock__:
+            if client in self.__clients__:
+                self.__clients__.remove(client)
+            closed = not self.__clients__
+        if closed:
+            # queued after the client's frames; may wait for the frames left to be served, outside the lock
+            self.__frames__.put((None, None, None))
+
+        try:
+            client.close()
+        except OSError:
+            pass
+
+    @property
+    def clients(self):
+        """clients
+
+            Number of connected clients.
+        :rtype: int
+        """
+        return len(self.__clients__)
+
+    def get_status(self):
+        """get_status
+
+            Get host's load: command queue depth, average service time and commands served since last status.
+        :return: host's status
+        :rtype: HostStatus
+        """
+        served = self.served_commands - self.__reported_commands__
+        self.__reported_commands__ = self.served_commands
+        return HostStatus(self.queue_depth, self.service_time, served)
+
+    def send_status(self):
+        """send_status
+
+            Report host's load to the clients, so the clients can adapt their command rate.
+        :return: None
+        """
+        status = self.get_status()
+        payload = STATUS_PAYLOAD.pack(status.queue_depth, status.service_time, status.served)
+        for client in list(self.__clients__):
+            self.__send_frame__(FRAME_KIND_STATUS, NO_REQUEST_ID, payload, client=client)
+
+    def __report_status__(self):
+        """__report_status__
+
+            Thread reporting host's status to the clients every STATUS_PERIOD, as long as any is connected.
+        :return: None
+        """
+        while True:
+            sleep(STATUS_PERIOD)
+            with self.__clients_lock__:
+                if not self.__clients__:
+                    self.__reporting_status__ = False
+                    return
+            self.send_status()
+
     def __get_package_from_client__(self):
         """__get_package_from_client__
 
             Get a package from client.
         :return: package
-        :rtype: bytearray
+        :rtype: bytes
         """
-        package = self.__client__.recv(BUFFER_SIZE)
-        return package
+        frame = self.get_frame()
+        if frame is None:
+            return b''
+        return frame.payload
 
     def echo(self):
         """echo
@@ -126,22 +310,52 @@ class Host:
             encoding = self.encoding
         return bytes(_string, encoding)
 
-    def send_package(self, package):
+    def send_package(self, package, request_id=NO_REQUEST_ID):
         """send_package
 
-            Sends a package to the server.
+            Sends a package to the client.
         :param package: package to be sent
+        :param request_id: ID of the request this package responds to
         :return: True if ok, error occurred otherwise
         """
-        try:
+        if isinstance(package, str) and self.transport.serializes:
             package = self.string_to_bytes(package)
-            self.__client__.send(package)
+        return self.__send_frame__(FRAME_KIND_RESPONSE, request_id, package)
+
+    def __send_frame__(self, kind, request_id, payload, client=None):
+        """__send_frame__
+
+            Send a frame to a client.
+        :param kind: frame kind, one of FRAME_KIND_*
+        :param request_id: ID of the request this frame responds to
+        :param payload: frame's payload
+        :type payload: bytes
+        :param client: client's connection, the client of the last served frame if None
+        :return: True if ok, error occurred otherwise
+        """
+        if client is None:
+            client = self.__current_client__ or self.__client__
+        try:
+            with self.__send_lock__:
+                client.send_frame(kind, request_id, payload)
             return True
         except Exception as err:
             error = "Error occurred while sending package to server: " + str(err)
             LOGGER.warning(error)
             return error
 
+    def send_response(self, request_id, response):
+        """send_response
+
+            Respond to a client's request.
+        :param request_id: ID of the request
+        :type request_id: int
+        :param response: response to be sent
+        :type response: str or bytes
+        :return: True if ok, error occurred otherwise
+        """
+        return self.send_package(response, request_id=request_id)
+
     def __echo__(self):
         """__echo__
 
@@ -150,12 +364,14 @@ class Host:
         """
         lost_connection_packages_counter = 0
         while self.echo_mode_on:
-            incoming_package = self.__get_package_from_client__()
+            incoming_frame = self.get_frame()
+            if incoming_frame is None:
+                incoming_frame = Frame(FRAME_KIND_COMMAND, NO_REQUEST_ID, b'')
 
-            decoded_package = incoming_package.decode(encoding=ENCODING)
+            decoded_package = payload_to_string(incoming_frame.payload)
             LOGGER.info("echo mode - received package: {} - {}".format(decoded_package, len(decoded_package)))
 
-            self.send_package(decoded_package)
+            self.send_package(decoded_package, request_id=incoming_frame.request_id)
 
             if decoded_package == LOST_CONNECTION_PACKAGE:
                 LOGGER.info("echo mode - received null package")
@@ -201,19 +417,43 @@ class Host:
 
             # establish a connection
             self.__client__, client_address = self.__connection__.accept()
-            LOGGER.info("Got a connection request from {}".format(str(client_address[0])))
+            client_name = client_address[0] if isinstance(client_address, tuple) else client_address
+            LOGGER.info("Got a connection request from {}".format(client_name))
 
             client_is_valid = True
             LOGGER.info("Connected to {}!".format(client_address))
 
             if client_is_valid:
-                pass
+                self.__add_client__(self.__client__)
             else:
                 LOGGER.info("Unknown client connection request! Connection refused!")
-                self.__client__.shutdown(py_socket.SHUT_RDWR)
                 self.__client__.close()
                 self.__client__ = None
 
+    def accept_clients(self):
+        """accept_clients
+
+            Keep accepting clients in background, up to max_clients connected at once.
+        :return: None
+        """
+        accept_thread = threading.Thread(target=self.__accept_clients__, daemon=True)
+        accept_thread.start()
+
+    def __accept_clients__(self):
+        """__accept_clients__
+
+            Thread accepting clients.
+        :return: None
+        """
+        while self.server_is_on:
+            if len(self.__clients__) >= self.max_clients:
+                sleep(STATUS_PERIOD)
+                continue
+            try:
+                self.connect_with_client()
+            except OSError:
+                return
+
 
 if __name__ == '__main__':
     h = Host(DEFAULT_IP, DEFAULT_PORT)
@@ -0,0 +1,496 @@
+"""Offline log analyzer
+
+    Summarize the files a test day leaves on the car: the Nucleo's answers (historyFile.txt), the encoder
+and acknowledgement values (Encoder.csv), the odometry samples (logs/odometry_log_*.csv, if logged) and
+the car's logs (logs/crawler_log_*.txt). Files are cut into chunks at line boundaries and the chunks are
+analyzed by a process pool, each one returning a small partial summary, so memory stays constant whatever
+the size of the files. Odometry logs are parsed with NumPy if it is installed; the other files repeat a few distinct
+lines all day long, which are counted first and parsed once each.
+
+    Reported: acknowledgement rates per command, command counts (including the records dropped by the
+log's rate limit), odometry gaps, speed and steering distributions, error counts.
+
+    python -m bfmc.utils.log_analyzer historyFile.txt Encoder.csv logs/
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import re
+
+from collections import Counter
+from time import monotonic
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # numeric files are parsed in plain Python
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+ANALYZER_CHUNK_SIZE = 16 << 20  # bytes
+ODOMETRY_GAP = .5  # seconds without an odometry sample reported as a gap
+
+KIND_HISTORY = 'history'
+KIND_ENCODER = 'encoder'
+KIND_ODOMETRY = 'odometry'
+KIND_LOG = 'log'
+KINDS = (KIND_HISTORY, KIND_ENCODER, KIND_ODOMETRY, KIND_LOG)
+
+# histograms: lowest bin's start, bin width, number of bins; values outside go to the first or last bin
+ROTATION_SPEED_BINS = (-10., .5, 40)  # rotations per second
+SPEED_BINS = (-2., .1, 40)  # m/s
+STEERING_BINS = (-30., 2.5, 24)  # degrees
+
+NUCLEO_ANSWER = re.compile(rb'@([A-Z]{4}):([^;\r\n]*)')
+LOG_COMMANDS = (b'MOVE', b'BRAKE', b'BATCH', b'Sending', b'Maneuver', b'Driver board status', b'CMD1')
+LOG_ERRORS = (b'Error', b'error', b'Traceback', b'Exception', b'exceeded')
+LOG_DROPPED = re.compile(rb'\((\d+) similar messages dropped\)\r?$')
+LOG_DROPPED_MARK = b' similar messages dropped)'
+DIGITS = re.compile(rb'\d+(?:\.\d+)?')
+BIN_TOLERANCE = 1e-9  # values written with 2 decimals, e.g. -0.5, stay in the bin they start
+ERROR_MESSAGE_LENGTH = 100
+
+
+def detect_kind(path):
+    """detect_kind
+
+    :param path: file
+    :return: file's kind, one of KINDS, None if not analyzed
+    :rtype: str
+    """
+    name = os.path.basename(path)
+    if name.startswith('historyFile') and name.endswith('.txt'):
+        return KIND_HISTORY
+    if name.startswith('Encoder') and name.endswith('.csv'):
+        return KIND_ENCODER
+    if name.startswith(('odometry_log', 'Odometry')) and name.endswith('.csv'):
+        return KIND_ODOMETRY
+    if name.startswith('crawler_log') and name.endswith('.txt'):
+        return KIND_LOG
+    return None
+
+
+def find_files(paths):
+    """find_files
+
+    :param paths: files and directories, searched recursively
+    :return: analyzed files and their kinds
+    :rtype: list of tuple
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, names in sorted(os.walk(path)):
+                for name in sorted(names):
+                    kind = detect_kind(name)
+                    if kind is not None:
+                        files.append((os.path.join(directory, name), kind))
+        else:
+            kind = detect_kind(path)
+            if kind is None:
+                raise ValueError('Unknown file kind: {}'.format(path))
+            files.append((path, kind))
+    return files
+
+
+def split_file(path, kind, chunk_size=ANALYZER_CHUNK_SIZE):
+    """split_file
+
+    :return: file's chunks: path, kind, start and end offsets
+    :rtype: list of tuple
+    """
+    size = os.path.getsize(path)
+    return [(path, kind, start, min(start + chunk_size, size)) for start in range(0, size, chunk_size)]
+
+
+def read_chunk(path, start, end):
+    """read_chunk
+
+        Read the lines starting within [start, end).
+    :return: lines, as bytes
+    :rtype: bytes
+    """
+    with open(path, 'rb') as data_file:
+        if start > 0:
+            # the line going on at start belongs to the previous chunk
+            data_file.seek(start - 1)
+            data_file.readline()
+        position = data_file.tell()
+        if position >= end:
+            return b''
+        data = data_file.read(end - position)
+        if data.endswith(b'\n'):
+            return data
+        # the last line goes on after end
+        return data + data_file.readline()
+
+
+def histogram(values, bins, counts=None):
+    """histogram
+
+    :param values: values, a numpy array if numpy is installed and counts is None
+    :param bins: lowest bin's start, bin width, number of bins
+    :param counts: occurrences of each value, once each if None
+    :return: counts per bin
+    :rtype: list of int
+    """
+    low, width, count = bins
+    if numpy is not None and counts is None:
+        indexes = numpy.clip(numpy.floor((values - low) / width + BIN_TOLERANCE), 0, count - 1).astype(int)
+        return numpy.bincount(indexes, minlength=count).tolist()
+    result = [0] * count
+    for index, value in enumerate(values):
+        bin_index = min(max(int(((value - low) / width + BIN_TOLERANCE) // 1), 0), count - 1)
+        result[bin_index] += 1 if counts is None else counts[index]
+    return result
+
+
+def parse_numbers(data):
+    """parse_numbers
+
+    :param data: whitespace separated numbers
+    :type data: bytes
+    :return: numbers, a numpy array if numpy is installed
+    """
+    if numpy is not None:
+        return numpy.fromstring(data.decode('ascii', 'replace'), sep=' ')
+    return [float(value) for value in data.split()]
+
+
+def to_number(value):
+    """to_number
+
+    :param value: text
+    :type value: bytes
+    :return: value as a float, None if not a number
+    """
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+def analyze_history(data):
+    """analyze_history
+
+        The same few answers come back all day long: every distinct line is parsed once.
+    :param data: lines of historyFile.txt
+    :return: partial summary
+    :rtype: dict
+    """
+    responses, acks, values, errors = Counter(), Counter(), Counter(), Counter()
+    for line, count in Counter(data.splitlines()).items():
+        for key, value in NUCLEO_ANSWER.findall(line):
+            key = key.decode('ascii')
+            responses[key] += count
+            if value == b'ack':
+                acks[key] += count
+            elif to_number(value) is not None:
+                values[key] += count
+            else:
+                errors['{}: {}'.format(key, value.decode('ascii', 'replace'))] += count
+    return {'responses': responses, 'acks': acks, 'values': values, 'errors': errors}
+
+
+def analyze_encoder(data):
+    """analyze_encoder
+
+        Values are written with two decimals, so there are few distinct ones: each one is parsed once and
+    weighted by its occurrences.
+    :param data: lines of Encoder.csv
+    :return: partial summary
+    :rtype: dict
+    """
+    occurrences = Counter(data.split())
+    acks = occurrences.pop(b'ack', 0)
+    numbers, counts = [], []
+    for value, count in occurrences.items():
+        number = to_number(value)
+        if number is not None:
+            numbers.append(number)
+            counts.append(count)
+    samples = sum(counts)
+    return {
+        'lines': acks + sum(occurrences.values()),
+        'acks': acks,
+        'samples': samples,
+        'other': sum(occurrences.values()) - samples,
+        'sum': sum(number * count for number, count in zip(numbers, counts)),
+        'histogram': histogram(numbers, ROTATION_SPEED_BINS, counts),
+    }
+
+
+def analyze_odometry(data):
+    """analyze_odometry
+
+    :param data: lines of an odometry log
+    :return: partial summary
+    :rtype: dict
+    """
+    data = re.sub(rb'^[^\d\-\n].*$', b'', data, flags=re.M)  # header
+    numbers = parse_numbers(data.replace(b',', b' '))
+    if numpy is not None:
+        samples = numbers[:len(numbers) - len(numbers) % 3].reshape(-1, 3)
+        times, speeds, steerings = samples[:, 0], samples[:, 1], samples[:, 2]
+        steps = numpy.diff(times)
+        gaps = steps[steps > ODOMETRY_GAP]
+        distance = float(numpy.abs(speeds[:-1] * steps).sum())
+        gap_count, gap_total, gap_max = len(gaps), float(gaps.sum()), float(gaps.max()) if len(gaps) else 0.
+        speed_sum = float(speeds.sum())
+    else:
+        times, speeds, steerings = numbers[0::3], numbers[1::3], numbers[2::3]
+        count = min(len(times), len(speeds), len(steerings))
+        times, speeds, steerings = times[:count], speeds[:count], steerings[:count]
+        steps = [times[index] - times[index - 1] for index in range(1, count)]
+        gaps = [step for step in steps if step > ODOMETRY_GAP]
+        distance = sum(abs(speed * step) for speed, step in zip(speeds, steps))
+        gap_count, gap_total, gap_max = len(gaps), sum(gaps), max(gaps) if gaps else 0.
+        speed_sum = sum(speeds)
+
+    if len(times) == 0:
+        return {'samples': 0}
+    return {
+        'samples': len(times),
+        'first': (float(times[0]), float(speeds[0])),
+        'last': (float(times[-1]), float(speeds[-1])),
+        'gaps': gap_count,
+        'gap_time': gap_total,
+        'max_gap': gap_max,
+        'distance': distance,
+        'speed_sum': speed_sum,
+        'speed_histogram': histogram(speeds, SPEED_BINS),
+        'steering_histogram': histogram(steerings, STEERING_BINS),
+    }
+
+
+def find_lines(data, keywords):
+    """find_lines
+
+        Lines holding any of the keywords, searched with bytes.find: cheaper than a regular expression
+    scanning every line when the lines searched for are rare.
+    :param data: lines
+    :type data: bytes
+    :param keywords: bytes
+    :return: lines, in order, each one once
+    :rtype: list of bytes
+    """
+    starts = {}
+    for keyword in keywords:
+        position = data.find(keyword)
+        while position != -1:
+            start = data.rfind(b'\n', 0, position) + 1
+            end = data.find(b'\n', position)
+            end = len(data) if end == -1 else end
+            starts[start] = end
+            position = data.find(keyword, end)
+    return [data[start:starts[start]] for start in sorted(starts)]
+
+
+def analyze_log(data):
+    """analyze_log
+
+    :param data: lines of a crawler log
+    :return: partial summary
+    :rtype: dict
+    """
+    commands = Counter()
+    for command in LOG_COMMANDS:
+        count = data.count(b'\n' + command) + data.startswith(command)
+        if count:
+            commands[command.decode('ascii')] = count
+    dropped = Counter()
+    for line in find_lines(data, (LOG_DROPPED_MARK,)):
+        match = LOG_DROPPED.search(line)
+        if match is None:
+            continue
+        command = next((command for command in LOG_COMMANDS if line.startswith(command)), None)
+        dropped[command.decode('ascii') if command else 'other'] += int(match.group(1))
+    errors = Counter(DIGITS.sub(b'#', line.strip())[:ERROR_MESSAGE_LENGTH].decode('utf-8', 'replace')
+                     for line in find_lines(data, LOG_ERRORS))
+    return {'lines': data.count(b'\n'), 'commands': commands, 'dropped': dropped, 'errors': errors}
+
+
+ANALYZERS = {
+    KIND_HISTORY: analyze_history,
+    KIND_ENCODER: analyze_encoder,
+    KIND_ODOMETRY: analyze_odometry,
+    KIND_LOG: analyze_log,
+}
+
+
+def analyze_chunk(chunk):
+    """analyze_chunk
+
+        Pool worker.
+    :param chunk: path, kind, start and end offsets
+    :return: chunk and its partial summary
+    :rtype: tuple
+    """
+    path, kind, start, end = chunk
+    return chunk, ANALYZERS[kind](read_chunk(path, start, end))
+
+
+def merge(total, partial):
+    """merge
+
+        Add a partial summary to a total: counters and histograms add up, the other numbers are summed.
+    :return: None
+    """
+    for key, value in partial.items():
+        if isinstance(value, Counter):
+            total.setdefault(key, Counter()).update(value)
+        elif isinstance(value, list):
+            total[key] = [a + b for a, b in zip(total[key], value)] if key in total else list(value)
+        elif isinstance(value, (int, float)):
+            total[key] = total.get(key, 0) + value
+
+
+def merge_odometry(partials):
+    """merge_odometry
+
+        Odometry summaries of a file's chunks, in order: the gaps and distance between chunks are added.
+    :param partials: chunks' partial summaries, by start offset
+    :return: file's summary
+    :rtype: dict
+    """
+    total = {}
+    previous = None
+    for start in sorted(partials):
+        partial = partials[start]
+        if not partial['samples']:
+            continue
+        merge(total, {key: value for key, value in partial.items() if key not in ('first', 'last', 'max_gap')})
+        total['max_gap'] = max(total.get('max_gap', 0.), partial['max_gap'])
+        if previous is not None:
+            step = partial['first'][0] - previous[0]
+            total['distance'] += abs(previous[1] * step)
+            if step > ODOMETRY_GAP:
+                total['gaps'] += 1
+                total['gap_time'] += step
+                total['max_gap'] = max(total['max_gap'], step)
+        else:
+            total['first_time'] = partial['first'][0]
+        previous = partial['last']
+    if previous is not None:
+        total['duration'] = previous[0] - total['first_time']
+    return total
+
+
+def analyze(paths, processes=None, chunk_size=ANALYZER_CHUNK_SIZE):
+    """analyze
+
+    :param paths: files and directories
+    :param processes: pool size, the number of cores if None, no pool if 1
+    :param chunk_size: bytes per chunk
+    :return: summaries by kind, number of files and bytes analyzed
+    :rtype: tuple
+    """
+    files = find_files(paths)
+    chunks = [chunk for path, kind in files for chunk in split_file(path, kind, chunk_size)]
+
+    summaries = {kind: {} for kind in KINDS}
+    odometry_partials = {}
+    if processes == 1:
+        results = map(analyze_chunk, chunks)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(processes)
+        results = pool.imap_unordered(analyze_chunk, chunks)
+    try:
+        for (path, kind, start, _), partial in results:
+            if kind == KIND_ODOMETRY:
+                odometry_partials.setdefault(path, {})[start] = partial
+            else:
+                merge(summaries[kind], partial)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    for partials in odometry_partials.values():
+        merge(summaries[KIND_ODOMETRY], merge_odometry(partials))
+    return summaries, len(files), sum(os.path.getsize(path) for path, _ in files)
+
+
+def format_histogram(counts, bins, unit):
+    """format_histogram
+
+    :return: non-empty bins, e.g. '0.0..0.1 m/s: 12'
+    :rtype: str
+    """
+    low, width, _ = bins
+    return '  '.join('{:g}..{:g} {}: {}'.format(low + index * width, low + (index + 1) * width, unit, count)
+                     for index, count in enumerate(counts) if count)
+
+
+def print_report(summaries):
+    """print_report
+
+    :param summaries: summaries by kind, as returned by analyze
+    :return: None
+    """
+    history = summaries[KIND_HISTORY]
+    if history:
+        print("Nucleo answers:")
+        for key in sorted(history['responses']):
+            responses = history['responses'][key]
+            acks = history.get('acks', Counter())[key]
+            errors = sum(count for error, count in history.get('errors', Counter()).items()
+                         if error.startswith(key + ':'))
+            # values (e.g. ENPB's) are neither acknowledgements nor errors
+            rate = '{:.1f}%'.format(100. * acks / (acks + errors)) if acks + errors else '-'
+            print("  {}: {} answers  {} acks ({} of acks and errors)  {} values  {} errors".format(
+                key, responses, acks, rate, history.get('values', Counter())[key], errors))
+        for error, count in history.get('errors', Counter()).most_common(10):
+            print("    {} x {}".format(count, error))
+
+    encoder = summaries[KIND_ENCODER]
+    if encoder:
+        print("Encoder: {} lines  {} acks  {} samples  {} other".format(
+            encoder['lines'], encoder['acks'], encoder['samples'], encoder['other']))
+        if encoder['samples']:
+            print("  rotation speed: mean {:.2f} rps  {}".format(
+                encoder['sum'] / encoder['samples'],
+                format_histogram(encoder['histogram'], ROTATION_SPEED_BINS, 'rps')))
+
+    odometry = summaries[KIND_ODOMETRY]
+    if odometry:
+        print("Odometry: {} samples over {:.1f} s  distance {:.1f} m".format(
+            odometry['samples'], odometry.get('duration', 0.), odometry['distance']))
+        print("  gaps > {} s: {} ({:.1f} s, longest {:.2f} s)".format(
+            ODOMETRY_GAP, odometry['gaps'], odometry['gap_time'], odometry['max_gap']))
+        print("  speed: mean {:.2f} m/s  {}".format(odometry['speed_sum'] / odometry['samples'],
+                                                    format_histogram(odometry['speed_histogram'], SPEED_BINS, 'm/s')))
+        print("  steering: {}".format(format_histogram(odometry['steering_histogram'], STEERING_BINS, 'deg')))
+
+    log = summaries[KIND_LOG]
+    if log:
+        commands = log.get('commands', Counter()) + log.get('dropped', Counter())
+        print("Logs: {} lines  {} commands logged, {} of them dropped by the rate limit".format(
+            log['lines'], sum(commands.values()), sum(log.get('dropped', Counter()).values())))
+        for command, count in commands.most_common():
+            print("  {}: {}".format(command, count))
+        errors = log.get('errors', Counter())
+        print("  errors: {}".format(sum(errors.values())))
+        for error, count in errors.most_common(10):
+            print("    {} x {}".format(count, error))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BFMC offline log analyzer')
+    parser.add_argument('paths', nargs='+',
+                        help='historyFile.txt, Encoder.csv, odometry and crawler logs or directories')
+    parser.add_argument('--processes', type=int, default=None, help='pool size, the number of cores by default')
+    parser.add_argument('--chunk-size', type=float, default=ANALYZER_CHUNK_SIZE / float(1 << 20), help='MB per chunk')
+    args = parser.parse_args()
+
+    started = monotonic()
+    summaries, number_of_files, number_of_bytes = analyze(args.paths, args.processes,
+                                                          int(args.chunk_size * (1 << 20)))
+    print_report(summaries)
+    elapsed = monotonic() - started
+    megabytes = number_of_bytes / float(1 << 20)
+    print("{} files, {:.1f} MB in {:.2f} s ({:.0f} MB/s)".format(
+        number_of_files, megabytes, elapsed, megabytes / max(elapsed, 1e-9)))
@@ -0,0 +1,207 @@
+"""Logging utilities
+
+    Keep logging off the hot path: records are queued by the calling thread and formatted and written
+(file, console) by a background listener, and chatty call sites (e.g. a log line per command) are rate
+limited. Call sites logging on every command should also check LOGGER.isEnabledFor before formatting.
+"""
+import atexit
+import logging
+import multiprocessing.util
+import os
+import queue
+import threading
+
+from logging.handlers import QueueHandler, QueueListener
+from time import monotonic
+
+LOG_RATE_PERIOD = 1.  # seconds
+LOG_RATE_BURST = 10  # records per call site and period, the others are counted and dropped
+
+
+class RateLimitFilter(logging.Filter):
+    """RateLimitFilter
+
+        Filter letting at most burst records per call site through in every period. The first record let
+    through after a period with drops reports how many were dropped. Warnings and errors always pass.
+    """
+    def __init__(self, period=LOG_RATE_PERIOD, burst=LOG_RATE_BURST, max_level=logging.INFO):
+        """Constructor
+
+        :param period: seconds
+        :param burst: records per call site and period
+        :param max_level: highest level rate limited
+        """
+        logging.Filter.__init__(self)
+        self.period = period
+        self.burst = burst
+        self.max_level = max_level
+
+        self.__lock__ = threading.Lock()
+        # call site: period start, records let through in the period, records dropped
+        self.__sites__ = {}
+        self.dropped = 0
+
+    def filter(self, record):
+        """filter
+
+        :param record: log record
+        :type record: logging.LogRecord
+        :return: True if the record is logged
+        :rtype: bool
+        """
+        if record.levelno > self.max_level:
+            return True
+
+        key = (record.pathname, record.lineno)
+        now = monotonic()
+        with self.__lock__:
+            started, passed, dropped = self.__sites__.get(key, (now, 0, 0))
+            if now - started >= self.period:
+                started, passed = now, 0
+            if passed >= self.burst:
+                self.__sites__[key] = (started, passed, dropped + 1)
+                self.dropped += 1
+                return False
+            self.__sites__[key] = (started, passed + 1, 0)
+
+        if dropped:
+            record.msg = '{} ({} similar messages dropped)'.format(record.msg, dropped)
+        return True
+
+
+class DeferredQueueHandler(QueueHandler):
+    """DeferredQueueHandler
+
+        Queue handler leaving the formatting to the listener's thread. The queue never leaves the process, so
+    records are queued as they are; their arguments must not be modified once logged.
+    """
+    def prepare(self, record):
+        """prepare
+
+        :param record: log record
+        :type record: logging.LogRecord
+        :return: record, as it is
+        :rtype: logging.LogRecord
+        """
+        return record
+
+
+class AsyncLogListener(QueueListener):
+    """AsyncLogListener
+
+        Queue listener writing a logger's queued records to its former handlers, on a background thread. Stopping
+    it flushes the queue and puts the handlers back on the logger.
+    """
+    def __init__(self, logger, queue_handler, handlers):
+        """Constructor
+
+        :param logger: logger whose handlers are behind the queue
+        :type logger: logging.Logger
+        :param queue_handler: logger's queue handler
+        :type queue_handler: DeferredQueueHandler
+        :param handlers: logger's former handlers
+        :type handlers: list of logging.Handler
+        """
+        QueueListener.__init__(self, queue_handler.queue, *handlers, respect_handler_level=True)
+        self.logger = logger
+        self.queue_handler = queue_handler
+        self.running = False
+
+    def start(self):
+        """start
+
+        :return: None
+        """
+        if self.running:
+            return
+        QueueListener.start(self)
+        self.running = True
+
+    def stop(self):
+        """stop
+
+            Write the records left and let the logger write to its handlers directly again.
+        :return: None
+        """
+        if not self.running:
+            return
+        self.running = False
+        for handler in self.handlers:
+            self.logger.addHandler(handler)
+        self.logger.removeHandler(self.queue_handler)
+        QueueListener.stop(self)
+
+
+# listeners started in this process
+__listeners__ = []
+
+
+def start_async_logging(logger, period=LOG_RATE_PERIOD, burst=LOG_RATE_BURST):
+    """start_async_logging
+
+        Move the logger's handlers behind a queue, written to by a background listener, and rate limit its
+    records. Called by the entry points; forked processes get their own queue and listener.
+    :param logger: logger whose handlers become asynchronous
+    :type logger: logging.Logger
+    :param period: rate limit's period, in seconds
+    :param burst: records per call site and period
+    :return: listener, flushed and stopped at exit (see stop_async_logging)
+    :rtype: AsyncLogListener
+    """
+    for listener in __listeners__:
+        if listener.logger is logger and listener.running:
+            return listener
+
+    handlers = list(logger.handlers)
+    for handler in handlers:
+        logger.removeHandler(handler)
+
+    queue_handler = DeferredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(RateLimitFilter(period, burst))
+    logger.addHandler(queue_handler)
+
+    listener = AsyncLogListener(logger, queue_handler, handlers)
+    listener.start()
+    __listeners__.append(listener)
+    return listener
+
+
+def stop_async_logging():
+    """stop_async_logging
+
+        Flush and stop every listener of this process, the loggers write to their handlers directly again.
+    :return: None
+    """
+    while __listeners__:
+        __listeners__.pop().stop()
+
+
+def __restart_in_child__():
+    """__restart_in_child__
+
+        The listeners' threads do not survive a fork: the child gets its own queues and listeners.
+    :return: None
+    """
+    for index, listener in enumerate(__listeners__):
+        if not listener.running:
+            continue
+        listener.queue_handler.queue = queue.SimpleQueue()
+        child_listener = AsyncLogListener(listener.logger, listener.queue_handler, listener.handlers)
+        child_listener.start()
+        __listeners__[index] = child_listener
+
+
+def __stop_at_child_exit__(_):
+    """__stop_at_child_exit__
+
+        multiprocessing's children leave through os._exit, skipping atexit: flush their listeners on exit.
+    :return: None
+    """
+    multiprocessing.util.Finalize(None, stop_async_logging, exitpriority=0)
+
+
+atexit.register(stop_async_logging)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=__restart_in_child__)
+# the function is its own registry key, kept alive by the module
+multiprocessing.util.register_after_fork(__stop_at_child_exit__, __stop_at_child_exit__)
@@ -0,0 +1,240 @@
+import logging
+import threading
+
+from collections import namedtuple
+from time import monotonic
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+MANEUVER_PACKAGE = '$i11$d'  # followed by the maneuver's name
+
+MANEUVER_PARKING = 'parking'
+
+DISTANCE_POLL_PERIOD = .01  # seconds between two checks of the distance travelled
+DISTANCE_STEP_TIMEOUT = 10.  # seconds a distance step may last, braking if the distance is not reached
+
+PARKING_SPEED = .2  # m/s, the cruise speed
+PARKING_STEERING = 22.  # degrees
+
+# step of a maneuver: move (speed in m/s, sent to the Nucleo as it is, steering in degrees) or brake, held for a
+# duration in seconds or until a distance in meters is travelled
+ManeuverStep = namedtuple('ManeuverStep', ['speed', 'steering', 'brake', 'duration', 'distance'])
+
+
+def move_for(speed, steering, duration):
+    """move_for
+
+    :param speed: speed, in m/s
+    :param steering: steering, in degrees
+    :param duration: seconds
+    :return: step
+    :rtype: ManeuverStep
+    """
+    return ManeuverStep(float(speed), float(steering), False, float(duration), None)
+
+
+def move_distance(speed, steering, distance, timeout=DISTANCE_STEP_TIMEOUT):
+    """move_distance
+
+    :param speed: speed, in m/s
+    :param steering: steering, in degrees
+    :param distance: meters, measured by the encoder
+    :param timeout: seconds after which the maneuver is aborted
+    :return: step
+    :rtype: ManeuverStep
+    """
+    return ManeuverStep(float(speed), float(steering), False, float(timeout), float(distance))
+
+
+def brake_for(duration=0.):
+    """brake_for
+
+    :param duration: seconds
+    :return: step
+    :rtype: ManeuverStep
+    """
+    return ManeuverStep(0., 0., True, float(duration), None)
+
+
+MANEUVERS = {
+    MANEUVER_PARKING: [
+        move_for(-PARKING_SPEED, PARKING_STEERING, 3.),
+        move_for(-PARKING_SPEED, -PARKING_STEERING, 1.),
+        brake_for(),
+    ],
+}
+
+
+def build_maneuver_package(name=MANEUVER_PARKING):
+    """build_maneuver_package
+
+        Build the RC package starting a maneuver on the car.
+    :param name: maneuver's name, one of MANEUVERS
+    :return: package
+    :rtype: str
+    """
+    return MANEUVER_PACKAGE + name
+
+
+class ManeuverEngine:
+    """ManeuverEngine
+
+        Class used to run maneuvers in background: sequences of steps, each one setting the control loop's
+    setpoint for a while or for a distance. Starting a maneuver or preempting it stops the running one at
+    once; an aborted distance step (e.g. the encoder is silent) brakes.
+    """
+    def __init__(self, control_loop, get_distance=None, maneuvers=None):
+        """Constructor
+
+        :param control_loop: loop whose setpoint is set
+        :type control_loop: ControlLoop
+        :param get_distance: returns the distance travelled so far, in meters; needed by distance steps
+        :param maneuvers: maneuvers by name, MANEUVERS if None
+        """
+        self.control_loop = control_loop
+        self.get_distance = get_distance
+        self.maneuvers = maneuvers if maneuvers is not None else MANEUVERS
+
+        self.__steps__ = None
+        self.__generation__ = 0
+        self.__condition__ = threading.Condition()
+
+        self.current_maneuver = None
+        self.maneuvers_completed = 0
+        self.maneuvers_preempted = 0
+        self.maneuvers_aborted = 0
+
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def start(self, name):
+        """start
+
+            Start a named maneuver, preempting the running one.
+        :param name: one of the engine's maneuvers
+        :return: None
+        """
+        if name not in self.maneuvers:
+            raise ValueError('Unknown maneuver: {}'.format(name))
+        self.start_steps(self.maneuvers[name], name=name)
+
+    def start_steps(self, steps, name=None):
+        """start_steps
+
+            Start a maneuver, preempting the running one.
+        :param steps: maneuver's steps
+        :type steps: list of ManeuverStep
+        :param name: maneuver's name, for the logs
+        :return: None
+        """
+        if self.get_distance is None and any(step.distance is not None for step in steps):
+            raise ValueError('Distance steps need an encoder')
+        LOGGER.info('Maneuver {} started'.format(name))
+        with self.__condition__:
+            if self.__steps__:
+                self.maneuvers_preempted += 1
+            self.__steps__ = list(steps)
+            self.__generation__ += 1
+            self.current_maneuver = name
+            self.__condition__.notify()
+
+    def preempt(self):
+        """preempt
+
+            Stop the running maneuver, leaving the setpoint to the caller.
+        :return: True if a maneuver was running
+        :rtype: bool
+        """
+        with self.__condition__:
+            if not self.__steps__:
+                return False
+            LOGGER.info('Maneuver {} preempted'.format(self.current_maneuver))
+            self.maneuvers_preempted += 1
+            self.__steps__ = None
+            self.__generation__ += 1
+            self.current_maneuver = None
+            self.__condition__.notify()
+            return True
+
+    @property
+    def running(self):
+        """running
+
+        :return: True while a maneuver runs
+        :rtype: bool
+        """
+        return bool(self.__steps__)
+
+    def __apply__(self, step, generation):
+        """__apply__
+
+            Set the setpoint of a step, unless the maneuver was preempted meanwhile.
+        :return: False if preempted
+        :rtype: bool
+        """
+        with self.__condition__:
+            if self.__generation__ != generation:
+                return False
+            if step.brake:
+                self.control_loop.set_brake()
+            else:
+                self.control_loop.set_move(speed=step.speed, steering=step.steering, limited=False)
+            return True
+
+    def __hold__(self, step, generation):
+        """__hold__
+
+            Wait for the step to be over.
+        :return: True once over, False if preempted, None if the distance was not reached in time
+        """
+        deadline = monotonic() + step.duration
+        target = self.get_distance() + step.distance if step.distance is not None else None
+        with self.__condition__:
+            while self.__generation__ == generation:
+                if target is not None and self.get_distance() >= target:
+                    return True
+                delay = deadline - monotonic()
+                if delay <= 0:
+                    return True if target is None else None
+                if target is not None:
+                    delay = min(delay, DISTANCE_POLL_PERIOD)
+                self.__condition__.wait(delay)
+        return False
+
+    def __run__(self):
+        """__run__
+
+            Thread running the maneuvers.
+        :return: None
+        """
+        while True:
+            with self.__condition__:
+                while not self.__steps__:
+                    self.__condition__.wait()
+                steps = self.__steps__
+                generation = self.__generation__
+                name = self.current_maneuver
+
+            for step in steps:
+                if not self.__apply__(step, generation):
+                    break
+                held = self.__hold__(step, generation)
+                if held is None:
+                    LOGGER.warning('Maneuver {} aborted: distance not reached in time!'.format(name))
+                    with self.__condition__:
+                        if self.__generation__ == generation:
+                            self.control_loop.set_brake()
+                            self.maneuvers_aborted += 1
+                            self.__steps__ = None
+                            self.current_maneuver = None
+                    break
+                if not held:
+                    break
+            else:
+                with self.__condition__:
+                    if self.__generation__ == generation:
+                        LOGGER.info('Maneuver {} done'.format(name))
+                        self.__steps__ = None
+                        self.current_maneuver = None
+                        self.maneuvers_completed += 1
@@ -0,0 +1,269 @@
+"""Odometry
+
+    Dead-reckoning of the car's pose from the encoder's speed (ENPB) and the steering last written to
+the Nucleo, with a kinematic bicycle model. Odometry updates the pose in O(1) per sample; the same
+integration is available in batch (vectorized if numpy is installed) to recompute a drive from an
+odometry log.
+"""
+import logging
+import math
+import os
+
+from collections import namedtuple
+from time import gmtime, monotonic, strftime
+
+try:
+    import numpy
+except ImportError:
+    numpy = None  # batch recomputation falls back to plain Python
+
+from bfmc.utils.encoder import ENCODER_DISTANCE_PER_ROTATION, EncoderOdometer
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+WHEELBASE = .26  # meters between the axles: calibrate on the car
+
+ODOMETRY_LOG_HEADER = 'time,speed,steering\n'
+ODOMETRY_LOG_NAME = 'odometry_log_{}.csv'  # per run, named after its start time like the crawler's logs
+
+# x, y in meters, heading in radians, distance travelled in meters, speed in m/s, steering in degrees,
+# monotonic time of the latest sample
+Pose = namedtuple('Pose', ['x', 'y', 'heading', 'distance', 'speed', 'steering', 'updated_at'])
+
+
+def integrate_arc(x, y, heading, speed, steering, dt, wheelbase=WHEELBASE):
+    """integrate_arc
+
+        Move along the arc driven at a constant speed and steering for dt seconds.
+    :param x: start position, in meters
+    :param y: start position, in meters
+    :param heading: start heading, in radians
+    :param speed: speed, in m/s, negative when reversing
+    :param steering: steering, in degrees
+    :param dt: seconds
+    :param wheelbase: meters between the axles
+    :return: end x, y and heading
+    :rtype: tuple
+    """
+    travelled = speed * dt
+    turn = travelled * math.tan(math.radians(steering)) / wheelbase
+    half_turn = turn / 2.
+    # chord of the arc, along its middle heading
+    chord = travelled * math.sin(half_turn) / half_turn if half_turn else travelled
+    middle_heading = heading + half_turn
+    return x + chord * math.cos(middle_heading), y + chord * math.sin(middle_heading), heading + turn
+
+
+class Odometry(EncoderOdometer):
+    """Odometry
+
+        Class used to keep the car's pose up to date, one encoder sample or steering change at a time.
+    The speed and steering of a sample hold until the next one. The latest pose is a snapshot, replaced
+    on every update and readable without locking.
+    """
+    def __init__(self, wheelbase=WHEELBASE, distance_per_rotation=ENCODER_DISTANCE_PER_ROTATION, log_path=None):
+        """Constructor
+
+        :param wheelbase: meters between the axles
+        :param distance_per_rotation: meters travelled per published rotation
+        :param log_path: file every sample is logged to (see load_odometry_log), not logged if None
+        """
+        EncoderOdometer.__init__(self, distance_per_rotation)
+        self.wheelbase = wheelbase
+        self.pose = Pose(0., 0., 0., 0., 0., 0., None)
+
+        self.__log__ = None
+        if log_path is not None:
+            self.__log__ = open(log_path, 'w')
+            self.__log__.write(ODOMETRY_LOG_HEADER)
+
+    def __advance__(self, now, speed, steering):
+        """__advance__
+
+            Integrate the current pose up to now and switch to a new speed and steering; the lock is held
+        by the caller.
+        :return: None
+        """
+        pose = self.pose
+        x, y, heading = pose.x, pose.y, pose.heading
+        distance = pose.distance
+        if pose.updated_at is not None:
+            dt = now - pose.updated_at
+            x, y, heading = integrate_arc(x, y, heading, pose.speed, pose.steering, dt, self.wheelbase)
+            distance += abs(pose.speed) * dt
+        self.pose = Pose(x, y, heading, distance, speed, steering, now)
+
+        if self.__log__ is not None:
+            self.__log__.write('{:.6f},{:.4f},{:.2f}\n'.format(now, speed, steering))
+
+    def update(self, speed, now=None):
+        """update
+
+            New encoder sample.
+        :param speed: speed, in m/s
+        :param now: monotonic time of the measurement, read from the clock if None
+        :return: None
+        """
+        if now is None:
+            now = monotonic()
+        with self.__lock__:
+            self.__advance__(now, speed, self.pose.steering)
+            self.speed = speed
+            self.updated_at = now
+            self.distance = self.pose.distance
+            self.messages += 1
+
+    def set_steering(self, steering, now=None):
+        """set_steering
+
+            New steering written to the Nucleo.
+        :param steering: steering, in degrees
+        :param now: monotonic time of the write, read from the clock if None
+        :return: None
+        """
+        if now is None:
+            now = monotonic()
+        with self.__lock__:
+            self.__advance__(now, self.pose.speed, float(steering))
+
+    def on_output(self, braking, speed, steering):
+        """on_output
+
+            Control loop's output callback.
+        :param braking: True if braking
+        :param speed: speed written
+        :param steering: steering written, in degrees
+        :return: None
+        """
+        if steering != self.pose.steering:
+            self.set_steering(steering)
+
+    def reset(self, x=0., y=0., heading=0.):
+        """reset
+
+            Set the pose, e.g. on a known position; the distance travelled is kept.
+        :param x: meters
+        :param y: meters
+        :param heading: radians
+        :return: None
+        """
+        with self.__lock__:
+            pose = self.pose
+            self.pose = Pose(float(x), float(y), float(heading), pose.distance, pose.speed, pose.steering,
+                             pose.updated_at if pose.updated_at is not None else monotonic())
+
+    def get_pose(self, now=None):
+        """get_pose
+
+        :param now: monotonic time, read from the clock if None
+        :return: pose extrapolated up to now at the latest speed and steering
+        :rtype: Pose
+        """
+        pose = self.pose
+        if pose.updated_at is None:
+            return pose
+        if now is None:
+            now = monotonic()
+        dt = now - pose.updated_at
+        x, y, heading = integrate_arc(pose.x, pose.y, pose.heading, pose.speed, pose.steering, dt,
+                                      self.wheelbase)
+        return Pose(x, y, heading, pose.distance + abs(pose.speed) * dt, pose.speed, pose.steering, now)
+
+    def get_distance(self, now=None):
+        """get_distance
+
+        :param now: monotonic time, read from the clock if None
+        :return: distance travelled so far, extrapolated at the latest speed, in meters
+        :rtype: float
+        """
+        pose = self.pose
+        if pose.updated_at is None:
+            return pose.distance
+        if now is None:
+            now = monotonic()
+        return pose.distance + abs(pose.speed) * (now - pose.updated_at)
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        if self.__log__ is not None:
+            self.__log__.close()
+            self.__log__ = None
+
+
+def new_odometry_log_path(folder):
+    """new_odometry_log_path
+
+    :param folder: logs' folder
+    :return: path of a new odometry log in the folder, named after the current time
+    :rtype: str
+    """
+    return os.path.join(folder, ODOMETRY_LOG_NAME.format(strftime("%Y_%m_%d_%H_%M_%S", gmtime())))
+
+
+def load_odometry_log(path):
+    """load_odometry_log
+
+    :param path: log written by Odometry
+    :return: times, speeds and steerings, numpy arrays if numpy is installed
+    :rtype: tuple
+    """
+    if numpy is not None:
+        data = numpy.loadtxt(path, delimiter=',', skiprows=1, ndmin=2)
+        return data[:, 0], data[:, 1], data[:, 2]
+
+    times, speeds, steerings = [], [], []
+    with open(path) as log:
+        next(log)
+        for line in log:
+            time, speed, steering = line.split(',')
+            times.append(float(time))
+            speeds.append(float(speed))
+            steerings.append(float(steering))
+    return times, speeds, steerings
+
+
+def compute_poses(times, speeds, steerings, wheelbase=WHEELBASE, x=0., y=0., heading=0.):
+    """compute_poses
+
+        Recompute the poses of a whole drive at once, with the same integration as Odometry: the speed and
+    steering of a sample hold until the next one.
+    :param times: samples' times, in seconds
+    :param speeds: speeds, in m/s
+    :param steerings: steerings, in degrees
+    :param wheelbase: meters between the axles
+    :param x: start position, in meters
+    :param y: start position, in meters
+    :param heading: start heading, in radians
+    :return: x, y and heading at every sample, numpy arrays if numpy is installed
+    :rtype: tuple
+    """
+    if len(times) == 0:
+        return [], [], []
+
+    if numpy is None:
+        xs, ys, headings = [x], [y], [heading]
+        for index in range(1, len(times)):
+            x, y, heading = integrate_arc(x, y, heading, speeds[index - 1], steerings[index - 1],
+                                          times[index] - times[index - 1], wheelbase)
+            xs.append(x)
+            ys.append(y)
+            headings.append(heading)
+        return xs, ys, headings
+
+    times = numpy.asarray(times, dtype=float)
+    speeds = numpy.asarray(speeds, dtype=float)
+    steerings = numpy.asarray(steerings, dtype=float)
+
+    travelled = speeds[:-1] * numpy.diff(times)
+    turns = travelled * numpy.tan(numpy.radians(steerings[:-1])) / wheelbase
+    headings = heading + numpy.concatenate(([0.], numpy.cumsum(turns)))
+    # numpy's sinc is sin(pi x) / (pi x)
+    chords = travelled * numpy.sinc(turns / 2. / numpy.pi)
+    middle_headings = headings[:-1] + turns / 2.
+    xs = x + numpy.concatenate(([0.], numpy.cumsum(chords * numpy.cos(middle_headings))))
+    ys = y + numpy.concatenate(([0.], numpy.cumsum(chords * numpy.sin(middle_headings))))
+    return xs, ys, headings
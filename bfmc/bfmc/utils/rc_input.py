@@ -1,14 +1,20 @@
 import logging
 import pygame
 
-from time import sleep
+from time import monotonic, sleep
 
+from bfmc.utils.rc_recording import EVENT_AXIS, EVENT_BUTTON_DOWN, EVENT_BUTTON_UP, JoystickRecorder
 from bfmc.utils.rc_utils import *
 
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
 
+JOYSTICK_EVENTS = (pygame.JOYAXISMOTION, pygame.JOYBUTTONDOWN, pygame.JOYBUTTONUP)
+JOYSTICK_DEVICE_EVENTS = (pygame.JOYDEVICEADDED, pygame.JOYDEVICEREMOVED)
+# only the events handled wake the input wait up: the joystick's, closing the window and hot-plugging
+HANDLED_EVENTS = JOYSTICK_EVENTS + JOYSTICK_DEVICE_EVENTS + (pygame.QUIT,)
+
 
 class RemoteControl:
     """RemoteControl
@@ -21,6 +27,17 @@ class RemoteControl:
         """
         self.rc_driver_enabled = False
         self.joystick = None
+        self.rc_device = None
+        # the window was closed: the RC terminates
+        self.quit_requested = False
+
+        # input state, updated incrementally from the joystick's events
+        self.axes = []
+        self.buttons = []
+        self.__presses__ = []
+        self.__instance_id__ = None
+        self.last_event_time = None
+        self.recorder = None
 
         self.__init_rc_drivers__()
 
@@ -64,6 +81,8 @@ class RemoteControl:
                     return False
 
                 load_rc_configuration(rc_device)
+                self.rc_device = rc_device
+                self.__init_input_state__()
 
                 LOGGER.info("Successfully initialized {}!".format(rc_device))
                 return True
@@ -122,6 +141,158 @@ class RemoteControl:
 
             sleep(.05)
 
+    def __init_input_state__(self):
+        """__init_input_state__
+
+            Read the joystick's state once and only listen to its events from now on.
+        :return: None
+        """
+        pygame.event.pump()
+        self.axes = [self.joystick.get_axis(axis_index) for axis_index in range(self.joystick.get_numaxes())]
+        self.buttons = [self.joystick.get_button(button_index)
+                        for button_index in range(self.joystick.get_numbuttons())]
+        self.__presses__ = []
+        get_instance_id = getattr(self.joystick, 'get_instance_id', None)
+        self.__instance_id__ = get_instance_id() if get_instance_id else self.joystick.get_id()
+
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(HANDLED_EVENTS)
+        pygame.event.clear()
+
+    def get_axis(self, axis_index):
+        """get_axis
+
+        :param axis_index: axis' index
+        :return: axis' latest position, in range [-1, 1]
+        :rtype: float
+        """
+        return self.axes[axis_index]
+
+    def get_button(self, button_index):
+        """get_button
+
+        :param button_index: button's index
+        :return: 1 while the button is held, 0 otherwise
+        :rtype: int
+        """
+        return self.buttons[button_index]
+
+    def take_presses(self):
+        """take_presses
+
+            Get the buttons pressed since the last call, so a short press is never missed.
+        :return: pressed buttons' indexes, in order
+        :rtype: list of int
+        """
+        presses = self.__presses__
+        self.__presses__ = []
+        return presses
+
+    def wait_input(self, timeout=None):
+        """wait_input
+
+            Block until the joystick's state changes, then apply all its pending events.
+        :param timeout: seconds to wait at most, forever if None
+        :return: True if the state changed, False on timeout
+        :rtype: bool
+        """
+        if timeout is None:
+            event = pygame.event.wait()
+        elif timeout <= 0:
+            event = pygame.event.poll()
+        else:
+            # the wait times out in whole milliseconds: round up, never wake up before the deadline
+            event = pygame.event.wait(int(timeout * 1000) + 1)
+
+        changed = self.__apply_event__(event)
+        for event in pygame.event.get():
+            changed = self.__apply_event__(event) or changed
+        if changed:
+            self.last_event_time = monotonic()
+        return changed
+
+    def __apply_event__(self, event):
+        """__apply_event__
+
+        :param event: pygame event
+        :return: True if it changed the joystick's state
+        :rtype: bool
+        """
+        if event.type == pygame.QUIT:
+            self.quit_requested = True
+            return True
+        if event.type in JOYSTICK_DEVICE_EVENTS:
+            return self.__apply_device_event__(event)
+        if event.type not in JOYSTICK_EVENTS:
+            return False
+        if getattr(event, 'instance_id', getattr(event, 'joy', None)) != self.__instance_id__:
+            return False
+
+        if event.type == pygame.JOYAXISMOTION:
+            if self.axes[event.axis] == event.value:
+                return False
+            self.axes[event.axis] = event.value
+            if self.recorder is not None:
+                self.recorder.record(EVENT_AXIS, event.axis, event.value)
+        elif event.type == pygame.JOYBUTTONDOWN:
+            self.buttons[event.button] = 1
+            self.__presses__.append(event.button)
+            if self.recorder is not None:
+                self.recorder.record(EVENT_BUTTON_DOWN, event.button, 1)
+        else:
+            self.buttons[event.button] = 0
+            if self.recorder is not None:
+                self.recorder.record(EVENT_BUTTON_UP, event.button, 0)
+        return True
+
+    def __apply_device_event__(self, event):
+        """__apply_device_event__
+
+            Release every input if the joystick is unplugged, take it back once plugged in again.
+        :param event: JOYDEVICEADDED or JOYDEVICEREMOVED event
+        :return: True if it changed the joystick's state
+        :rtype: bool
+        """
+        if event.type == pygame.JOYDEVICEREMOVED:
+            if self.joystick is None or event.instance_id != self.__instance_id__:
+                return False
+            LOGGER.warning("{} was unplugged!".format(self.rc_device))
+            self.axes = [0.] * len(self.axes)
+            self.buttons = [0] * len(self.buttons)
+            self.__presses__ = []
+            self.joystick = None
+            return True
+
+        if self.joystick is not None or self.rc_device is None:
+            return False
+        joystick = pygame.joystick.Joystick(event.device_index)
+        if joystick.get_name() != self.rc_device:
+            return False
+        LOGGER.info("{} was plugged in again!".format(self.rc_device))
+        self.joystick = joystick
+        self.joystick.init()
+        self.__init_input_state__()
+        return True
+
+    def start_recording(self, path):
+        """start_recording
+
+            Record the joystick's events from now on (see bfmc.utils.rc_recording).
+        :param path: recording's file
+        :return: None
+        """
+        self.stop_recording()
+        self.recorder = JoystickRecorder(path, self.axes, self.buttons)
+
+    def stop_recording(self):
+        """stop_recording
+
+        :return: None
+        """
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
     def __update_rc__(self):
         """
 
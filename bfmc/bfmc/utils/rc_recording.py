@@ -0,0 +1,230 @@
+"""Joystick session recording
+
+    Axis and button events of a drive, stored in a compact binary file: a header giving the number of
+axes and buttons, followed by one fixed size record per event (seconds since the recording started,
+event kind, axis or button index, value). The joystick's state when the recording started is stored as
+the first records, at 0 seconds.
+
+    A recording is replayed by ReplayRemoteControl, which stands in for RemoteControl without pygame or
+a joystick, in real time or faster.
+"""
+import logging
+import struct
+
+from time import monotonic, sleep
+
+from bfmc.utils.rc_utils import START_BUTTON
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+RECORDING_MAGIC = b'BFMCJS01'
+RECORDING_HEADER = struct.Struct('!8sBB')  # magic, number of axes, number of buttons
+RECORDING_EVENT = struct.Struct('!dBBf')  # seconds, kind, index, value
+
+EVENT_AXIS = 0
+EVENT_BUTTON_DOWN = 1
+EVENT_BUTTON_UP = 2
+
+
+class JoystickRecorder:
+    """JoystickRecorder
+
+        Class used to write a joystick session recording.
+    """
+    def __init__(self, path, axes, buttons):
+        """Constructor
+
+        :param path: recording's file
+        :param axes: joystick's axes positions when the recording starts
+        :type axes: list of float
+        :param buttons: joystick's buttons states when the recording starts
+        :type buttons: list of int
+        """
+        self.path = path
+        self.events = 0
+        self.__file__ = open(path, 'wb')
+        self.__start__ = monotonic()
+
+        self.__file__.write(RECORDING_HEADER.pack(RECORDING_MAGIC, len(axes), len(buttons)))
+        for axis_index, value in enumerate(axes):
+            self.record(EVENT_AXIS, axis_index, value, 0.)
+        for button_index, value in enumerate(buttons):
+            if value:
+                self.record(EVENT_BUTTON_DOWN, button_index, 1, 0.)
+
+    def record(self, kind, index, value, elapsed=None):
+        """record
+
+        :param kind: one of EVENT_*
+        :param index: axis or button index
+        :param value: axis position, 1 or 0 for buttons
+        :param elapsed: seconds since the recording started, now if None
+        :return: None
+        """
+        if elapsed is None:
+            elapsed = monotonic() - self.__start__
+        self.__file__.write(RECORDING_EVENT.pack(elapsed, kind, index, value))
+        self.events += 1
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        if self.__file__ is not None:
+            self.__file__.close()
+            self.__file__ = None
+            LOGGER.info("Recorded {} joystick events to {}".format(self.events, self.path))
+
+
+def load_recording(path):
+    """load_recording
+
+    :param path: recording's file
+    :return: number of axes, number of buttons and events (seconds, kind, index, value), in order
+    :rtype: tuple
+    """
+    with open(path, 'rb') as recording:
+        data = recording.read()
+
+    magic, number_of_axes, number_of_buttons = RECORDING_HEADER.unpack_from(data)
+    if magic != RECORDING_MAGIC:
+        raise ValueError('Not a joystick recording: {}'.format(path))
+
+    events_data = memoryview(data)[RECORDING_HEADER.size:]
+    # a recording cut short (e.g. the RC was killed) is replayed up to its last complete event
+    events_data = events_data[:len(events_data) - len(events_data) % RECORDING_EVENT.size]
+    return number_of_axes, number_of_buttons, list(RECORDING_EVENT.iter_unpack(events_data))
+
+
+class ReplayRemoteControl:
+    """ReplayRemoteControl
+
+        Stand-in for RemoteControl replaying a recording instead of reading a joystick. Time runs speed
+    times faster than during the recording; once the recording is over, the start button is pressed so
+    the RC terminates.
+    """
+    def __init__(self, path, speed=1.):
+        """Constructor
+
+        :param path: recording's file
+        :param speed: replay speed, 1 for real time
+        """
+        self.path = path
+        self.speed = float(speed)
+
+        number_of_axes, number_of_buttons, self.__events__ = load_recording(path)
+        self.axes = [0.] * number_of_axes
+        # the start button is pressed once the recording is over, even if the recorded joystick has fewer buttons
+        self.buttons = [0] * max(number_of_buttons, START_BUTTON + 1)
+        self.__presses__ = []
+        self.__index__ = 0
+        self.__start__ = None
+
+        self.finished = False
+        self.quit_requested = False
+        self.last_event_time = None
+
+    def init_rc_device(self, rc_device=None):
+        """init_rc_device
+
+        :param rc_device: ignored, the recording is the device
+        :return: True
+        :rtype: bool
+        """
+        LOGGER.info("Replaying {} joystick events from {} at {}x".format(len(self.__events__), self.path,
+                                                                         self.speed))
+        return True
+
+    def get_axis(self, axis_index):
+        """get_axis
+
+        :param axis_index: axis' index
+        :return: axis' latest position, in range [-1, 1], 0 if the recorded joystick has no such axis
+        :rtype: float
+        """
+        if axis_index >= len(self.axes):
+            return 0.
+        return self.axes[axis_index]
+
+    def get_button(self, button_index):
+        """get_button
+
+        :param button_index: button's index
+        :return: 1 while the button is held, 0 otherwise or if the recorded joystick has no such button
+        :rtype: int
+        """
+        if button_index >= len(self.buttons):
+            return 0
+        return self.buttons[button_index]
+
+    def take_presses(self):
+        """take_presses
+
+        :return: pressed buttons' indexes since the last call, in order
+        :rtype: list of int
+        """
+        presses = self.__presses__
+        self.__presses__ = []
+        return presses
+
+    def wait_input(self, timeout=None):
+        """wait_input
+
+            Wait for the next recorded events to be due, then apply all the events due.
+        :param timeout: seconds to wait at most, forever if None
+        :return: True if the state changed, False on timeout
+        :rtype: bool
+        """
+        now = monotonic()
+        if self.__start__ is None:
+            self.__start__ = now
+
+        if self.__index__ >= len(self.__events__):
+            if not self.finished:
+                self.finished = True
+                self.buttons[START_BUTTON] = 1
+                self.__presses__.append(START_BUTTON)
+                self.last_event_time = now
+                return True
+            if timeout:
+                sleep(timeout)
+            return False
+
+        due = self.__start__ + self.__events__[self.__index__][0] / self.speed
+        if timeout is not None and due > now + timeout:
+            sleep(max(timeout, 0.))
+            return False
+        if due > now:
+            sleep(due - now)
+
+        now = monotonic()
+        elapsed = (now - self.__start__) * self.speed
+        while self.__index__ < len(self.__events__) and self.__events__[self.__index__][0] <= elapsed:
+            _, kind, index, value = self.__events__[self.__index__]
+            self.__index__ += 1
+            if kind == EVENT_AXIS:
+                self.axes[index] = value
+            elif kind == EVENT_BUTTON_DOWN:
+                self.buttons[index] = 1
+                self.__presses__.append(index)
+            else:
+                self.buttons[index] = 0
+        self.last_event_time = now
+        return True
+
+    def start_recording(self, path):
+        """start_recording
+
+        :param path: ignored, a replay is not recorded again
+        :return: None
+        """
+        LOGGER.warning("A replayed session is not recorded again!")
+
+    def stop_recording(self):
+        """stop_recording
+
+        :return: None
+        """
+        pass
@@ -0,0 +1,280 @@
+import logging
+
+from time import monotonic, sleep
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+SAMPLE_PERIOD = .005  # seconds between two joystick samples
+SEND_PERIOD = .025  # seconds between two regular send slots
+REFRESH_PERIOD = .25  # seconds after which an unchanged move is sent again as keep-alive
+# seconds after which a held brake is sent again: the baseline RC's period, braking is the safety keep-alive
+BRAKE_REFRESH_PERIOD = .05
+
+SIGNIFICANT_POWER_CHANGE = 10
+SIGNIFICANT_STEERING_CHANGE = 4
+
+MAX_SEND_PERIOD = .4  # seconds
+MAX_RESOLUTION = 8
+
+QUEUE_HIGH_WATERMARK = 2  # queued commands on the car above which the RC slows down
+QUEUE_LOW_WATERMARK = 0  # queued commands on the car at or below which the RC speeds up again
+CAPACITY_HEADROOM = 1.25  # keep the send period this much above the car's service time
+SPEED_UP_STEP = .005  # seconds removed from the send period per idle status
+
+
+class MoveSendScheduler:
+    """MoveSendScheduler
+
+        Class used to decide when RC move commands are sent.
+    Joystick samples are taken on a fixed, drift-free timeline or on input events (see time_to_next_send).
+    A significant change of an axis is sent immediately, a small change waits for the next regular send slot
+    and an unchanged command is only repeated as a keep-alive every refresh period. Commands other than moves
+    (e.g. braking) are repeated every brake refresh period and never throttled.
+    """
+    def __init__(self, sample_period=SAMPLE_PERIOD, send_period=SEND_PERIOD, refresh_period=REFRESH_PERIOD,
+                 significant_power_change=SIGNIFICANT_POWER_CHANGE,
+                 significant_steering_change=SIGNIFICANT_STEERING_CHANGE, brake_refresh_period=BRAKE_REFRESH_PERIOD):
+        """Constructor
+
+        :param sample_period: seconds between two joystick samples
+        :param send_period: seconds between two regular send slots
+        :param refresh_period: seconds after which an unchanged move is sent again
+        :param significant_power_change: power change sent without waiting for a send slot
+        :param significant_steering_change: steering change sent without waiting for a send slot
+        :param brake_refresh_period: seconds after which an unchanged command other than a move is sent again
+        """
+        self.sample_period = sample_period
+        self.send_period = send_period
+        self.refresh_period = refresh_period
+        self.brake_refresh_period = brake_refresh_period
+        self.significant_power_change = significant_power_change
+        self.significant_steering_change = significant_steering_change
+
+        self.__start__ = monotonic()
+        self.__tick__ = 0
+        self.__next_slot__ = self.__start__
+
+        self.last_sent = None
+        self.last_sent_time = None
+        self.__pending__ = False
+
+        self.min_send_interval = 0.
+
+        self.sent_packages = 0
+        self.suppressed_packages = 0
+        self.missed_ticks = 0
+
+    def reset(self):
+        """reset
+
+            Restart the timeline and forget the last sent command.
+        :return: None
+        """
+        self.__start__ = monotonic()
+        self.__tick__ = 0
+        self.__next_slot__ = self.__start__
+        self.last_sent = None
+        self.last_sent_time = None
+        self.__pending__ = False
+
+    def should_send(self, command, now=None):
+        """should_send
+
+            Decide whether a sampled command has to be sent now.
+        :param command: sampled command, a (power, steering) tuple or any other hashable state
+        :param now: current monotonic time, read from the clock if None
+        :return: True if the command has to be sent
+        :rtype: bool
+        """
+        if now is None:
+            now = monotonic()
+
+        slot_due = now >= self.__next_slot__
+
+        if self.last_sent is None:
+            send = True
+        elif command == self.last_sent:
+            send = now - self.last_sent_time >= self.__refresh_period_of__(command)
+        elif self.__is_significant_change__(command):
+            send = True
+        else:
+            send = slot_due
+
+        if send and isinstance(command, tuple) and self.last_sent_time is not None and \
+                now - self.last_sent_time < self.min_send_interval:
+            # moves are throttled by the car's backpressure, a change of command kind (e.g. braking) goes through
+            send = not self.__is_same_kind__(command)
+
+        if slot_due:
+            # regular slots stay on the start-anchored timeline, whatever happens in between
+            elapsed_slots = int((now - self.__start__) / self.send_period) + 1
+            self.__next_slot__ = self.__start__ + elapsed_slots * self.send_period
+
+        if send:
+            self.mark_sent(command, now)
+        else:
+            self.suppressed_packages += 1
+            self.__pending__ = command != self.last_sent
+
+        return send
+
+    def time_to_next_send(self, now=None):
+        """time_to_next_send
+
+            Seconds until an unchanged command has to be sampled again: the next send slot if a change is
+        still waiting to be sent, the keep-alive otherwise. Input events can be awaited meanwhile.
+        :param now: current monotonic time, read from the clock if None
+        :return: seconds, 0 if due now
+        :rtype: float
+        """
+        if self.last_sent is None:
+            return 0.
+        if now is None:
+            now = monotonic()
+
+        if self.__pending__:
+            deadline = max(self.__next_slot__, self.last_sent_time + self.min_send_interval)
+        else:
+            deadline = self.last_sent_time + self.__refresh_period_of__(self.last_sent)
+        return max(0., deadline - now)
+
+    def __refresh_period_of__(self, command):
+        """__refresh_period_of__
+
+        :param command: sampled command
+        :return: seconds after which the command is sent again if unchanged
+        :rtype: float
+        """
+        return self.refresh_period if isinstance(command, tuple) else self.brake_refresh_period
+
+    def mark_sent(self, command, now=None):
+        """mark_sent
+
+            Record a command sent without asking the scheduler.
+        :param command: sent command
+        :param now: current monotonic time, read from the clock if None
+        :return: None
+        """
+        if now is None:
+            now = monotonic()
+        self.last_sent = command
+        self.last_sent_time = now
+        self.__pending__ = False
+        self.sent_packages += 1
+
+    def __is_significant_change__(self, command):
+        """__is_significant_change__
+
+        :param command: sampled command
+        :return: True if the command differs significantly from the last sent one
+        :rtype: bool
+        """
+        try:
+            power, steering = command
+            last_power, last_steering = self.last_sent
+        except (TypeError, ValueError):
+            return True
+
+        return (abs(power - last_power) >= self.significant_power_change or
+                abs(steering - last_steering) >= self.significant_steering_change)
+
+    def __is_same_kind__(self, command):
+        """__is_same_kind__
+
+        :param command: sampled command
+        :return: True if the command is of the same kind as the last sent one
+        :rtype: bool
+        """
+        return isinstance(command, tuple) == isinstance(self.last_sent, tuple)
+
+    def wait_next_sample(self):
+        """wait_next_sample
+
+            Sleep until the next sample tick. Ticks are computed from the start time, so the work done
+        between two ticks does not make the sampling rate drift. Ticks already missed are skipped.
+        :return: None
+        """
+        self.__tick__ += 1
+        deadline = self.__start__ + self.__tick__ * self.sample_period
+        delay = deadline - monotonic()
+
+        if delay > 0:
+            sleep(delay)
+        else:
+            missed = int(-delay / self.sample_period)
+            if missed:
+                self.missed_ticks += missed
+                self.__tick__ += missed
+
+    def log_statistics(self):
+        """log_statistics
+
+        :return: None
+        """
+        LOGGER.info("Move packages sent: {}, suppressed: {}, missed sample ticks: {}".format(
+            self.sent_packages, self.suppressed_packages, self.missed_ticks))
+
+
+class RateController:
+    """RateController
+
+        Class used to adapt the RC's command rate to the car's capacity.
+    The car reports its command queue depth and service time; when commands pile up, the send period is
+    doubled and the axis resolution made coarser, when the queue is empty they slowly come back.
+    """
+    def __init__(self, scheduler, max_send_period=MAX_SEND_PERIOD, max_resolution=MAX_RESOLUTION):
+        """Constructor
+
+        :param scheduler: scheduler whose rate is adapted
+        :type scheduler: MoveSendScheduler
+        :param max_send_period: slowest send period, in seconds
+        :param max_resolution: coarsest axis resolution
+        """
+        self.scheduler = scheduler
+        self.base_send_period = scheduler.send_period
+        self.max_send_period = max_send_period
+        self.max_resolution = max_resolution
+
+        self.resolution = 1
+        self.last_status = None
+
+    def on_status(self, status):
+        """on_status
+
+            Adapt the rate to a status reported by the car.
+        :param status: car's status
+        :type status: HostStatus
+        :return: None
+        """
+        self.last_status = status
+        send_period = self.scheduler.send_period
+
+        if status.queue_depth > QUEUE_HIGH_WATERMARK:
+            send_period *= 2
+        elif status.queue_depth <= QUEUE_LOW_WATERMARK:
+            send_period -= SPEED_UP_STEP
+
+        send_period = max(send_period, self.base_send_period, status.service_time * CAPACITY_HEADROOM)
+        send_period = min(send_period, self.max_send_period)
+
+        if send_period != self.scheduler.send_period:
+            LOGGER.debug("Send period: {:.3f}s (car queue: {}, service time: {:.4f}s)".format(
+                send_period, status.queue_depth, status.service_time))
+
+        self.scheduler.send_period = send_period
+        self.scheduler.min_send_interval = send_period if send_period > self.base_send_period else 0.
+        self.resolution = min(self.max_resolution, max(1, int(round(send_period / self.base_send_period))))
+
+    def quantize(self, value):
+        """quantize
+
+            Round an axis value to the current resolution.
+        :param value: axis value
+        :type value: int
+        :return: quantized value
+        :rtype: int
+        """
+        if self.resolution == 1:
+            return value
+        return int(round(value / self.resolution)) * self.resolution
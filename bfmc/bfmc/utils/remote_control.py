@@ -1,46 +1,62 @@
+import argparse
 import logging
-import threading
 
-from time import sleep
+from time import monotonic, sleep
 
-from bfmc.utils.client import Client
-from bfmc.utils.rc_input import RemoteControl
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import RESPONSE_UNSUPPORTED
+from bfmc.utils.log_utils import start_async_logging
+from bfmc.utils.rc_recording import ReplayRemoteControl
+from bfmc.utils.rc_scheduler import MoveSendScheduler, RateController
 from bfmc.utils.rc_utils import BRAKE_BUTTON, POWER_AXIS, STEERING_AXIS, START_BUTTON, TURN_LEFT_SIGNAL_BUTTON, \
     TURN_RIGHT_SIGNAL_BUTTON, HAZARD_LIGHTS_BUTTON, LIGHTS_BUTTON, SPECIAL_CMD_BUTTON
-from bfmc.utils.spi import build_spi_command
+from bfmc.utils.maneuvers import MANEUVER_PARKING, build_maneuver_package
+from bfmc.utils.driver.patterns import LIGHT_PATTERN_BLINK, build_light_pattern_package
+from bfmc.utils.spi import LIGHTS_STATE_OFF, SPI_CMD_LIGHTS, SPI_CMD_TURN_SIGNALS, TURNING_SIGNAL_REQUEST_HAZARD, \
+    TURNING_SIGNAL_REQUEST_LEFT, TURNING_SIGNAL_REQUEST_OFF, TURNING_SIGNAL_REQUEST_RIGHT, build_spi_package
+from bfmc.utils.stats import format_latency_summary
+from bfmc.utils.timers import TimerService
 
 LOGGER = logging.getLogger('bfmc')
 LOGGER.setLevel(logging.INFO)
 
-LIGHTS_STATE_OFF = 0
-LIGHTS_STATE_DIPPED_BEAM = 1
-LIGHTS_STATE_HIGH_BEAM = 2
-LIGHTS_STATE_RESET = 3
+BRAKE_COMMAND = 'brake'
 
-TURNING_SIGNAL_REQUEST_OFF = 0
-TURNING_SIGNAL_REQUEST_LEFT = 1
-TURNING_SIGNAL_REQUEST_RIGHT = 2
-TURNING_SIGNAL_REQUEST_HAZARD = 3
+LIGHTS_CHANGE_HOLD_OFF = .35  # seconds
+TURNING_LIGHTS_CHANGE_HOLD_OFF = .35  # seconds
+SPECIAL_CMD_HOLD_OFF = .5  # seconds
 
 
 class RC:
     """
 
     """
-    def __init__(self, ip, port, rc_device):
+    def __init__(self, ip, port, rc_device, transport=None, record=None, replay=None, replay_speed=1.):
         """
 
         :param ip:
         :param port:
         :param rc_device:
+        :param transport: car's transport (see bfmc.utils.transport), TCP if None
+        :param record: file the joystick's events are recorded to, not recorded if None
+        :param replay: recording replayed instead of reading the joystick, which needs neither pygame nor
+        a joystick
+        :param replay_speed: replay speed, 1 for real time
         """
-        self.device = RemoteControl()
+        if replay:
+            self.device = ReplayRemoteControl(replay, replay_speed)
+        else:
+            # pygame is only needed with a real joystick
+            from bfmc.utils.rc_input import RemoteControl
+            self.device = RemoteControl()
         self.valid = self.device.init_rc_device(rc_device)
         if not self.valid:
             LOGGER.info('Remote control aborted!')
             return
+        if record:
+            self.device.start_recording(record)
 
-        self.connection = Client(ip, port)
+        self.connection = AsyncClient(ip, port, transport=transport)
 
         self.lights_state = LIGHTS_STATE_OFF
         self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
@@ -48,54 +64,106 @@ class RC:
         self.lights_change_allowed = True
         self.turning_lights_change_allowed = True
         self.special_cmd_allowed = True
-
-    def unlock_lights_change(self):
-        """
-
-        :return:
+        # debounce hold-offs, all on one thread
+        self.timers = TimerService()
+        # hold-offs' end, by the flag they lock
+        self.__hold_offs__ = {}
+        # toggles pressed and not applied yet (e.g. during their hold-off), applied once allowed
+        self.__deferred_presses__ = set()
+        # commands the car answered as unsupported, warned about once
+        self.unsupported_packages = set()
+
+    def unlock_lights_change(self, delay=LIGHTS_CHANGE_HOLD_OFF):
+        """unlock_lights_change
+
+            Allow the next lights change once the hold-off elapsed.
+        :param delay: seconds
+        :return: None
         """
-        unlock_thread = threading.Thread(target=self.__unlock_lights_change_thread__)
-        unlock_thread.start()
+        self.__hold_offs__['lights_change_allowed'] = monotonic() + delay
+        self.timers.call_later(delay, setattr, self, 'lights_change_allowed', True)
 
-    def __unlock_lights_change_thread__(self, delay=0.35):
-        """__unlock_lights_change_thread__
+    def unlock_turning_lights_change(self, delay=TURNING_LIGHTS_CHANGE_HOLD_OFF):
+        """unlock_turning_lights_change
 
-        :return:
+            Allow the next turn signal change once the hold-off elapsed.
+        :param delay: seconds
+        :return: None
         """
-        sleep(delay)
-        self.lights_change_allowed = True
+        self.__hold_offs__['turning_lights_change_allowed'] = monotonic() + delay
+        self.timers.call_later(delay, setattr, self, 'turning_lights_change_allowed', True)
 
-    def unlock_turning_lights_change(self):
-        """unlock_turning_lights_change
+    def unlock_special_cmd(self, delay=SPECIAL_CMD_HOLD_OFF):
+        """unlock_special_cmd
 
-        :return:
+            Allow the next special command once the hold-off elapsed.
+        :param delay: seconds
+        :return: None
         """
-        unlock_thread = threading.Thread(target=self.__unlock_turning_lights_change_thread__)
-        unlock_thread.start()
+        self.__hold_offs__['special_cmd_allowed'] = monotonic() + delay
+        self.timers.call_later(delay, setattr, self, 'special_cmd_allowed', True)
 
-    def __unlock_turning_lights_change_thread__(self, delay=0.35):
-        """__unlock_turning_lights_change_thread__
+    def send_car_command(self, package):
+        """send_car_command
 
-        :return:
+            Send a command not every car runtime handles (e.g. maneuvers and light patterns, answered as
+        unsupported by bfmc.process_runtime), warning if the car does not support it.
+        :param package: package to be sent
+        :return: None
         """
-        sleep(delay)
-        self.turning_lights_change_allowed = True
+        future = self.connection.send_package_async(package)
+        future.add_done_callback(lambda done: self.__check_support__(package, done))
 
-    def unlock_special_cmd(self):
-        """unlock_turning_lights_change
+    def __check_support__(self, package, future):
+        """__check_support__
 
-        :return:
+        :param package: package sent
+        :param future: its response's future
+        :return: None
         """
-        unlock_thread = threading.Thread(target=self.__unlock_special_cmd_thread__)
-        unlock_thread.start()
+        if future.exception() is not None or future.result() != RESPONSE_UNSUPPORTED:
+            return
+        if package not in self.unsupported_packages:
+            self.unsupported_packages.add(package)
+            LOGGER.warning("The car does not support {}, its runtime only handles moves, brakes and SPI frames!"
+                           .format(package))
 
-    def __unlock_special_cmd_thread__(self, delay=1):
-        """__unlock_special_cmd_thread__
+    def time_to_deferred_presses(self):
+        """time_to_deferred_presses
 
-        :return:
+        :return: seconds until a deferred toggle can be applied, 0 if it can now, None if none is deferred
+        :rtype: float
         """
-        sleep(delay)
-        self.special_cmd_allowed = True
+        if not self.__deferred_presses__:
+            return None
+        flags = {
+            LIGHTS_BUTTON: 'lights_change_allowed',
+            TURN_LEFT_SIGNAL_BUTTON: 'turning_lights_change_allowed',
+            TURN_RIGHT_SIGNAL_BUTTON: 'turning_lights_change_allowed',
+            HAZARD_LIGHTS_BUTTON: 'turning_lights_change_allowed',
+            SPECIAL_CMD_BUTTON: 'special_cmd_allowed',
+        }
+        now = monotonic()
+        return min(max(0., self.__hold_offs__.get(flags[button], now) - now) for button in self.__deferred_presses__)
+
+    def log_latency_report(self):
+        """log_latency_report
+
+            Log the latency percentiles measured on the RC and on the car.
+        :return: None
+        """
+        LOGGER.info("Round trip: {}".format(format_latency_summary(self.connection.clock.round_trip.summary())))
+        LOGGER.info("Response: {}".format(format_latency_summary(self.connection.response_latency.summary())))
+        LOGGER.info("Clock offset: {} s, drift: {:.2e}".format(
+            self.connection.clock.offset, self.connection.clock.drift))
+
+        car_report = self.connection.get_latency_report()
+        if car_report is None:
+            LOGGER.info("Car latency report not available!")
+            return
+        for stage in ('command', 'network', 'decode', 'write', 'spi', 'spi_queue', 'spi_status', 'control_jitter'):
+            if stage in car_report:
+                LOGGER.info("Car {}: {}".format(stage, format_latency_summary(car_report[stage])))
 
     def manual_control(self):
         """
@@ -106,38 +174,40 @@ class RC:
 
         power_limit = 75
         steering_limit = 27
-        idle_counter = 0
-
-        for i in range(5):
-            spi_data = build_spi_command(cmd_id=5, data=[LIGHTS_STATE_HIGH_BEAM])
-            udp_frame = '$i50$d'
-            for spi_data_value in spi_data:
-                udp_frame += chr(spi_data_value)
-            self.connection.send_package(udp_frame)
-            sleep(.0512)
-            spi_data = build_spi_command(cmd_id=5, data=[LIGHTS_STATE_OFF])
-            udp_frame = '$i50$d'
-            for spi_data_value in spi_data:
-                udp_frame += chr(spi_data_value)
-            self.connection.send_package(udp_frame)
-            sleep(.0512)
+        scheduler = MoveSendScheduler()
+        rate_controller = RateController(scheduler)
+        self.connection.status_callback = rate_controller.on_status
+        self.connection.start_clock_sync()
 
+        # the car times the blink itself
+        self.send_car_command(build_light_pattern_package(LIGHT_PATTERN_BLINK))
         sleep(.5)
 
         LOGGER.info('Remote control initiated!')
 
+        scheduler.reset()
         while True:
-            self.device.__update_rc__()
-            spi_data = None
-
-            brake_button_pressed = int(self.device.joystick.get_button(BRAKE_BUTTON))
-            start_button_pressed = int(self.device.joystick.get_button(START_BUTTON))
-
-            lights_button_pressed = int(self.device.joystick.get_button(LIGHTS_BUTTON))
-            turn_left_signal_button_pressed = int(self.device.joystick.get_button(TURN_LEFT_SIGNAL_BUTTON))
-            turn_right_signal_button_pressed = int(self.device.joystick.get_button(TURN_RIGHT_SIGNAL_BUTTON))
-            hazard_lights_button_pressed = int(self.device.joystick.get_button(HAZARD_LIGHTS_BUTTON))
-            special_cmd_button_pressed = int(self.device.joystick.get_button(SPECIAL_CMD_BUTTON))
+            # woken up by the joystick's events, or when a pending change, a deferred toggle or the keep-alive is due
+            timeout = scheduler.time_to_next_send()
+            deferred = self.time_to_deferred_presses()
+            self.device.wait_input(timeout if deferred is None else min(timeout, deferred))
+            # commands carry their sample time, so the car can measure the latency up to the wheels
+            sample_time = self.connection.remote_time(monotonic())
+            spi_package = None
+            # everything decided in this wake-up is sent as one packet and applied by the car as one unit
+            tick_packages = []
+
+            brake_button_pressed = self.device.get_button(BRAKE_BUTTON)
+            start_button_pressed = self.device.get_button(START_BUTTON)
+
+            # toggles act once per press: a press during its hold-off is deferred, not lost
+            presses = self.__deferred_presses__.union(self.device.take_presses())
+            applied = set()
+            lights_button_pressed = LIGHTS_BUTTON in presses
+            turn_left_signal_button_pressed = TURN_LEFT_SIGNAL_BUTTON in presses
+            turn_right_signal_button_pressed = TURN_RIGHT_SIGNAL_BUTTON in presses
+            hazard_lights_button_pressed = HAZARD_LIGHTS_BUTTON in presses
+            special_cmd_button_pressed = SPECIAL_CMD_BUTTON in presses
 
             if special_cmd_button_pressed:
                 if self.special_cmd_allowed:
@@ -151,81 +221,78 @@ class RC:
                     # self.special_cmd_allowed = False
                     # self.unlock_special_cmd()
                     # LOGGER.info('Special CMD done!')
-                    udp_frame = '$i11$d0'
-                    self.connection.send_package(udp_frame)
-                    sleep(.5)
-
-            if lights_button_pressed:
-                if self.lights_change_allowed:
-                    self.lights_state += 1
-                    self.lights_state %= 3
-                    spi_data = build_spi_command(cmd_id=5, data=[self.lights_state])
-                    self.lights_change_allowed = False
-                    self.unlock_lights_change()
-
-            elif turn_left_signal_button_pressed:
-                if self.turning_lights_change_allowed:
-                    if self.turning_signal_request == TURNING_SIGNAL_REQUEST_LEFT:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_OFF])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
-                    else:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_LEFT])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_LEFT
-                    self.turning_lights_change_allowed = False
-                    self.unlock_turning_lights_change()
-            elif turn_right_signal_button_pressed:
-                if self.turning_lights_change_allowed:
-                    if self.turning_signal_request == TURNING_SIGNAL_REQUEST_RIGHT:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_OFF])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
-                    else:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_RIGHT])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_RIGHT
-                    self.turning_lights_change_allowed = False
-                    self.unlock_turning_lights_change()
-            elif hazard_lights_button_pressed:
-                if self.turning_lights_change_allowed:
-                    if self.turning_signal_request == TURNING_SIGNAL_REQUEST_HAZARD:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_OFF])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
-                    else:
-                        spi_data = build_spi_command(cmd_id=4, data=[TURNING_SIGNAL_REQUEST_HAZARD])
-                        self.turning_signal_request = TURNING_SIGNAL_REQUEST_HAZARD
-                    self.turning_lights_change_allowed = False
-                    self.unlock_turning_lights_change()
+                    self.send_car_command(build_maneuver_package(MANEUVER_PARKING))
+                    self.special_cmd_allowed = False
+                    self.unlock_special_cmd()
+                    applied.add(SPECIAL_CMD_BUTTON)
+
+            # a toggle still held off does not shadow the next ones, it is deferred
+            if lights_button_pressed and self.lights_change_allowed:
+                self.lights_state += 1
+                self.lights_state %= 3
+                spi_package = build_spi_package(SPI_CMD_LIGHTS, [self.lights_state])
+                self.lights_change_allowed = False
+                self.unlock_lights_change()
+                applied.add(LIGHTS_BUTTON)
+
+            elif turn_left_signal_button_pressed and self.turning_lights_change_allowed:
+                if self.turning_signal_request == TURNING_SIGNAL_REQUEST_LEFT:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_OFF])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
+                else:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_LEFT])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_LEFT
+                self.turning_lights_change_allowed = False
+                self.unlock_turning_lights_change()
+                applied.add(TURN_LEFT_SIGNAL_BUTTON)
+            elif turn_right_signal_button_pressed and self.turning_lights_change_allowed:
+                if self.turning_signal_request == TURNING_SIGNAL_REQUEST_RIGHT:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_OFF])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
+                else:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_RIGHT])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_RIGHT
+                self.turning_lights_change_allowed = False
+                self.unlock_turning_lights_change()
+                applied.add(TURN_RIGHT_SIGNAL_BUTTON)
+            elif hazard_lights_button_pressed and self.turning_lights_change_allowed:
+                if self.turning_signal_request == TURNING_SIGNAL_REQUEST_HAZARD:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_OFF])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_OFF
+                else:
+                    spi_package = build_spi_package(SPI_CMD_TURN_SIGNALS, [TURNING_SIGNAL_REQUEST_HAZARD])
+                    self.turning_signal_request = TURNING_SIGNAL_REQUEST_HAZARD
+                self.turning_lights_change_allowed = False
+                self.unlock_turning_lights_change()
+                applied.add(HAZARD_LIGHTS_BUTTON)
             else:
                 pass
 
-            if spi_data:
-                udp_frame = '$i50$d'
-                for spi_data_value in spi_data:
-                    udp_frame += chr(spi_data_value)
-                self.connection.send_package(udp_frame)
-
-            power = -int(self.device.joystick.get_axis(POWER_AXIS) * power_limit)
-            steering = int(self.device.joystick.get_axis(STEERING_AXIS) * steering_limit)
-
-            if start_button_pressed:
-                for i in range(5):
-                    spi_data = build_spi_command(cmd_id=5, data=[LIGHTS_STATE_HIGH_BEAM])
-                    udp_frame = '$i50$d'
-                    for spi_data_value in spi_data:
-                        udp_frame += chr(spi_data_value)
-                    self.connection.send_package(udp_frame)
-                    sleep(.0512)
-                    spi_data = build_spi_command(cmd_id=5, data=[LIGHTS_STATE_OFF])
-                    udp_frame = '$i50$d'
-                    for spi_data_value in spi_data:
-                        udp_frame += chr(spi_data_value)
-                    self.connection.send_package(udp_frame)
-                    sleep(.0512)
+            self.__deferred_presses__ = {button for button in presses if button not in applied and button in (
+                LIGHTS_BUTTON, TURN_LEFT_SIGNAL_BUTTON, TURN_RIGHT_SIGNAL_BUTTON, HAZARD_LIGHTS_BUTTON,
+                SPECIAL_CMD_BUTTON)}
+
+            if spi_package:
+                tick_packages.append(spi_package)
 
+            power = -int(self.device.get_axis(POWER_AXIS) * power_limit)
+            steering = int(self.device.get_axis(STEERING_AXIS) * steering_limit)
+
+            # the start button or closing the window terminates the RC
+            if start_button_pressed or self.device.quit_requested:
+                self.send_car_command(build_light_pattern_package(LIGHT_PATTERN_BLINK))
                 sleep(.01)
 
+                self.log_latency_report()
                 self.connection.send_package("stop_listening".format(power, steering))
+                scheduler.log_statistics()
+                self.device.stop_recording()
                 LOGGER.info("Remote control terminated!")
                 break
 
+            power = rate_controller.quantize(power)
+            steering = rate_controller.quantize(steering)
+
             if steering < -steering_limit:
                 steering = -steering_limit
             if steering > steering_limit:
@@ -239,31 +306,45 @@ class RC:
             # LOGGER.info("B: {} P: {} S: {}".format(brake_button_pressed, power, steering))
             # LOGGER.info("P: {} S: {}".format(power, steering))
 
-            if steering == 0 and power == 0 and brake_button_pressed == 0:
-                idle_counter += 1
-                if idle_counter > 5:
-                    sleep(.025)
-                    continue
-            else:
-                idle_counter = 0
+            # braking is a command state of its own: pressing or releasing it is always sent at once
+            command = BRAKE_COMMAND if brake_button_pressed else (power, steering)
 
-            if brake_button_pressed:
-                self.connection.send_package("$i13$d0")
-                sleep(.05)
-                continue
+            if scheduler.should_send(command):
+                if command == BRAKE_COMMAND:
+                    tick_packages.append("$i13$d0")
+                else:
+                    tick_packages.append("$i10$d{} {}".format(power, steering))
 
-            self.connection.send_package("$i10$d{} {}".format(power, steering))
-            sleep(.025)
+            if len(tick_packages) == 1:
+                self.connection.send_package(tick_packages[0], timestamp=sample_time)
+            elif tick_packages:
+                self.connection.send_batch(tick_packages, timestamp=sample_time)
 
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BFMC remote control', epilog=(
+        "Against the multi-process runtime (bfmc.process_runtime) only moves, brakes and lights are supported: "
+        "the car answers parking and light patterns as unsupported, which is logged as a warning."))
+    parser.add_argument('--ip', default='192.168.1.194', help="car's IP address")
+    parser.add_argument('--port', type=int, default=8888)
+    parser.add_argument('--rc-device', default="Controller (XBOX 360 For Windows)", help="joystick's name")
+    parser.add_argument('--record', help="file the joystick's events are recorded to")
+    parser.add_argument('--replay', help='recording replayed instead of reading the joystick')
+    parser.add_argument('--speed', type=float, default=1., help='replay speed, 1 for real time')
+    args = parser.parse_args()
+
+    # file and console writes happen on a background thread, chatty call sites are rate limited
+    start_async_logging(LOGGER)
     rc = RC(
         # ip='192.168.100.9',
         # ip='192.168.0.107',
         # ip='192.168.43.71',
-        ip='192.168.1.194',
-        port=8888,
-        rc_device="Controller (XBOX 360 For Windows)",
+        ip=args.ip,
+        port=args.port,
+        rc_device=args.rc_device,
+        record=args.record,
+        replay=args.replay,
+        replay_speed=args.speed,
     )
     if rc.valid:
         rc.connection.connect_to_host()
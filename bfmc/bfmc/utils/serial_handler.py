@@ -1,7 +1,12 @@
-import serial, sys, time
+import sys, time
 import threading
 from enum import Enum
 
+try:
+    import serial
+except ImportError:
+    serial = None  # only an emulated serial connection can be used
+
 '''
     Converter class, it contains the functions which generate the message in the correct form. 
 '''
@@ -509,6 +514,7 @@ class SerialHandler:
         @param [in] self           reference to the current instance of the class
         @param [in] f_device_File  serial device file name
         @param [in] f_history_file name of the file containing command history
+        @param [in] f_serialCon    already opened serial connection (e.g. an emulator), f_device_File is opened if None
 
         @retval
 
@@ -518,8 +524,10 @@ class SerialHandler:
         @endcode
     '''
 
-    def __init__(self, f_device_File='/dev/ttyACM0', f_history_file='historyFile.txt'):
-        self.serialCon = serial.Serial(f_device_File, 460800, timeout=1)
+    def __init__(self, f_device_File='/dev/ttyACM0', f_history_file='historyFile.txt', f_serialCon=None):
+        if f_serialCon is None:
+            f_serialCon = serial.Serial(f_device_File, 460800, timeout=1)
+        self.serialCon = f_serialCon
         self.historyFile = FileHandler(f_history_file)
         self.readThread = ReadThread(1, self.serialCon, self.historyFile)
         self.lock = threading.Lock()
@@ -0,0 +1,583 @@
+"""Session log
+
+    Timestamped capture of everything the car sees and does: network frames, the packages decoded from
+them and their responses, serial lines written to and read from the Nucleo, SPI data written to and read
+from the driver board. The log is an append-only binary file written through mmap, one chunk at a time:
+
+    file header (magic, chunk size, wall-clock start time), padded to the mmap granularity
+    chunks: chunk header (magic, size, used bytes, records, first and last record time), then records
+    record: seconds since the session started, kind, payload length, payload
+
+    Chunk headers are rewritten after every record, so a log cut short (e.g. the car lost power) is read up
+to its last complete record, and they index the log: a time range is found without reading the records of
+the other chunks.
+
+    SessionReplay feeds the recorded frames (and optionally the Nucleo's lines) back into BFMC, in real
+time or as fast as possible, and checks the responses against the recorded ones.
+
+    python -m bfmc.utils.session_log info session.bin
+    python -m bfmc.utils.session_log replay session.bin --speed 0
+"""
+import argparse
+import bisect
+import logging
+import math
+import mmap
+import struct
+import threading
+
+from collections import defaultdict, deque, namedtuple
+from time import monotonic, sleep, time
+
+from bfmc.utils.connection_utils import Frame, payload_to_string
+from bfmc.utils.stats import LatencyRecorder, format_latency_summary
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+SESSION_MAGIC = b'BFMCSL01'
+SESSION_HEADER = struct.Struct('!8sId')  # magic, chunk size, wall-clock start time
+SESSION_HEADER_SIZE = mmap.ALLOCATIONGRANULARITY  # chunks are mapped at granularity multiples
+CHUNK_MAGIC = b'CHNK'
+CHUNK_HEADER = struct.Struct('!4sIIIdd')  # magic, size, used bytes, records, first and last record time
+RECORD_HEADER = struct.Struct('!dBI')  # seconds since the session started, kind, payload length
+SESSION_CHUNK_SIZE = 1 << 20  # bytes
+
+# frame's kind, request ID and age when received (seconds since its timestamp, NaN if none), then payload
+FRAME_RECORD = struct.Struct('!BId')
+# request ID, then response
+RESPONSE_RECORD = struct.Struct('!I')
+
+RECORD_FRAME = 1
+RECORD_PACKAGE = 2
+RECORD_RESPONSE = 3
+RECORD_SERIAL_TX = 4
+RECORD_SERIAL_RX = 5
+RECORD_SPI_TX = 6
+RECORD_SPI_RX = 7
+
+RECORD_NAMES = {
+    RECORD_FRAME: 'frame',
+    RECORD_PACKAGE: 'package',
+    RECORD_RESPONSE: 'response',
+    RECORD_SERIAL_TX: 'serial tx',
+    RECORD_SERIAL_RX: 'serial rx',
+    RECORD_SPI_TX: 'spi tx',
+    RECORD_SPI_RX: 'spi rx',
+}
+
+SessionRecord = namedtuple('SessionRecord', ['time', 'kind', 'payload'])
+SessionChunk = namedtuple('SessionChunk', ['offset', 'size', 'used', 'records', 'first_time', 'last_time'])
+
+
+class SessionRecorder:
+    """SessionRecorder
+
+        Class used to append records to a session log, from any thread.
+    """
+    def __init__(self, path, chunk_size=SESSION_CHUNK_SIZE):
+        """Constructor
+
+        :param path: log's file, overwritten
+        :param chunk_size: bytes per chunk, rounded up to the mmap granularity
+        """
+        self.path = path
+        self.chunk_size = -(-chunk_size // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY
+        self.records = 0
+
+        self.__lock__ = threading.Lock()
+        self.__start__ = monotonic()
+        self.__file__ = open(path, 'w+b')
+        self.__file__.write(SESSION_HEADER.pack(SESSION_MAGIC, self.chunk_size, time()))
+        self.__file__.truncate(SESSION_HEADER_SIZE)
+        self.__file__.flush()
+
+        self.__map__ = None
+        self.__chunk_offset__ = SESSION_HEADER_SIZE
+        self.__chunk_size__ = 0
+        self.__chunk__ = None  # used bytes, records, first and last record time
+
+    def __new_chunk__(self, record_size):
+        """__new_chunk__
+
+            Map a new chunk, large enough for the record; the lock is held by the caller.
+        :return: None
+        """
+        if self.__map__ is not None:
+            self.__map__.close()
+            self.__chunk_offset__ += self.__chunk_size__
+        needed = CHUNK_HEADER.size + record_size
+        self.__chunk_size__ = max(self.chunk_size,
+                                  -(-needed // mmap.ALLOCATIONGRANULARITY) * mmap.ALLOCATIONGRANULARITY)
+        self.__file__.truncate(self.__chunk_offset__ + self.__chunk_size__)
+        self.__map__ = mmap.mmap(self.__file__.fileno(), self.__chunk_size__, offset=self.__chunk_offset__)
+        self.__chunk__ = [CHUNK_HEADER.size, 0, 0., 0.]
+
+    def record(self, kind, payload, now=None):
+        """record
+
+        :param kind: one of RECORD_*
+        :param payload: record's data
+        :type payload: bytes or bytearray or memoryview
+        :param now: monotonic time of the event, read from the clock if None
+        :return: None
+        """
+        if now is None:
+            now = monotonic()
+        elapsed = now - self.__start__
+        size = RECORD_HEADER.size + len(payload)
+        with self.__lock__:
+            if self.__file__ is None:
+                return
+            if self.__map__ is None or self.__chunk__[0] + size > self.__chunk_size__:
+                self.__new_chunk__(size)
+            chunk = self.__chunk__
+            used = chunk[0]
+            RECORD_HEADER.pack_into(self.__map__, used, elapsed, kind, len(payload))
+            self.__map__[used + RECORD_HEADER.size:used + size] = payload
+            if chunk[1] == 0:
+                chunk[2] = elapsed
+            chunk[0] = used + size
+            chunk[1] += 1
+            chunk[3] = elapsed
+            CHUNK_HEADER.pack_into(self.__map__, 0, CHUNK_MAGIC, self.__chunk_size__, *chunk)
+            self.records += 1
+
+    def record_frame(self, frame, received_at=None):
+        """record_frame
+
+        :param frame: frame received from a client
+        :type frame: Frame
+        :param received_at: monotonic time the frame was received at, now if None
+        :return: None
+        """
+        if received_at is None:
+            received_at = monotonic()
+        age = received_at - frame.timestamp if frame.timestamp is not None else float('nan')
+        self.record(RECORD_FRAME, FRAME_RECORD.pack(frame.kind, frame.request_id, age) + bytes(frame.payload),
+                    received_at)
+
+    def record_package(self, package):
+        """record_package
+
+        :param package: package decoded from a frame
+        :type package: str or bytes
+        :return: None
+        """
+        self.record(RECORD_PACKAGE, package.encode('latin-1') if isinstance(package, str) else bytes(package))
+
+    def record_response(self, request_id, response):
+        """record_response
+
+        :param request_id: request's ID
+        :param response: response sent
+        :type response: str
+        :return: None
+        """
+        self.record(RECORD_RESPONSE, RESPONSE_RECORD.pack(request_id) + response.encode('latin-1'))
+
+    def close(self):
+        """close
+
+            Trim the last chunk to its records and close the file.
+        :return: None
+        """
+        with self.__lock__:
+            if self.__file__ is None:
+                return
+            end = self.__chunk_offset__
+            if self.__map__ is not None:
+                CHUNK_HEADER.pack_into(self.__map__, 0, CHUNK_MAGIC, self.__chunk__[0], *self.__chunk__)
+                self.__map__.close()
+                self.__map__ = None
+                end += self.__chunk__[0]
+            self.__file__.truncate(end)
+            self.__file__.close()
+            self.__file__ = None
+        LOGGER.info("Recorded {} session records to {}".format(self.records, self.path))
+
+
+class RecordingSerial:
+    """RecordingSerial
+
+        Serial connection recording the lines written to and read from the Nucleo. The Nucleo is read one
+    byte at a time, so the bytes read are recorded once a line is complete.
+    """
+    def __init__(self, connection, recorder):
+        """Constructor
+
+        :param connection: serial connection (pyserial's Serial, SerialEmulator)
+        :param recorder: session recorder
+        :type recorder: SessionRecorder
+        """
+        self.connection = connection
+        self.recorder = recorder
+        self.__line__ = bytearray()
+
+    def write(self, data):
+        """write
+
+        :param data: bytes to be written
+        :return: number of bytes written
+        """
+        self.recorder.record(RECORD_SERIAL_TX, data)
+        return self.connection.write(data)
+
+    def read(self, size=1):
+        """read
+
+        :param size: number of bytes to be read
+        :return: bytes read
+        :rtype: bytes
+        """
+        data = self.connection.read(size)
+        self.__line__ += data
+        if b'\n' in data:
+            self.recorder.record(RECORD_SERIAL_RX, self.__line__)
+            self.__line__ = bytearray()
+        return data
+
+    def __getattr__(self, name):
+        """__getattr__
+
+        :return: the connection's attribute
+        """
+        return getattr(self.connection, name)
+
+
+class RecordingSpi:
+    """RecordingSpi
+
+        SPI device recording the data written to and read from the driver board.
+    """
+    def __init__(self, device, recorder):
+        """Constructor
+
+        :param device: SPI device (spidev's SpiDev, SpiEmulator)
+        :param recorder: session recorder
+        :type recorder: SessionRecorder
+        """
+        object.__setattr__(self, 'device', device)
+        object.__setattr__(self, 'recorder', recorder)
+
+    def writebytes(self, data):
+        """writebytes
+
+        :param data: list of bytes to be written
+        :return: None
+        """
+        self.recorder.record(RECORD_SPI_TX, bytes(data))
+        return self.device.writebytes(data)
+
+    def xfer(self, data):
+        """xfer
+
+        :param data: list of bytes to be written
+        :return: bytes read meanwhile
+        """
+        self.recorder.record(RECORD_SPI_TX, bytes(data))
+        return self.device.xfer(data)
+
+    def xfer2(self, data):
+        """xfer2
+
+        :param data: list of bytes to be written
+        :return: bytes read meanwhile
+        """
+        self.recorder.record(RECORD_SPI_TX, bytes(data))
+        received = self.device.xfer2(data)
+        self.recorder.record(RECORD_SPI_RX, bytes(received))
+        return received
+
+    def readbytes(self, size):
+        """readbytes
+
+        :param size: number of bytes to be read
+        :return: bytes read
+        """
+        received = self.device.readbytes(size)
+        self.recorder.record(RECORD_SPI_RX, bytes(received))
+        return received
+
+    def __getattr__(self, name):
+        """__getattr__
+
+        :return: the device's attribute
+        """
+        return getattr(self.device, name)
+
+    def __setattr__(self, name, value):
+        """__setattr__
+
+            Settings (e.g. max_speed_hz) go to the device.
+        :return: None
+        """
+        setattr(self.device, name, value)
+
+
+class SessionLog:
+    """SessionLog
+
+        Class used to read a session log, chunk by chunk.
+    """
+    def __init__(self, path):
+        """Constructor
+
+        :param path: log's file
+        """
+        self.path = path
+        with open(path, 'rb') as log_file:
+            self.__map__ = mmap.mmap(log_file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, self.chunk_size, self.started_at = SESSION_HEADER.unpack_from(self.__map__)
+        if magic != SESSION_MAGIC:
+            raise ValueError('Not a session log: {}'.format(path))
+        self.chunks = self.__read_index__()
+
+    def __read_index__(self):
+        """__read_index__
+
+        :return: log's chunks, in order
+        :rtype: list of SessionChunk
+        """
+        chunks = []
+        offset = SESSION_HEADER_SIZE
+        while offset + CHUNK_HEADER.size <= len(self.__map__):
+            magic, size, used, records, first_time, last_time = CHUNK_HEADER.unpack_from(self.__map__, offset)
+            if magic != CHUNK_MAGIC or size < CHUNK_HEADER.size:
+                break
+            chunks.append(SessionChunk(offset, size, min(used, len(self.__map__) - offset), records, first_time,
+                                       last_time))
+            offset += size
+        return chunks
+
+    @property
+    def records(self):
+        """records
+
+        :return: number of records
+        :rtype: int
+        """
+        return sum(chunk.records for chunk in self.chunks)
+
+    @property
+    def duration(self):
+        """duration
+
+        :return: seconds between the first and the last record
+        :rtype: float
+        """
+        if not self.chunks:
+            return 0.
+        return self.chunks[-1].last_time - self.chunks[0].first_time
+
+    def read(self, kinds=None, start=None, end=None):
+        """read
+
+        :param kinds: record kinds to be read, all if None
+        :param start: seconds since the session started, from the beginning if None
+        :param end: seconds since the session started, up to the end if None
+        :return: records, in order
+        :rtype: generator of SessionRecord
+        """
+        first_chunk = 0
+        if start is not None:
+            # chunks are in time order: skip the ones ending before start
+            first_chunk = bisect.bisect_left([chunk.last_time for chunk in self.chunks], start)
+        for chunk in self.chunks[first_chunk:]:
+            if end is not None and chunk.first_time > end:
+                return
+            offset = chunk.offset + CHUNK_HEADER.size
+            chunk_end = chunk.offset + chunk.used
+            while offset + RECORD_HEADER.size <= chunk_end:
+                elapsed, kind, length = RECORD_HEADER.unpack_from(self.__map__, offset)
+                payload_offset = offset + RECORD_HEADER.size
+                offset = payload_offset + length
+                if offset > chunk_end:
+                    break
+                if start is not None and elapsed < start:
+                    continue
+                if end is not None and elapsed > end:
+                    continue
+                if kinds is None or kind in kinds:
+                    yield SessionRecord(elapsed, kind, self.__map__[payload_offset:offset])
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        self.__map__.close()
+
+
+def decode_frame_record(payload):
+    """decode_frame_record
+
+    :param payload: RECORD_FRAME record's payload
+    :return: frame, with the timestamp as its age when received (seconds, None if unknown)
+    :rtype: Frame
+    """
+    kind, request_id, age = FRAME_RECORD.unpack_from(payload)
+    return Frame(kind, request_id, payload[FRAME_RECORD.size:], None if math.isnan(age) else age)
+
+
+def decode_response_record(payload):
+    """decode_response_record
+
+    :param payload: RECORD_RESPONSE record's payload
+    :return: request ID and response
+    :rtype: tuple
+    """
+    return RESPONSE_RECORD.unpack_from(payload)[0], payload[RESPONSE_RECORD.size:].decode('latin-1')
+
+
+class SessionReplay:
+    """SessionReplay
+
+        Class used to feed a session log back into BFMC: its frames are handled at their recorded times
+    (speed times faster, as fast as possible if speed is 0) and the responses are checked against the
+    recorded ones. The Nucleo's recorded lines can be fed to the serial waiters as well; the car's own
+    serial connection should then stay silent, or the encoder is counted twice.
+    """
+    def __init__(self, path, car, speed=1., serial_rx=False):
+        """Constructor
+
+        :param path: session log's file
+        :param car: car the log is fed into
+        :type car: BFMC
+        :param speed: replay speed, 1 for real time, 0 for as fast as possible
+        :param serial_rx: True to feed the recorded serial lines to the car's serial waiters
+        """
+        self.log = SessionLog(path)
+        self.car = car
+        self.speed = float(speed)
+        self.serial_rx = serial_rx
+
+        self.frames = 0
+        self.serial_lines = 0
+        self.responses_checked = 0
+        self.mismatches = []
+        # time spent handling every frame, and replay's lateness against the recorded timeline
+        self.handle_time = LatencyRecorder()
+        self.lateness = LatencyRecorder()
+
+    def __recorded_responses__(self):
+        """__recorded_responses__
+
+        :return: recorded responses by request ID, in order
+        :rtype: dict of deque
+        """
+        responses = defaultdict(deque)
+        for record in self.log.read(kinds=(RECORD_RESPONSE,)):
+            request_id, response = decode_response_record(record.payload)
+            responses[request_id].append(response)
+        return responses
+
+    def run(self):
+        """run
+
+        :return: replay's statistics
+        :rtype: dict
+        """
+        responses = self.__recorded_responses__()
+        kinds = (RECORD_FRAME, RECORD_SERIAL_RX) if self.serial_rx else (RECORD_FRAME,)
+        start = monotonic()
+        first_time = None
+        for record in self.log.read(kinds=kinds):
+            if first_time is None:
+                first_time = record.time
+            if self.speed > 0:
+                due = start + (record.time - first_time) / self.speed
+                delay = due - monotonic()
+                if delay > 0:
+                    sleep(delay)
+                else:
+                    self.lateness.record(-delay)
+
+            if record.kind == RECORD_SERIAL_RX:
+                line = bytes(record.payload).decode('ascii', 'replace').strip()
+                if line.startswith('@'):
+                    self.car.serial_handler.readThread.checkWaiters(line)
+                    self.serial_lines += 1
+                continue
+
+            frame = decode_frame_record(record.payload)
+            received_at = monotonic()
+            # the frame keeps the age it had when recorded
+            timestamp = received_at - frame.timestamp if frame.timestamp is not None else None
+            self.car.connection.current_frame_received_at = received_at
+            response = self.car.handle_frame(Frame(frame.kind, frame.request_id, frame.payload, timestamp))
+            self.handle_time.record(monotonic() - received_at)
+            self.frames += 1
+
+            expected = responses.get(frame.request_id)
+            if expected:
+                self.responses_checked += 1
+                recorded = expected.popleft()
+                if recorded != response:
+                    self.mismatches.append((record.time, payload_to_string(frame.payload), recorded, response))
+
+        return {
+            'frames': self.frames,
+            'serial_lines': self.serial_lines,
+            'responses_checked': self.responses_checked,
+            'mismatches': len(self.mismatches),
+            'duration': monotonic() - start,
+            'recorded_duration': self.log.duration,
+            'handle_time': self.handle_time.summary(),
+            'lateness': self.lateness.summary(),
+        }
+
+
+def print_info(path):
+    """print_info
+
+    :param path: session log's file
+    :return: None
+    """
+    log = SessionLog(path)
+    print("{}: {} records in {} chunks, {:.1f} s".format(path, log.records, len(log.chunks), log.duration))
+    counts = defaultdict(int)
+    for record in log.read():
+        counts[record.kind] += 1
+    for kind in sorted(counts):
+        print("{:>10}: {}".format(RECORD_NAMES.get(kind, kind), counts[kind]))
+    log.close()
+
+
+def replay(path, speed, serial_rx):
+    """replay
+
+        Replay a session into BFMC against emulated serial and SPI back ends.
+    :return: None
+    """
+    from bfmc.core import BFMC
+    from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+
+    car = BFMC(serial_connection=SerialEmulator(), spi=SpiEmulator(), serve=False)
+    statistics = SessionReplay(path, car, speed, serial_rx).run()
+    print("replayed {} frames and {} serial lines in {:.2f} s (recorded: {:.2f} s)".format(
+        statistics['frames'], statistics['serial_lines'], statistics['duration'], statistics['recorded_duration']))
+    print("responses: {} checked, {} mismatches".format(statistics['responses_checked'], statistics['mismatches']))
+    print("handle time: {}".format(format_latency_summary(statistics['handle_time'])))
+    print("   lateness: {}".format(format_latency_summary(statistics['lateness'])))
+    car.shutdown()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BFMC session log tool')
+    subparsers = parser.add_subparsers(dest='action')
+    info_parser = subparsers.add_parser('info', help="print the log's index and record counts")
+    info_parser.add_argument('path')
+    replay_parser = subparsers.add_parser('replay', help='replay the log into BFMC, against emulators')
+    replay_parser.add_argument('path')
+    replay_parser.add_argument('--speed', type=float, default=1., help='1 for real time, 0 for as fast as possible')
+    replay_parser.add_argument('--serial-rx', action='store_true', help="feed the Nucleo's recorded lines as well")
+    args = parser.parse_args()
+
+    if args.action == 'info':
+        print_info(args.path)
+    elif args.action == 'replay':
+        replay(args.path, args.speed, args.serial_rx)
+    else:
+        parser.print_help()
@@ -0,0 +1,231 @@
+"""Shared-memory state
+
+    Lock-free exchange between the processes of the multi-process runtime, without pickling:
+SharedRing, a single producer, single consumer ring of byte messages, and SharedSnapshot, a seqlock
+protected record of fixed layout with a single writer and any number of readers.
+
+    Both live in multiprocessing.shared_memory blocks (Python 3.8+), created by the parent process and
+attached to by name in the children.
+"""
+import struct
+
+from time import sleep
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:
+    shared_memory = None  # Python < 3.8: only the single-process runtime is available
+
+COUNTER = struct.Struct('=Q')
+MESSAGE_LENGTH = struct.Struct('=I')
+RING_HEADER_SIZE = 64  # write and read counters, each on its own cache line would be overkill here
+SNAPSHOT_HEADER_SIZE = 8  # sequence counter
+SNAPSHOT_READ_RETRIES = 1000
+
+
+def __open_block__(name, size):
+    """__open_block__
+
+    :param name: block's name, a new block is created if None
+    :param size: block's size, in bytes, when created
+    :return: shared memory block
+    :rtype: shared_memory.SharedMemory
+    """
+    if shared_memory is None:
+        raise RuntimeError('Shared memory needs Python 3.8 or newer')
+    if name is None:
+        return shared_memory.SharedMemory(create=True, size=size)
+    return shared_memory.SharedMemory(name=name)
+
+
+class SharedRing:
+    """SharedRing
+
+        Single producer, single consumer ring of byte messages in shared memory. The producer only
+    writes the write counter and the consumer only the read counter, so no lock is needed; a push to a
+    full ring is refused and counted.
+    """
+    def __init__(self, name=None, slots=256, slot_size=252):
+        """Constructor
+
+        :param name: block to attach to, a new ring is created if None
+        :param slots: number of messages the ring holds, when created
+        :param slot_size: maximum message size, in bytes, when created
+        """
+        self.__block__ = __open_block__(name, RING_HEADER_SIZE + slots * (MESSAGE_LENGTH.size + slot_size))
+        self.__created__ = name is None
+        self.buffer = self.__block__.buf
+        if self.__created__:
+            COUNTER.pack_into(self.buffer, 0, 0)
+            COUNTER.pack_into(self.buffer, COUNTER.size, 0)
+            COUNTER.pack_into(self.buffer, 2 * COUNTER.size, slots)
+            COUNTER.pack_into(self.buffer, 3 * COUNTER.size, slot_size)
+        self.slots = COUNTER.unpack_from(self.buffer, 2 * COUNTER.size)[0]
+        self.slot_size = COUNTER.unpack_from(self.buffer, 3 * COUNTER.size)[0]
+        self.__stride__ = MESSAGE_LENGTH.size + self.slot_size
+
+        self.dropped = 0
+
+    @property
+    def name(self):
+        """name
+
+        :return: block's name, to attach to the ring from another process
+        :rtype: str
+        """
+        return self.__block__.name
+
+    def __len__(self):
+        """__len__
+
+        :return: number of messages waiting
+        :rtype: int
+        """
+        return COUNTER.unpack_from(self.buffer, 0)[0] - COUNTER.unpack_from(self.buffer, COUNTER.size)[0]
+
+    def push(self, message):
+        """push
+
+            Producer side.
+        :param message: message, at most slot_size bytes
+        :type message: bytes
+        :return: False if the ring is full
+        :rtype: bool
+        """
+        if len(message) > self.slot_size:
+            raise ValueError('Message too long: {} bytes'.format(len(message)))
+        written = COUNTER.unpack_from(self.buffer, 0)[0]
+        if written - COUNTER.unpack_from(self.buffer, COUNTER.size)[0] >= self.slots:
+            self.dropped += 1
+            return False
+
+        offset = RING_HEADER_SIZE + (written % self.slots) * self.__stride__
+        MESSAGE_LENGTH.pack_into(self.buffer, offset, len(message))
+        self.buffer[offset + MESSAGE_LENGTH.size:offset + MESSAGE_LENGTH.size + len(message)] = message
+        # published once the message is in place
+        COUNTER.pack_into(self.buffer, 0, written + 1)
+        return True
+
+    def pop(self):
+        """pop
+
+            Consumer side.
+        :return: oldest message, None if the ring is empty
+        :rtype: bytes
+        """
+        read = COUNTER.unpack_from(self.buffer, COUNTER.size)[0]
+        if read == COUNTER.unpack_from(self.buffer, 0)[0]:
+            return None
+
+        offset = RING_HEADER_SIZE + (read % self.slots) * self.__stride__
+        length = MESSAGE_LENGTH.unpack_from(self.buffer, offset)[0]
+        message = bytes(self.buffer[offset + MESSAGE_LENGTH.size:offset + MESSAGE_LENGTH.size + length])
+        COUNTER.pack_into(self.buffer, COUNTER.size, read + 1)
+        return message
+
+    def pop_all(self):
+        """pop_all
+
+        :return: all waiting messages, oldest first
+        :rtype: list of bytes
+        """
+        messages = []
+        message = self.pop()
+        while message is not None:
+            messages.append(message)
+            message = self.pop()
+        return messages
+
+    def close(self):
+        """close
+
+            Detach; the creator also frees the block.
+        :return: None
+        """
+        self.buffer = None
+        self.__block__.close()
+        if self.__created__:
+            self.__block__.unlink()
+
+
+class SharedSnapshot:
+    """SharedSnapshot
+
+        Record of fixed layout in shared memory, written by a single process and read by any. The writer
+    makes the sequence counter odd while writing; a reader retries until it copied the record between two
+    equal, even counter values, so it never sees a half-written record and never blocks the writer.
+    """
+    def __init__(self, layout, name=None):
+        """Constructor
+
+        :param layout: record's layout
+        :type layout: struct.Struct
+        :param name: block to attach to, a new snapshot is created if None
+        """
+        self.layout = layout
+        self.__block__ = __open_block__(name, SNAPSHOT_HEADER_SIZE + layout.size)
+        self.__created__ = name is None
+        self.buffer = self.__block__.buf
+        if self.__created__:
+            COUNTER.pack_into(self.buffer, 0, 0)
+
+        self.retries = 0
+
+    @property
+    def name(self):
+        """name
+
+        :return: block's name, to attach to the snapshot from another process
+        :rtype: str
+        """
+        return self.__block__.name
+
+    @property
+    def version(self):
+        """version
+
+        :return: number of records written so far
+        :rtype: int
+        """
+        return COUNTER.unpack_from(self.buffer, 0)[0] // 2
+
+    def write(self, *values):
+        """write
+
+            Writer side.
+        :param values: record's fields, in layout order
+        :return: None
+        """
+        sequence = COUNTER.unpack_from(self.buffer, 0)[0]
+        COUNTER.pack_into(self.buffer, 0, sequence + 1)
+        self.layout.pack_into(self.buffer, SNAPSHOT_HEADER_SIZE, *values)
+        COUNTER.pack_into(self.buffer, 0, sequence + 2)
+
+    def read(self):
+        """read
+
+        :return: latest record and its version, (None, 0) if nothing was written yet
+        :rtype: tuple
+        """
+        for _ in range(SNAPSHOT_READ_RETRIES):
+            before = COUNTER.unpack_from(self.buffer, 0)[0]
+            if before == 0:
+                return None, 0
+            if before % 2 == 0:
+                values = self.layout.unpack_from(self.buffer, SNAPSHOT_HEADER_SIZE)
+                if COUNTER.unpack_from(self.buffer, 0)[0] == before:
+                    return values, before // 2
+            self.retries += 1
+            sleep(0)
+        raise RuntimeError('Snapshot kept changing while being read')
+
+    def close(self):
+        """close
+
+            Detach; the creator also frees the block.
+        :return: None
+        """
+        self.buffer = None
+        self.__block__.close()
+        if self.__created__:
+            self.__block__.unlink()
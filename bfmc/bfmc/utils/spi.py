@@ -1,45 +1,178 @@
+# standard frame: log2 of the frame length, by number of bytes to be sent (header included)
 NOB_TO_N = {0: 0, 1: 1, 2: 1, 3: 2, 4: 2, 5: 3, 6: 3, 7: 3, 8: 3}
 
+SPI_MAX_CMD_ID = 31
+SPI_MAX_STANDARD_DATA_BYTES = 7  # longer data is sent in an extended frame
+SPI_MAX_EXTENDED_DATA_BYTES = 0x3FF - 1  # 10 bits data length, data 0 byte included
 
-def build_spi_command(cmd_id, data):
-    """build_spi_command
+SPI_CMD_QUERY = 1  # request answered by the driver board in the following bytes
+SPI_CMD_TURN_SIGNALS = 4
+SPI_CMD_LIGHTS = 5
+
+LIGHTS_STATE_OFF = 0
+LIGHTS_STATE_DIPPED_BEAM = 1
+LIGHTS_STATE_HIGH_BEAM = 2
+LIGHTS_STATE_RESET = 3
+
+TURNING_SIGNAL_REQUEST_OFF = 0
+TURNING_SIGNAL_REQUEST_LEFT = 1
+TURNING_SIGNAL_REQUEST_RIGHT = 2
+TURNING_SIGNAL_REQUEST_HAZARD = 3
+
+# state commands: only the latest one matters, a pending older one can be dropped
+SUPERSEDABLE_SPI_COMMANDS = (SPI_CMD_TURN_SIGNALS, SPI_CMD_LIGHTS)
+
+# commands sent over and over (light and turn signal states, startup and stop blink): prebuilt once
+CACHED_SPI_COMMANDS = {
+    SPI_CMD_TURN_SIGNALS: range(4),
+    SPI_CMD_LIGHTS: range(4),
+}
 
-        Build SPI command.
+SPI_PASSTHROUGH_PACKAGE = b'$i50$d'  # RC package asking the car to send the following raw frames over SPI
+
+
+def build_spi_frame(cmd_id, data):
+    """build_spi_frame
+
+        Build SPI frame, without looking into the frame cache.
+    Standard frames (up to 7 data bytes) are padded with zeros to a power of two length; longer data is sent
+    in an extended frame: header, data 0 byte (low byte of the data length), data.
     :param cmd_id: command's ID in range [0, 31]
     :type cmd_id: int
-    :param data: list of 8 bits data to be sent, maximum 1024 bytes
-    :type data: list of int
-    :return: None
+    :param data: 8 bits data to be sent, maximum 1022 bytes; bytes, bytearray or memoryview are copied at once
+    :type data: list of int or bytes
+    :return: frame
+    :rtype: bytes
     """
+    if not 0 <= cmd_id <= SPI_MAX_CMD_ID:
+        raise ValueError('SPI command ID out of range: {}'.format(cmd_id))
+
     number_of_data_bytes = len(data)
 
-    if number_of_data_bytes <= 7:
-        extend = 0
+    if number_of_data_bytes <= SPI_MAX_STANDARD_DATA_BYTES:
         n = NOB_TO_N[number_of_data_bytes + 1]
-        data_0_byte = False
-        frame_length = 1 << n
-    else:
-        number_of_data_bytes += 1
-        extend = 1
-        n = (number_of_data_bytes & 0b1100000000) >> 8
-        data_0_byte = number_of_data_bytes & 0xFF
-        data_frame_length = number_of_data_bytes + 1
-        frame_length = data_frame_length + 1
+        frame = bytearray(1 << n)
+        frame[0] = cmd_id << 3 | n
+        frame[1:1 + number_of_data_bytes] = data
+        return bytes(frame)
+
+    if number_of_data_bytes > SPI_MAX_EXTENDED_DATA_BYTES:
+        raise ValueError('SPI data too long: {} bytes'.format(number_of_data_bytes))
+
+    number_of_data_bytes += 1
+    n = (number_of_data_bytes & 0b1100000000) >> 8
+    return bytes((cmd_id << 3 | 1 << 2 | n, number_of_data_bytes & 0xFF)) + bytes(data)
+
+
+SPI_FRAME_CACHE = {(cmd_id, (value,)): build_spi_frame(cmd_id, [value])
+                   for cmd_id, values in CACHED_SPI_COMMANDS.items() for value in values}
+
+
+def build_spi_command(cmd_id, data):
+    """build_spi_command
+
+        Build SPI command, taken from the frame cache if prebuilt.
+    :param cmd_id: command's ID in range [0, 31]
+    :type cmd_id: int
+    :param data: 8 bits data to be sent, maximum 1022 bytes
+    :type data: list of int or bytes
+    :return: frame
+    :rtype: bytes
+    """
+    if len(data) == 1:
+        frame = SPI_FRAME_CACHE.get((cmd_id, (data[0],)))
+        if frame is not None:
+            return frame
+    return build_spi_frame(cmd_id, data)
+
+
+def build_spi_package(cmd_id, data):
+    """build_spi_package
 
-    # LOGGER.info("FRAME L: {}".format(frame_length))
-    header_byte = (cmd_id << 3) | (extend << 2) | n
+        Build the RC package carrying an SPI command to the car, as raw bytes.
+    :param cmd_id: command's ID in range [0, 31]
+    :type cmd_id: int
+    :param data: 8 bits data to be sent
+    :type data: list of int or bytes
+    :return: package
+    :rtype: bytes
+    """
+    return SPI_PASSTHROUGH_PACKAGE + build_spi_command(cmd_id, data)
 
-    spi_data = [header_byte]
 
-    if data_0_byte:
-        spi_data.append(data_0_byte)
+def get_spi_passthrough_data(package):
+    """get_spi_passthrough_data
 
-    spi_data.extend(data)
-    if extend == 0:
-        while len(spi_data) < frame_length:
-            spi_data.append(0)
+        Get the SPI frames carried by a package received from the RC.
+    :param package: package, as received
+    :type package: bytes or memoryview or str
+    :return: view of the frames, None if the package does not carry raw SPI frames
+    :rtype: memoryview
+    """
+    if isinstance(package, str) or package[:len(SPI_PASSTHROUGH_PACKAGE)] != SPI_PASSTHROUGH_PACKAGE:
+        return None
+    return memoryview(package)[len(SPI_PASSTHROUGH_PACKAGE):]
+
+
+def get_spi_frame_cmd_id(frame):
+    """get_spi_frame_cmd_id
+
+    :param frame: SPI frame
+    :return: frame's command ID
+    :rtype: int
+    """
+    return frame[0] >> 3
 
-    # for spi_byte in spi_data:
-    #     LOGGER.info("{0:08b}: {1} {2}".format(spi_byte, spi_byte, chr(spi_byte)))
 
-    return spi_data
+def get_spi_frame_length(header_byte, data_0_byte=None):
+    """get_spi_frame_length
+
+    :param header_byte: frame's header
+    :param data_0_byte: frame's second byte, needed by extended frames
+    :return: frame's length in bytes, header included, None if data_0_byte is needed but missing
+    :rtype: int
+    """
+    n = header_byte & 0b11
+    if header_byte & 0b100:
+        if data_0_byte is None:
+            return None
+        return 1 + (n << 8 | data_0_byte)
+    return 1 << n
+
+
+def decode_spi_frame(frame):
+    """decode_spi_frame
+
+        Split an SPI frame into its command ID and data. The data of a standard frame includes its zero
+    padding, as its exact length is not sent.
+    :param frame: complete SPI frame
+    :type frame: bytes or list of int
+    :return: command's ID and data
+    :rtype: tuple
+    """
+    header_byte = frame[0]
+    if header_byte & 0b100:
+        return header_byte >> 3, frame[2:]
+    return header_byte >> 3, frame[1:]
+
+
+def split_spi_frames(data):
+    """split_spi_frames
+
+        Split concatenated SPI frames, using the length given by every header.
+    A truncated last frame is returned as it is.
+    :param data: concatenated frames
+    :type data: list of int or bytes
+    :return: frames, in order
+    :rtype: list
+    """
+    frames = []
+    offset = 0
+    data_length = len(data)
+    while offset < data_length:
+        frame_length = get_spi_frame_length(data[offset], data[offset + 1] if offset + 1 < data_length else None)
+        if frame_length is None:
+            frame_length = data_length - offset
+        frames.append(data[offset:offset + frame_length])
+        offset += frame_length
+    return frames
@@ -0,0 +1,277 @@
+import heapq
+import logging
+import threading
+
+from concurrent.futures import Future
+from time import monotonic
+
+from bfmc.utils.spi import SPI_CMD_TURN_SIGNALS, SUPERSEDABLE_SPI_COMMANDS, get_spi_frame_cmd_id, split_spi_frames
+from bfmc.utils.stats import LatencyRecorder
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+SPI_PRIORITY_SAFETY = 0
+SPI_PRIORITY_NORMAL = 1
+
+# frames sent ahead of the others: turn signals and hazard lights
+SAFETY_SPI_COMMANDS = (SPI_CMD_TURN_SIGNALS,)
+
+SPI_BATCH_WINDOW = .001  # seconds a frame waits for others to share its transaction
+SPI_MAX_BATCH_SIZE = 4096  # bytes per transaction, spidev's default buffer size
+SPI_QUERY_TIMEOUT = 1.  # seconds
+
+
+class SpiTransfer:
+    """SpiTransfer
+
+        Frame waiting in the SPI worker's queue.
+    """
+    def __init__(self, frame, priority, context=None, response_size=None):
+        """Constructor
+
+        :param frame: SPI frame
+        :param priority: one of SPI_PRIORITY_*, lower is sent first
+        :param context: handed to the worker's sent_callback once the frame is written
+        :param response_size: number of bytes to be read after the frame, None if it is only written
+        """
+        self.frame = frame
+        self.priority = priority
+        self.context = context
+        self.response_size = response_size
+        self.submitted_at = monotonic()
+        self.superseded = False
+        self.future = Future() if response_size is not None else None
+
+
+class SpiWorker:
+    """SpiWorker
+
+        Thread owning the SPI bus of the driver board. Frames are queued by priority, frames arriving within
+    the batch window share one transaction and a state frame (e.g. lights) still queued when a newer one of
+    the same command arrives is dropped. Queries, which read a response, get a transaction of their own.
+    """
+    def __init__(self, driver, batch_window=SPI_BATCH_WINDOW, sent_callback=None):
+        """Constructor
+
+        :param driver: driver board
+        :type driver: BFMCDriverBoardSTM
+        :param batch_window: seconds a frame waits for others to share its transaction
+        :param sent_callback: called with the context and the write start time of every written submission
+        """
+        self.driver = driver
+        self.batch_window = batch_window
+        self.sent_callback = sent_callback
+
+        self.__queue__ = []
+        self.__sequence__ = 0
+        self.__latest__ = {}
+        self.__condition__ = threading.Condition()
+        self.__thread__ = None
+        self.running = False
+
+        self.transactions = 0
+        self.batches = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.max_queue_depth = 0
+        self.max_batch_size = 0
+        self.queue_wait = LatencyRecorder()
+
+    @property
+    def queue_depth(self):
+        """queue_depth
+
+            Number of frames waiting to be sent.
+        :rtype: int
+        """
+        return len(self.__queue__)
+
+    def start(self):
+        """start
+
+            Start sending the queued frames.
+        :return: None
+        """
+        self.running = True
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def stop(self):
+        """stop
+
+            Send the frames still queued and stop.
+        :return: None
+        """
+        with self.__condition__:
+            self.running = False
+            self.__condition__.notify()
+        if self.__thread__ is not None:
+            self.__thread__.join()
+
+    def submit(self, data, priority=None, context=None):
+        """submit
+
+            Queue frames to be written.
+        :param data: one or several concatenated SPI frames
+        :type data: list of int or bytes
+        :param priority: one of SPI_PRIORITY_*, taken from the frames' command if None
+        :param context: handed to sent_callback once the frames are written
+        :return: None
+        """
+        with self.__condition__:
+            for frame in split_spi_frames(data):
+                cmd_id = get_spi_frame_cmd_id(frame)
+                frame_priority = priority
+                if frame_priority is None:
+                    frame_priority = SPI_PRIORITY_SAFETY if cmd_id in SAFETY_SPI_COMMANDS else SPI_PRIORITY_NORMAL
+                transfer = SpiTransfer(frame, frame_priority, context=context)
+
+                if cmd_id in SUPERSEDABLE_SPI_COMMANDS:
+                    previous = self.__latest__.get(cmd_id)
+                    if previous is not None and not previous.superseded:
+                        previous.superseded = True
+                        self.frames_dropped += 1
+                    self.__latest__[cmd_id] = transfer
+
+                self.__push__(transfer)
+            self.__condition__.notify()
+
+    def query(self, data, response_size, timeout=SPI_QUERY_TIMEOUT):
+        """query
+
+            Send a request and read its response, in turn with the queued frames.
+        :param data: request to be sent
+        :type data: list of int or bytes
+        :param response_size: number of bytes to be read
+        :param timeout: seconds to wait for the response
+        :return: data received after the request
+        :rtype: list of int
+        """
+        transfer = SpiTransfer(data, SPI_PRIORITY_NORMAL, response_size=response_size)
+        with self.__condition__:
+            self.__push__(transfer)
+            self.__condition__.notify()
+        return transfer.future.result(timeout)
+
+    def __push__(self, transfer):
+        """__push__
+
+            Queue a transfer; the condition is held by the caller.
+        :return: None
+        """
+        self.__sequence__ += 1
+        heapq.heappush(self.__queue__, (transfer.priority, self.__sequence__, transfer))
+        self.max_queue_depth = max(self.max_queue_depth, len(self.__queue__))
+
+    def __next_batch__(self):
+        """__next_batch__
+
+            Wait for the next transfers to be sent together.
+        :return: a single query, or writes sharing one transaction; empty once stopped
+        :rtype: list of SpiTransfer
+        """
+        with self.__condition__:
+            while True:
+                while self.__queue__ and self.__queue__[0][2].superseded:
+                    heapq.heappop(self.__queue__)
+                if not self.__queue__:
+                    if not self.running:
+                        return []
+                    self.__condition__.wait()
+                    continue
+
+                first = self.__queue__[0][2]
+                delay = first.submitted_at + self.batch_window - monotonic()
+                if first.response_size is not None or delay <= 0 or not self.running:
+                    break
+                self.__condition__.wait(delay)
+
+            if first.response_size is not None:
+                heapq.heappop(self.__queue__)
+                return [first]
+
+            batch = []
+            batch_size = 0
+            while self.__queue__:
+                transfer = self.__queue__[0][2]
+                if transfer.superseded:
+                    heapq.heappop(self.__queue__)
+                    continue
+                if transfer.response_size is not None:
+                    break
+                if batch and batch_size + len(transfer.frame) > SPI_MAX_BATCH_SIZE:
+                    break
+                heapq.heappop(self.__queue__)
+                batch.append(transfer)
+                batch_size += len(transfer.frame)
+
+            for transfer in batch:
+                cmd_id = get_spi_frame_cmd_id(transfer.frame)
+                if self.__latest__.get(cmd_id) is transfer:
+                    del self.__latest__[cmd_id]
+            return batch
+
+    def __run__(self):
+        """__run__
+
+            Worker thread.
+        :return: None
+        """
+        while True:
+            batch = self.__next_batch__()
+            if not batch:
+                return
+
+            write_started = monotonic()
+            for transfer in batch:
+                self.queue_wait.record(write_started - transfer.submitted_at)
+
+            if batch[0].response_size is not None:
+                transfer = batch[0]
+                try:
+                    transfer.future.set_result(self.driver.query_spi_data(transfer.frame, transfer.response_size))
+                except Exception as err:
+                    transfer.future.set_exception(err)
+                self.transactions += 1
+                continue
+
+            data = bytearray()
+            for transfer in batch:
+                data.extend(transfer.frame)
+            try:
+                self.driver.send_spi_data(data)
+            except Exception as err:
+                LOGGER.error("Error occurred while sending SPI data! {}".format(err))
+                continue
+
+            self.transactions += 1
+            self.batches += 1
+            self.frames_sent += len(batch)
+            self.max_batch_size = max(self.max_batch_size, len(batch))
+
+            if self.sent_callback is not None:
+                reported = set()
+                for transfer in batch:
+                    if transfer.context is not None and id(transfer.context) not in reported:
+                        reported.add(id(transfer.context))
+                        self.sent_callback(transfer.context, write_started)
+
+    def get_statistics(self):
+        """get_statistics
+
+            Get the worker's queue and batching figures.
+        :return: statistics
+        :rtype: dict
+        """
+        return {
+            'queue_depth': self.queue_depth,
+            'max_queue_depth': self.max_queue_depth,
+            'transactions': self.transactions,
+            'batches': self.batches,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'average_batch_size': self.frames_sent / float(self.batches) if self.batches else 0.,
+            'max_batch_size': self.max_batch_size,
+            'queue_wait': self.queue_wait.summary(),
+        }
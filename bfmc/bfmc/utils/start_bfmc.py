@@ -1,5 +1,12 @@
+import logging
+
 from bfmc.core import BFMC
+from bfmc.utils.log_utils import start_async_logging
 
 
-bfmc = BFMC()
-bfmc.listen()
+if __name__ == '__main__':
+    # file and console writes happen on a background thread, chatty call sites are rate limited
+    start_async_logging(logging.getLogger('bfmc'))
+    # clients can connect while the hardware comes up
+    bfmc = BFMC(wait_ready=False)
+    bfmc.listen()
@@ -0,0 +1,93 @@
+import threading
+
+from collections import deque
+
+LATENCY_WINDOW = 4096  # samples kept for the rolling percentiles
+SUMMARY_PERCENTILES = (50, 90, 95, 99)
+
+
+def percentile(values, q):
+    """percentile
+
+        Nearest-rank percentile of sorted values.
+    :param values: sorted values
+    :type values: list
+    :param q: percentile in range [0, 100]
+    :type q: float
+    :return: value at the given percentile, None if there is no value
+    """
+    if not values:
+        return None
+    index = min(len(values) - 1, int(round(q / 100. * (len(values) - 1))))
+    return values[index]
+
+
+class LatencyRecorder:
+    """LatencyRecorder
+
+        Class used to keep a rolling window of latency samples and summarize them as percentiles.
+    """
+    def __init__(self, window=LATENCY_WINDOW):
+        """Constructor
+
+        :param window: number of most recent samples the percentiles are computed on
+        :type window: int
+        """
+        self.__samples__ = deque(maxlen=window)
+        self.__lock__ = threading.Lock()
+        self.count = 0
+
+    def record(self, latency):
+        """record
+
+            Record a latency sample.
+        :param latency: latency, in seconds
+        :type latency: float
+        :return: None
+        """
+        with self.__lock__:
+            self.__samples__.append(latency)
+            self.count += 1
+
+    def reset(self):
+        """reset
+
+            Forget all samples.
+        :return: None
+        """
+        with self.__lock__:
+            self.__samples__.clear()
+            self.count = 0
+
+    def summary(self, percentiles=SUMMARY_PERCENTILES):
+        """summary
+
+            Summarize the samples of the rolling window.
+        :param percentiles: percentiles to be computed
+        :return: number of samples ever recorded, min, max and the requested percentiles, in seconds
+        :rtype: dict
+        """
+        with self.__lock__:
+            samples = sorted(self.__samples__)
+            count = self.count
+
+        summary = {'count': count, 'min': samples[0] if samples else None, 'max': samples[-1] if samples else None}
+        for q in percentiles:
+            summary['p{}'.format(q)] = percentile(samples, q)
+        return summary
+
+
+def format_latency_summary(summary):
+    """format_latency_summary
+
+    :param summary: summary returned by LatencyRecorder.summary
+    :type summary: dict
+    :return: summary as one line, in milliseconds
+    :rtype: str
+    """
+    if not summary['count']:
+        return 'no samples'
+    parts = ['n={}'.format(summary['count'])]
+    for key in ['min'] + sorted((k for k in summary if k.startswith('p')), key=lambda k: float(k[1:])) + ['max']:
+        parts.append('{} {:.2f} ms'.format(key, summary[key] * 1000))
+    return '  '.join(parts)
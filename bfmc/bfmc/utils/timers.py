@@ -0,0 +1,139 @@
+import heapq
+import logging
+import threading
+
+from time import monotonic
+
+from bfmc.utils.stats import LatencyRecorder
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+
+class Timer:
+    """Timer
+
+        Delayed call waiting in a TimerService.
+    """
+    def __init__(self, deadline, callback, args):
+        """Constructor
+
+        :param deadline: monotonic time the callback is due at
+        :param callback: called once the deadline is reached
+        :param args: callback's arguments
+        """
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        """cancel
+
+            Do not call the callback, if not called yet.
+        :return: None
+        """
+        self.cancelled = True
+
+
+class TimerService:
+    """TimerService
+
+        Single thread calling delayed callbacks (debounce deadlines, hold-offs) in deadline order, from a
+    heap. The number of threads stays the same however many timers are pending; callbacks run on the
+    service's thread and must be short.
+    """
+    def __init__(self):
+        """Constructor
+
+        """
+        self.__heap__ = []
+        self.__sequence__ = 0
+        self.__condition__ = threading.Condition()
+        self.running = True
+
+        self.fired = 0
+        self.cancelled = 0
+        # time between a timer's deadline and its call
+        self.lateness = LatencyRecorder()
+
+        self.__thread__ = threading.Thread(target=self.__run__, daemon=True)
+        self.__thread__.start()
+
+    def call_at(self, deadline, callback, *args):
+        """call_at
+
+        :param deadline: monotonic time the callback is due at
+        :param callback: called with args once the deadline is reached
+        :return: timer, which can be cancelled
+        :rtype: Timer
+        """
+        timer = Timer(deadline, callback, args)
+        with self.__condition__:
+            self.__sequence__ += 1
+            heapq.heappush(self.__heap__, (deadline, self.__sequence__, timer))
+            if self.__heap__[0][2] is timer:
+                # new earliest deadline: the thread has to wake up sooner
+                self.__condition__.notify()
+        return timer
+
+    def call_later(self, delay, callback, *args):
+        """call_later
+
+        :param delay: seconds from now
+        :param callback: called with args once the delay elapsed
+        :return: timer, which can be cancelled
+        :rtype: Timer
+        """
+        return self.call_at(monotonic() + delay, callback, *args)
+
+    @property
+    def pending(self):
+        """pending
+
+        :return: number of timers waiting, cancelled ones included
+        :rtype: int
+        """
+        return len(self.__heap__)
+
+    def stop(self):
+        """stop
+
+            Stop the service, dropping the pending timers.
+        :return: None
+        """
+        with self.__condition__:
+            self.running = False
+            self.__condition__.notify()
+        self.__thread__.join()
+
+    def __run__(self):
+        """__run__
+
+            Service thread.
+        :return: None
+        """
+        while True:
+            with self.__condition__:
+                while True:
+                    if not self.running:
+                        return
+                    if self.__heap__:
+                        delay = self.__heap__[0][0] - monotonic()
+                        if delay <= 0:
+                            break
+                        self.__condition__.wait(delay)
+                    else:
+                        self.__condition__.wait()
+                timer = heapq.heappop(self.__heap__)[2]
+
+            if timer.cancelled:
+                self.cancelled += 1
+                continue
+
+            self.lateness.record(monotonic() - timer.deadline)
+            self.fired += 1
+            try:
+                timer.callback(*timer.args)
+            except Exception as err:
+                LOGGER.error("Error occurred in timer callback! {}".format(err))
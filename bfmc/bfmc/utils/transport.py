@@ -0,0 +1,439 @@
+import errno
+import logging
+import os
+import queue
+import select
+import threading
+import socket as py_socket
+
+from bfmc.utils.connection_utils import *
+
+LOGGER = logging.getLogger('bfmc')
+LOGGER.setLevel(logging.INFO)
+
+UNIX_SOCKET_PATH = '/tmp/bfmc_{}.sock'  # formatted with the port, so host and client agree on the address
+
+TRANSPORT_TCP = 'tcp'
+TRANSPORT_UNIX = 'unix'
+TRANSPORT_IN_PROCESS = 'inprocess'
+
+CHANNEL_CLOSED = None  # queued by an in-process channel's end when it is closed
+
+
+class SocketChannel:
+    """SocketChannel
+
+        Connection over a stream socket (TCP or Unix-domain): frames are packed to bytes and split again
+    on reception.
+    """
+    serializes = True
+
+    def __init__(self, socket):
+        """Constructor
+
+        :param socket: connected stream socket
+        """
+        self.socket = socket
+        self.__frame_reader__ = FrameReader()
+
+    def send_frame(self, kind, request_id, payload, timestamp=None):
+        """send_frame
+
+            Send a frame to the peer.
+        :param kind: frame kind, one of FRAME_KIND_*
+        :param request_id: request's ID
+        :param payload: frame's payload
+        :type payload: bytes
+        :param timestamp: payload's creation time on the receiver's monotonic clock, if any
+        :return: None
+        """
+        self.socket.sendall(pack_frame(kind, request_id, payload, timestamp))
+
+    def receive_frames(self, timeout=None):
+        """receive_frames
+
+            Receive the peer's next frames.
+        :param timeout: seconds to wait for data, forever if None
+        :return: complete frames received, empty if none arrived in time, None if the peer closed the connection
+        :rtype: list of Frame
+        """
+        if timeout is not None:
+            readable, _, _ = select.select([self.socket], [], [], timeout)
+            if not readable:
+                return []
+        data = self.socket.recv(BUFFER_SIZE)
+        if not data:
+            return None
+        return self.__frame_reader__.feed(data)
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        self.socket.close()
+
+
+class QueueChannel:
+    """QueueChannel
+
+        One end of an in-process connection: frames are handed over to the other end as objects,
+    payloads included, without being packed or encoded.
+    """
+    serializes = False
+
+    def __init__(self, incoming, outgoing):
+        """Constructor
+
+        :param incoming: queue of the frames sent by the other end
+        :type incoming: queue.Queue
+        :param outgoing: queue of the frames sent to the other end
+        :type outgoing: queue.Queue
+        """
+        self.__incoming__ = incoming
+        self.__outgoing__ = outgoing
+        self.closed = False
+
+    @staticmethod
+    def pair():
+        """pair
+
+            Create both ends of an in-process connection.
+        :return: the two connected ends
+        :rtype: tuple of QueueChannel
+        """
+        first_to_second = queue.Queue()
+        second_to_first = queue.Queue()
+        return QueueChannel(second_to_first, first_to_second), QueueChannel(first_to_second, second_to_first)
+
+    def send_frame(self, kind, request_id, payload, timestamp=None):
+        """send_frame
+
+            Hand a frame over to the other end.
+        :param kind: frame kind, one of FRAME_KIND_*
+        :param request_id: request's ID
+        :param payload: frame's payload, of any type
+        :param timestamp: payload's creation time on the receiver's monotonic clock, if any
+        :return: None
+        """
+        if self.closed:
+            raise OSError(errno.EPIPE, 'In-process channel is closed!')
+        self.__outgoing__.put(Frame(kind, request_id, payload, timestamp))
+
+    def receive_frames(self, timeout=None):
+        """receive_frames
+
+            Receive the other end's next frames.
+        :param timeout: seconds to wait for a frame, forever if None
+        :return: frames received, empty if none arrived in time, None if the connection is closed
+        :rtype: list of Frame
+        """
+        try:
+            frame = self.__incoming__.get(timeout=timeout)
+        except queue.Empty:
+            return []
+
+        frames = []
+        while frame is not CHANNEL_CLOSED:
+            frames.append(frame)
+            try:
+                frame = self.__incoming__.get_nowait()
+            except queue.Empty:
+                return frames
+
+        # closed: keep answering None to any further call
+        self.__incoming__.put(CHANNEL_CLOSED)
+        return frames or None
+
+    def close(self):
+        """close
+
+            Close the connection for both ends.
+        :return: None
+        """
+        if self.closed:
+            return
+        self.closed = True
+        self.__outgoing__.put(CHANNEL_CLOSED)
+        self.__incoming__.put(CHANNEL_CLOSED)
+
+
+class SocketListener:
+    """SocketListener
+
+        Listening stream socket handing out a SocketChannel per accepted client.
+    """
+    def __init__(self, socket, address, path=None):
+        """Constructor
+
+        :param socket: bound and listening socket
+        :param address: listening address, for the logs
+        :param path: Unix-domain socket's path, removed on close
+        """
+        self.socket = socket
+        self.address = address
+        self.path = path
+
+    def accept(self):
+        """accept
+
+            Wait for a client.
+        :return: client's channel and address
+        :rtype: tuple
+        """
+        client, client_address = self.socket.accept()
+        if self.socket.family == py_socket.AF_INET:
+            # small control packages must not wait for the previous ones to be acknowledged
+            client.setsockopt(py_socket.IPPROTO_TCP, py_socket.TCP_NODELAY, 1)
+        else:
+            client_address = self.address
+        return SocketChannel(client), client_address
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        self.socket.close()
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class InProcessListener:
+    """InProcessListener
+
+        In-process server, reached through InProcessTransport by its port.
+    """
+    def __init__(self, port):
+        """Constructor
+
+        :param port: port the server is registered with
+        """
+        self.address = 'in-process:{}'.format(port)
+        self.__port__ = port
+        self.__clients__ = queue.Queue()
+
+    def connect(self):
+        """connect
+
+            Open a connection with this server.
+        :return: client's end of the connection
+        :rtype: QueueChannel
+        """
+        client_channel, host_channel = QueueChannel.pair()
+        self.__clients__.put(host_channel)
+        return client_channel
+
+    def accept(self):
+        """accept
+
+            Wait for a client.
+        :return: host's end of the client's connection and client's address
+        :rtype: tuple
+        """
+        channel = self.__clients__.get()
+        if channel is CHANNEL_CLOSED:
+            self.__clients__.put(CHANNEL_CLOSED)
+            raise OSError(errno.EBADF, 'In-process server is closed!')
+        return channel, self.address
+
+    def close(self):
+        """close
+
+        :return: None
+        """
+        InProcessTransport.unregister(self.__port__, self)
+        self.__clients__.put(CHANNEL_CLOSED)
+
+
+class TcpTransport:
+    """TcpTransport
+
+        Default transport: TCP sockets, reachable over the network.
+    """
+    name = TRANSPORT_TCP
+    network = True
+    serializes = True
+
+    def listen(self, port, backlog):
+        """listen
+
+            Start listening on all interfaces.
+        :param port: server's port
+        :param backlog: number of connection requests kept waiting
+        :return: listener
+        :rtype: SocketListener
+        """
+        socket = py_socket.socket(py_socket.AF_INET, py_socket.SOCK_STREAM)
+        try:
+            socket.bind(("", port))
+            socket.listen(backlog)
+        except OSError:
+            socket.close()
+            raise
+        return SocketListener(socket, ("", port))
+
+    def connect(self, host, port):
+        """connect
+
+            Connect to a server.
+        :param host: server's name or IP address
+        :param port: server's port
+        :return: connection
+        :rtype: SocketChannel
+        """
+        socket = py_socket.socket(py_socket.AF_INET, py_socket.SOCK_STREAM)
+        try:
+            socket.connect((host, port))
+        except OSError:
+            socket.close()
+            raise
+        # small control packages must not wait for the previous ones to be acknowledged
+        socket.setsockopt(py_socket.IPPROTO_TCP, py_socket.TCP_NODELAY, 1)
+        return SocketChannel(socket)
+
+
+class UnixTransport:
+    """UnixTransport
+
+        Unix-domain sockets, for the RC and the car running on the same machine: same framing as TCP,
+    without the network stack.
+    """
+    name = TRANSPORT_UNIX
+    network = False
+    serializes = True
+
+    def __init__(self, path=None):
+        """Constructor
+
+        :param path: socket's path, UNIX_SOCKET_PATH formatted with the port if None
+        """
+        if not hasattr(py_socket, 'AF_UNIX'):
+            raise OSError(errno.EAFNOSUPPORT, 'Unix-domain sockets are not supported on this platform!')
+        self.path = path
+
+    def get_path(self, port):
+        """get_path
+
+        :param port: server's port
+        :return: socket's path
+        :rtype: str
+        """
+        if self.path is not None:
+            return self.path
+        return UNIX_SOCKET_PATH.format(port)
+
+    def listen(self, port, backlog):
+        """listen
+
+            Start listening on the socket's path, replacing a stale socket file if any.
+        :param port: server's port
+        :param backlog: number of connection requests kept waiting
+        :return: listener
+        :rtype: SocketListener
+        """
+        path = self.get_path(port)
+        if os.path.exists(path):
+            os.remove(path)
+        socket = py_socket.socket(py_socket.AF_UNIX, py_socket.SOCK_STREAM)
+        try:
+            socket.bind(path)
+            socket.listen(backlog)
+        except OSError:
+            socket.close()
+            raise
+        return SocketListener(socket, path, path=path)
+
+    def connect(self, host, port):
+        """connect
+
+            Connect to a server.
+        :param host: ignored, the server runs on this machine
+        :param port: server's port
+        :return: connection
+        :rtype: SocketChannel
+        """
+        socket = py_socket.socket(py_socket.AF_UNIX, py_socket.SOCK_STREAM)
+        try:
+            socket.connect(self.get_path(port))
+        except OSError:
+            socket.close()
+            raise
+        return SocketChannel(socket)
+
+
+class InProcessTransport:
+    """InProcessTransport
+
+        Host and clients in the same process, e.g. simulation runs: frames are handed over through
+    queues, without sockets, packing or encoding. Servers are found by their port.
+    """
+    name = TRANSPORT_IN_PROCESS
+    network = False
+    serializes = False
+
+    __listeners__ = {}
+    __listeners_lock__ = threading.Lock()
+
+    def listen(self, port, backlog):
+        """listen
+
+            Register an in-process server.
+        :param port: server's port
+        :param backlog: ignored, waiting clients are not limited
+        :return: listener
+        :rtype: InProcessListener
+        """
+        with InProcessTransport.__listeners_lock__:
+            if port in InProcessTransport.__listeners__:
+                raise OSError(errno.EADDRINUSE, 'In-process port {} is already in use!'.format(port))
+            listener = InProcessListener(port)
+            InProcessTransport.__listeners__[port] = listener
+        return listener
+
+    @staticmethod
+    def unregister(port, listener):
+        """unregister
+
+            Remove a closed in-process server.
+        :param port: server's port
+        :param listener: server's listener
+        :return: None
+        """
+        with InProcessTransport.__listeners_lock__:
+            if InProcessTransport.__listeners__.get(port) is listener:
+                del InProcessTransport.__listeners__[port]
+
+    def connect(self, host, port):
+        """connect
+
+            Connect to an in-process server.
+        :param host: ignored, the server runs in this process
+        :param port: server's port
+        :return: connection
+        :rtype: QueueChannel
+        """
+        with InProcessTransport.__listeners_lock__:
+            listener = InProcessTransport.__listeners__.get(port)
+        if listener is None:
+            raise ConnectionRefusedError(errno.ECONNREFUSED, 'No in-process server on port {}!'.format(port))
+        return listener.connect()
+
+
+TRANSPORTS = {
+    TRANSPORT_TCP: TcpTransport,
+    TRANSPORT_UNIX: UnixTransport,
+    TRANSPORT_IN_PROCESS: InProcessTransport,
+}
+
+
+def get_transport(name=TRANSPORT_TCP):
+    """get_transport
+
+    :param name: transport's name, one of TRANSPORT_*
+    :type name: str
+    :return: transport
+    """
+    if name not in TRANSPORTS:
+        raise ValueError('Unknown transport: {}'.format(name))
+    return TRANSPORTS[name]()
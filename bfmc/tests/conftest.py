@@ -0,0 +1,11 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+# importing bfmc creates its logs folder in the working directory: keep it out of the tree
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+__working_directory__ = tempfile.mkdtemp(prefix='bfmc_tests_')
+os.chdir(__working_directory__)
+atexit.register(shutil.rmtree, __working_directory__, True)
@@ -0,0 +1,101 @@
+import threading
+
+import pytest
+
+from bfmc.core import BFMC
+from bfmc.process_runtime import SETPOINT_LAYOUT, NetworkFrontEnd
+from bfmc.utils.connection_utils import (FRAME_KIND_BATCH, FRAME_KIND_COMMAND, RESPONSE_ERROR, RESPONSE_OK, Frame,
+                                         pack_batch, unpack_batch)
+from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+from bfmc.utils.shared_state import SharedRing, SharedSnapshot
+
+
+@pytest.fixture
+def car():
+    car = BFMC(serial_connection=SerialEmulator(), spi=SpiEmulator(), serve=False)
+    yield car
+    car.shutdown()
+
+
+def test_batch_round_trip():
+    packages = [b'$i10$d20 5', b'', b'$i13$d0']
+    assert [bytes(package) for package in unpack_batch(pack_batch(packages))] == packages
+    assert unpack_batch(pack_batch([])) == []
+    # handed over in-process, the packages are kept as they are
+    assert unpack_batch(['$i13$d0']) == ['$i13$d0']
+
+
+@pytest.mark.parametrize('payload', [b'\x00', b'\x00\x05$i13', pack_batch([b'$i13$d0']) + b'\x00'])
+def test_truncated_batch_is_refused(payload):
+    with pytest.raises(ConnectionError):
+        unpack_batch(payload)
+
+
+@pytest.mark.parametrize('payload', [
+    b'\x00',
+    b'\x00\x05$i13',
+    pack_batch([b'$i10$d30']),
+    pack_batch([b'$iX$d0']),
+    pack_batch([b'move']),
+    pack_batch([b'\xff\xfe']),
+    ['$i10$d30'],
+])
+def test_malformed_batch_is_answered_with_an_error(car, payload):
+    assert car.handle_frame(Frame(FRAME_KIND_BATCH, 1, payload, None)) == RESPONSE_ERROR
+    # the car is still driven afterwards
+    assert car.handle_frame(Frame(FRAME_KIND_BATCH, 2, pack_batch([b'$i13$d0']), None)) == RESPONSE_OK
+    assert car.control_loop.wait_applied(car.control_loop.setpoint.sequence, 1.)
+    assert car.control_loop.braking
+
+
+def test_malformed_batch_is_not_applied(car):
+    car.handle_frame(Frame(FRAME_KIND_BATCH, 1, pack_batch([b'$i13$d0']), None))
+    sequence = car.control_loop.setpoint.sequence
+    payload = pack_batch([b'$i10$d20 5', b'$i10$d30'])
+    assert car.handle_frame(Frame(FRAME_KIND_BATCH, 2, payload, None)) == RESPONSE_ERROR
+    assert car.control_loop.setpoint.sequence == sequence
+
+
+def test_last_move_of_a_batch_is_the_setpoint(car):
+    payload = pack_batch([b'$i10$d20 5', b'$i13$d0', b'$i10$d10 -3'])
+    assert car.handle_frame(Frame(FRAME_KIND_BATCH, 1, payload, None)) == RESPONSE_OK
+    assert (car.control_loop.setpoint.power, car.control_loop.setpoint.steering) == (10., -3.)
+
+
+def test_invalid_utf8_command_is_answered_with_an_error(car):
+    assert car.handle_frame(Frame(FRAME_KIND_COMMAND, 1, b'$i10$d\xff', None)) == RESPONSE_ERROR
+
+
+class FrameSource:
+    """FrameSource
+
+        Host handing over the given frames, then reporting every client gone.
+    """
+    def __init__(self, frames):
+        self.frames = list(frames)
+        self.responses = []
+        self.max_clients = 1
+        self.current_frame_received_at = None
+
+    def connect_with_client(self):
+        pass
+
+    def get_frame(self):
+        return self.frames.pop(0) if self.frames else None
+
+    def send_response(self, request_id, response):
+        self.responses.append((request_id, response))
+
+
+def test_malformed_batch_does_not_end_the_runtime_serving():
+    setpoints = SharedSnapshot(SETPOINT_LAYOUT)
+    spi_ring = SharedRing(slots=4, slot_size=64)
+    connection = FrameSource([Frame(FRAME_KIND_BATCH, 1, b'\x00', None),
+                              Frame(FRAME_KIND_BATCH, 2, pack_batch([b'$i10$d30']), None),
+                              Frame(FRAME_KIND_BATCH, 3, pack_batch([b'$i10$d20 5']), None)])
+    try:
+        NetworkFrontEnd(connection, setpoints, spi_ring, threading.Event()).serve()
+        assert connection.responses == [(1, RESPONSE_ERROR), (2, RESPONSE_ERROR), (3, RESPONSE_OK)]
+    finally:
+        spi_ring.close()
+        setpoints.close()
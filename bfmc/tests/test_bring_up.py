@@ -0,0 +1,80 @@
+import threading
+
+import pytest
+
+from bfmc.utils.bring_up import BringUp
+
+
+def test_independent_steps_overlap_and_requirements_run_first():
+    bring_up = BringUp()
+    barrier = threading.Barrier(2, timeout=2.)
+    order = []
+    # each of these steps waits for the other one: they only succeed if they run at once
+    bring_up.add('serial', lambda: order.append('serial') or barrier.wait(), attempts=1)
+    bring_up.add('spi', lambda: order.append('spi') or barrier.wait(), attempts=1)
+    bring_up.add('pid', lambda: order.append('pid'), requires=['serial', 'spi'])
+    bring_up.start()
+
+    assert bring_up.wait_for('pid', timeout=2.)
+    assert bring_up.wait(timeout=2.)
+    assert bring_up.ready
+    assert sorted(order[:2]) == ['serial', 'spi'] and order[2] == 'pid'
+    timings = bring_up.get_timings()
+    assert timings['pid']['started_at'] >= max(timings['serial']['started_at'] + timings['serial']['duration'],
+                                               timings['spi']['started_at'] + timings['spi']['duration'])
+
+
+def test_step_is_retried_until_it_succeeds():
+    calls = []
+
+    def open_device():
+        calls.append(len(calls))
+        if len(calls) < 3:
+            raise IOError('Device busy!')
+
+    bring_up = BringUp(concurrent=False)
+    bring_up.add('serial', open_device, attempts=3, retry_delay=0.)
+    bring_up.start()
+    assert bring_up.wait(timeout=0.)
+    assert bring_up.get_timings()['serial']['attempts'] == 3
+
+
+def failing_step():
+    raise IOError('No device!')
+
+
+def test_optional_step_failure_only_skips_its_dependents():
+    bring_up = BringUp(concurrent=False)
+    bring_up.add('camera', failing_step, attempts=2, retry_delay=0., required=False)
+    bring_up.add('stream', lambda: None, requires=['camera'], required=False)
+    bring_up.add('server', lambda: None)
+    bring_up.start()
+
+    assert bring_up.wait(timeout=0.)
+    assert bring_up.ready
+    assert not bring_up.wait_for('stream')
+    assert bring_up.get_timings()['camera']['attempts'] == 2
+    assert bring_up.get_timings()['stream']['attempts'] == 0
+    assert bring_up.wait_for('server')
+
+
+def test_required_step_failure_is_raised():
+    bring_up = BringUp()
+    bring_up.add('serial', failing_step, attempts=1)
+    bring_up.start()
+    with pytest.raises(IOError):
+        bring_up.wait(timeout=2.)
+    assert not bring_up.ready
+
+
+def test_steps_are_added_once_after_their_requirements():
+    bring_up = BringUp()
+    bring_up.add('serial', lambda: None)
+    with pytest.raises(ValueError):
+        bring_up.add('serial', lambda: None)
+    with pytest.raises(ValueError):
+        bring_up.add('pid', lambda: None, requires=['spi'])
+
+    empty = BringUp()
+    empty.start()
+    assert empty.wait(timeout=0.) and empty.ready
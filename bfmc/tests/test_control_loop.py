@@ -0,0 +1,105 @@
+from bfmc.utils.control_loop import ControlLoop, step_towards
+
+
+class RecordingSerial:
+    """RecordingSerial
+
+        Serial handler keeping the commands written to the Nucleo.
+    """
+    def __init__(self):
+        self.sent = []
+
+    def send(self, msg):
+        self.sent.append(msg)
+
+
+def make_loop(**kwargs):
+    serial = RecordingSerial()
+    return ControlLoop(serial, lambda power: power / 100., **kwargs), serial
+
+
+def test_step_towards():
+    assert step_towards(0., 1., .25) == .25
+    assert step_towards(0., -1., .25) == -.25
+    assert step_towards(.9, 1., .25) == 1.
+    assert step_towards(0., 1., None) == 1.
+
+
+def test_no_write_without_setpoint():
+    loop, serial = make_loop()
+    loop.step()
+    assert serial.sent == []
+
+
+def test_setpoint_register_keeps_the_latest():
+    loop, serial = make_loop(max_speed_step=None, max_steering_step=None)
+    first = loop.set_move(power=10, steering=5.)
+    second = loop.set_move(power=20, steering=-5.)
+    assert second > first
+    assert loop.setpoint.power == 20
+    assert loop.setpoint.sequence == second
+
+    loop.step()
+    assert serial.sent == ['#MCTL:0.20;-5.00;;\r\n']
+    assert loop.applied_sequence == second
+    assert loop.setpoints == 2
+
+
+def test_unchanged_output_is_written_once():
+    loop, serial = make_loop(max_speed_step=None, max_steering_step=None)
+    loop.set_move(power=10, steering=0.)
+    loop.step()
+    loop.step()
+    sequence = loop.set_move(power=10, steering=0.)
+    loop.step()
+    assert len(serial.sent) == 1
+    # an unchanged setpoint counts as applied
+    assert loop.wait_applied(sequence, 0)
+
+
+def test_rate_limits():
+    loop, serial = make_loop(max_speed_step=.05, max_steering_step=5.)
+    loop.set_move(power=20, steering=12.)
+    for _ in range(4):
+        loop.step()
+    assert serial.sent == ['#MCTL:0.05;5.00;;\r\n', '#MCTL:0.10;10.00;;\r\n', '#MCTL:0.15;12.00;;\r\n',
+                           '#MCTL:0.20;12.00;;\r\n']
+
+
+def test_brake_and_unlimited_moves_skip_the_rate_limits():
+    loop, serial = make_loop(max_speed_step=.05, max_steering_step=5.)
+    loop.set_move(speed=.3, steering=20., limited=False)
+    loop.step()
+    loop.set_brake()
+    loop.step()
+    assert serial.sent == ['#MCTL:0.30;20.00;;\r\n', '#BRAK:0.00;;\r\n']
+    assert loop.braking
+
+
+def test_write_error_is_retried():
+    loop, serial = make_loop(max_speed_step=None, max_steering_step=None)
+    sequence = loop.set_brake()
+
+    def fail(msg):
+        raise IOError('unplugged')
+    serial.send = fail
+    loop.step()
+    assert loop.write_errors == 1
+    assert not loop.wait_applied(sequence, 0)
+
+    del serial.send
+    loop.step()
+    assert serial.sent == ['#BRAK:0.00;;\r\n']
+    assert loop.wait_applied(sequence, 0)
+
+
+def test_loop_thread_applies_setpoints():
+    loop, serial = make_loop(frequency=200., max_speed_step=None, max_steering_step=None)
+    loop.start()
+    try:
+        assert loop.wait_applied(loop.set_move(speed=.1, steering=3.), 1.)
+        assert loop.wait_applied(loop.set_brake(), 1.)
+    finally:
+        loop.stop()
+    assert serial.sent[-1] == '#BRAK:0.00;;\r\n'
+    assert loop.get_statistics()['ticks'] > 0
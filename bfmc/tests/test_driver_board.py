@@ -0,0 +1,40 @@
+from bfmc.utils.driver.core import BFMCDriverBoardSTM
+
+
+class LoopbackSpi:
+    """LoopbackSpi
+
+        SPI device keeping what is written and answering with the given bytes.
+    """
+    def __init__(self, answer=()):
+        self.answer = list(answer)
+        self.transfers = []
+
+    def open(self, bus, device):
+        pass
+
+    def xfer(self, data):
+        assert isinstance(data, list)
+        self.transfers.append(list(data))
+        return [0] * len(data)
+
+    def xfer2(self, data):
+        self.transfers.append(list(data))
+        return [0] * (len(data) - len(self.answer)) + self.answer
+
+
+def test_data_is_written_with_xfer():
+    spi = LoopbackSpi()
+    board = BFMCDriverBoardSTM(spi=spi)
+    board.send_spi_data(b'\x09\x0d')
+    board.send_spi_data([1, 2])
+    assert spi.transfers == [[9, 13], [1, 2]]
+
+
+def test_query_clocks_zero_bytes_after_each_request():
+    spi = LoopbackSpi(answer=[7, 8])
+    board = BFMCDriverBoardSTM(spi=spi)
+    assert board.query_spi_data([1, 2, 3], 2) == [7, 8]
+    assert board.query_spi_data([4, 5], 3) == [0, 7, 8]
+    assert board.query_spi_data(b'\x06\x07\x08', 2) == [7, 8]
+    assert spi.transfers == [[1, 2, 3, 0, 0], [4, 5, 0, 0, 0], [6, 7, 8, 0, 0]]
@@ -0,0 +1,88 @@
+import socket
+import threading
+
+import pytest
+
+from concurrent.futures import TimeoutError
+
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import (FRAME_HEADER, FRAME_KIND_COMMAND, FRAME_KIND_RESPONSE, MAX_FRAME_PAYLOAD,
+                                         FrameReader, pack_frame)
+
+
+def test_frame_round_trip():
+    reader = FrameReader()
+    frames = reader.feed(pack_frame(FRAME_KIND_COMMAND, 7, b'$i13$d0') +
+                         pack_frame(FRAME_KIND_RESPONSE, 8, b'ok', timestamp=12.5))
+    assert [(frame.kind, frame.request_id, frame.payload, frame.timestamp) for frame in frames] == [
+        (FRAME_KIND_COMMAND, 7, b'$i13$d0', None), (FRAME_KIND_RESPONSE, 8, b'ok', 12.5)]
+
+
+def test_frames_split_across_reads_are_reassembled():
+    data = pack_frame(FRAME_KIND_COMMAND, 1, b'$i10$d20 5', timestamp=1.) + pack_frame(FRAME_KIND_COMMAND, 2, b'')
+    reader = FrameReader()
+    frames = []
+    for index in range(len(data)):
+        frames += reader.feed(data[index:index + 1])
+    assert [(frame.request_id, frame.payload, frame.timestamp) for frame in frames] == [
+        (1, b'$i10$d20 5', 1.), (2, b'', None)]
+
+
+@pytest.mark.parametrize('header', [
+    FRAME_HEADER.pack(0x00, FRAME_KIND_COMMAND, 0, 1, 0),
+    FRAME_HEADER.pack(0xBF, FRAME_KIND_COMMAND, 0, 1, MAX_FRAME_PAYLOAD + 1),
+])
+def test_invalid_frame_is_refused(header):
+    with pytest.raises(ConnectionError):
+        FrameReader().feed(header)
+
+
+class ReversingServer(threading.Thread):
+    """ReversingServer
+
+        Server answering every pair of requests in reverse order, with the request's payload.
+    """
+    def __init__(self):
+        threading.Thread.__init__(self, daemon=True)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.socket.listen(1)
+        self.port = self.socket.getsockname()[1]
+
+    def run(self):
+        connection, _ = self.socket.accept()
+        reader = FrameReader()
+        pending = []
+        while True:
+            data = connection.recv(1024)
+            if not data:
+                break
+            pending += reader.feed(data)
+            while len(pending) >= 2:
+                for frame in reversed(pending[:2]):
+                    connection.sendall(pack_frame(FRAME_KIND_RESPONSE, frame.request_id, frame.payload))
+                del pending[:2]
+        connection.close()
+        self.socket.close()
+
+
+def test_async_client_matches_responses_out_of_order():
+    server = ReversingServer()
+    server.start()
+    client = AsyncClient('127.0.0.1', server.port, default_timeout=2.)
+    client.connect_to_host()
+    try:
+        first = client.send_package_async('first')
+        second = client.send_package_async('second')
+        assert first.result(2.) == b'first'
+        assert second.result(2.) == b'second'
+        assert client.in_flight == 0
+
+        # never answered: the server waits for a second request
+        lonely = client.send_package_async('lonely', timeout=.05)
+        with pytest.raises(TimeoutError):
+            lonely.result(2.)
+        assert client.in_flight == 0
+    finally:
+        client.close()
+    server.join(2.)
@@ -0,0 +1,61 @@
+import queue
+
+from bfmc.utils.connection_utils import (FRAME_KIND_COMMAND, FRAME_KIND_PING, FRAME_KIND_PONG, PING_PAYLOAD,
+                                         PONG_PAYLOAD, Frame)
+from bfmc.utils.host import FRAME_QUEUE_SIZE, Host
+
+
+class ScriptedClient:
+    """ScriptedClient
+
+        Client connection receiving the chunks it is given, None closing it.
+    """
+    def __init__(self):
+        self.chunks = queue.Queue()
+        self.sent = queue.Queue()
+
+    def receive_frames(self):
+        return self.chunks.get()
+
+    def send_frame(self, kind, request_id, payload):
+        self.sent.put((kind, request_id, payload))
+
+    def close(self):
+        pass
+
+
+def command(request_id):
+    return Frame(FRAME_KIND_COMMAND, request_id, b'$i13$d0', None)
+
+
+def test_pings_are_answered_while_the_queue_is_full():
+    host = Host('localhost', 0)
+    client = ScriptedClient()
+    host.__add_client__(client)
+    ping = Frame(FRAME_KIND_PING, 1, PING_PAYLOAD.pack(12.5), None)
+    client.chunks.put([command(request_id) for request_id in range(FRAME_QUEUE_SIZE + 8)] + [ping])
+
+    kind, request_id, payload = client.sent.get(timeout=1.)
+    assert (kind, request_id) == (FRAME_KIND_PONG, 1)
+    assert PONG_PAYLOAD.unpack(payload)[0] == 12.5
+    assert host.get_frame().request_id == 0
+    client.chunks.put(None)
+
+
+def test_closed_connections_do_not_leak_into_the_next_client():
+    host = Host('localhost', 0)
+    first = ScriptedClient()
+    host.__add_client__(first)
+    first.chunks.put([command(1)])
+    first.chunks.put(None)
+    assert host.get_frame().request_id == 1
+    assert host.get_frame() is None
+    assert host.get_frame() is None
+
+    second = ScriptedClient()
+    host.__add_client__(second)
+    second.chunks.put([command(2)])
+    # the closed connection's marker is dropped once a client is connected
+    assert host.get_frame().request_id == 2
+    second.chunks.put(None)
+    assert host.get_frame() is None
@@ -0,0 +1,59 @@
+import pytest
+
+from bfmc.utils.rc_recording import (EVENT_AXIS, EVENT_BUTTON_DOWN, EVENT_BUTTON_UP, RECORDING_EVENT,
+                                     JoystickRecorder, ReplayRemoteControl, load_recording)
+from bfmc.utils.rc_utils import START_BUTTON
+
+
+def record_session(path):
+    recorder = JoystickRecorder(str(path), axes=[.5, -.25], buttons=[0, 1])
+    recorder.record(EVENT_AXIS, 0, 1., elapsed=.5)
+    recorder.record(EVENT_BUTTON_DOWN, 0, 1, elapsed=1.)
+    recorder.record(EVENT_BUTTON_UP, 1, 0, elapsed=1.)
+    recorder.close()
+    return recorder
+
+
+def test_recording_round_trip(tmp_path):
+    path = tmp_path / 'session.bfmcjs'
+    assert record_session(path).events == 6
+    assert load_recording(str(path)) == (2, 2, [
+        (0., EVENT_AXIS, 0, .5), (0., EVENT_AXIS, 1, -.25), (0., EVENT_BUTTON_DOWN, 1, 1.),
+        (.5, EVENT_AXIS, 0, 1.), (1., EVENT_BUTTON_DOWN, 0, 1.), (1., EVENT_BUTTON_UP, 1, 0.)])
+
+
+def test_cut_short_recording_is_loaded_up_to_its_last_event(tmp_path):
+    path = tmp_path / 'session.bfmcjs'
+    record_session(path)
+    data = path.read_bytes()
+    path.write_bytes(data[:-RECORDING_EVENT.size // 2])
+    assert len(load_recording(str(path))[2]) == 5
+
+    path.write_bytes(b'NOTBFMC!' + data[8:])
+    with pytest.raises(ValueError):
+        load_recording(str(path))
+
+
+def test_replay_applies_events_then_presses_start(tmp_path):
+    path = tmp_path / 'session.bfmcjs'
+    record_session(path)
+    rc = ReplayRemoteControl(str(path), speed=10.)
+    assert rc.init_rc_device()
+    assert len(rc.buttons) == START_BUTTON + 1
+
+    assert rc.wait_input(timeout=1.)
+    assert (rc.get_axis(0), rc.get_axis(1), rc.get_button(1)) == (.5, -.25, 1)
+    assert rc.take_presses() == [1]
+    # the next event is due in 50ms at 10x
+    assert not rc.wait_input(timeout=0.)
+
+    while rc.get_button(0) == 0:
+        assert rc.wait_input(timeout=1.)
+    assert (rc.get_axis(0), rc.get_button(1)) == (1., 0)
+    assert rc.take_presses() == [0]
+    assert rc.get_axis(5) == 0. and rc.get_button(START_BUTTON + 1) == 0
+
+    assert not rc.finished
+    assert rc.wait_input(timeout=1.)
+    assert rc.finished and rc.take_presses() == [START_BUTTON]
+    assert rc.get_button(START_BUTTON) == 1
@@ -0,0 +1,59 @@
+from bfmc.utils.rc_scheduler import MoveSendScheduler
+
+BRAKE = 'brake'
+
+
+def make_scheduler(**kwargs):
+    scheduler = MoveSendScheduler(send_period=.1, refresh_period=.5, brake_refresh_period=.05,
+                                  significant_power_change=10, significant_steering_change=4, **kwargs)
+    start = scheduler.__start__
+    return scheduler, start
+
+
+def test_first_command_is_sent():
+    scheduler, start = make_scheduler()
+    assert scheduler.time_to_next_send(start) == 0.
+    assert scheduler.should_send((0, 0), start)
+
+
+def test_unchanged_move_is_only_refreshed():
+    scheduler, start = make_scheduler()
+    scheduler.should_send((20, 5), start)
+    assert not scheduler.should_send((20, 5), start + .2)
+    assert abs(scheduler.time_to_next_send(start + .2) - .3) < 1e-9
+    assert scheduler.should_send((20, 5), start + .51)
+    assert scheduler.suppressed_packages == 1
+
+
+def test_small_change_waits_for_the_next_slot():
+    scheduler, start = make_scheduler()
+    scheduler.should_send((20, 5), start)
+    assert not scheduler.should_send((21, 6), start + .01)
+    assert abs(scheduler.time_to_next_send(start + .01) - .09) < 1e-9
+    assert scheduler.should_send((21, 6), start + .11)
+
+
+def test_significant_change_is_sent_at_once():
+    scheduler, start = make_scheduler()
+    scheduler.should_send((20, 5), start)
+    assert scheduler.should_send((20, 9), start + .01)
+    assert scheduler.should_send((30, 9), start + .02)
+
+
+def test_brake_is_sent_at_once_and_refreshed_at_its_own_period():
+    scheduler, start = make_scheduler()
+    scheduler.should_send((20, 5), start)
+    scheduler.min_send_interval = 1.
+    # a change of command kind is never throttled
+    assert scheduler.should_send(BRAKE, start + .01)
+    assert not scheduler.should_send(BRAKE, start + .03)
+    assert scheduler.should_send(BRAKE, start + .07)
+
+
+def test_slots_stay_on_the_start_anchored_timeline():
+    scheduler, start = make_scheduler()
+    scheduler.should_send((20, 5), start)
+    # a late sample does not shift the slots that follow
+    assert scheduler.should_send((21, 5), start + .13)
+    assert not scheduler.should_send((22, 5), start + .19)
+    assert scheduler.should_send((22, 5), start + .21)
@@ -0,0 +1,57 @@
+from bfmc.utils.connection_utils import Frame
+from bfmc.utils.session_log import (RECORD_FRAME, RECORD_PACKAGE, RECORD_RESPONSE, SessionLog, SessionRecorder,
+                                    decode_frame_record, decode_response_record)
+
+
+def test_records_are_read_back_in_order(tmp_path):
+    path = str(tmp_path / 'session.bin')
+    recorder = SessionRecorder(path)
+    recorder.record_frame(Frame(1, 7, b'$i10$d1;2', 9.5), 10.)
+    recorder.record_package('$i10$d1;2')
+    recorder.record_response(7, 'ok')
+    recorder.close()
+
+    log = SessionLog(path)
+    try:
+        assert log.records == 3
+        records = list(log.read())
+        assert [record.kind for record in records] == [RECORD_FRAME, RECORD_PACKAGE, RECORD_RESPONSE]
+        frame = decode_frame_record(records[0].payload)
+        assert (frame.kind, frame.request_id, bytes(frame.payload)) == (1, 7, b'$i10$d1;2')
+        assert abs(frame.timestamp - .5) < 1e-9
+        assert bytes(records[1].payload) == b'$i10$d1;2'
+        assert decode_response_record(records[2].payload) == (7, 'ok')
+        assert list(log.read(kinds=(RECORD_RESPONSE,)))[0].kind == RECORD_RESPONSE
+    finally:
+        log.close()
+
+
+def test_records_span_chunks_and_time_ranges(tmp_path):
+    path = str(tmp_path / 'session.bin')
+    recorder = SessionRecorder(path, chunk_size=1)
+    for index in range(100):
+        recorder.record(RECORD_PACKAGE, b'x' * 1000, now=recorder.__start__ + index)
+    recorder.close()
+
+    log = SessionLog(path)
+    try:
+        assert len(log.chunks) > 1
+        assert log.records == 100
+        assert [round(record.time) for record in log.read(start=39.5, end=42.5)] == [40, 41, 42]
+        assert round(log.duration) == 99
+    finally:
+        log.close()
+
+
+def test_log_cut_short_is_read_up_to_its_last_record(tmp_path):
+    path = str(tmp_path / 'session.bin')
+    recorder = SessionRecorder(path)
+    recorder.record_package('$i10$d1;2')
+    recorder.record_package('$i13$d')
+    # the car lost power: never closed
+    log = SessionLog(path)
+    try:
+        assert [bytes(record.payload) for record in log.read()] == [b'$i10$d1;2', b'$i13$d']
+    finally:
+        log.close()
+        recorder.close()
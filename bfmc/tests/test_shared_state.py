@@ -0,0 +1,116 @@
+import struct
+import threading
+
+import pytest
+
+from bfmc.process_runtime import SETPOINT_LAYOUT, NetworkFrontEnd, SharedControlLoop
+from bfmc.utils.connection_utils import FRAME_KIND_BATCH, RESPONSE_OK, RESPONSE_UNSUPPORTED, Frame, pack_batch
+from bfmc.utils.maneuvers import build_maneuver_package
+from bfmc.utils.shared_state import SharedRing, SharedSnapshot
+
+
+def test_ring_is_first_in_first_out():
+    ring = SharedRing(slots=4, slot_size=8)
+    try:
+        assert ring.pop() is None
+        assert ring.push(b'one')
+        assert ring.push(b'two')
+        assert len(ring) == 2
+        assert ring.pop() == b'one'
+        assert ring.pop_all() == [b'two']
+        assert len(ring) == 0
+    finally:
+        ring.close()
+
+
+def test_ring_refuses_pushes_when_full():
+    ring = SharedRing(slots=2, slot_size=8)
+    try:
+        assert ring.push(b'a')
+        assert ring.push(b'b')
+        assert not ring.push(b'c')
+        assert ring.dropped == 1
+        assert ring.pop() == b'a'
+        # wraps around
+        assert ring.push(b'd')
+        assert ring.pop_all() == [b'b', b'd']
+    finally:
+        ring.close()
+
+
+def test_ring_refuses_messages_longer_than_a_slot():
+    ring = SharedRing(slots=2, slot_size=4)
+    try:
+        with pytest.raises(ValueError):
+            ring.push(b'too long')
+    finally:
+        ring.close()
+
+
+def test_ring_attached_by_name_shares_the_messages():
+    ring = SharedRing(slots=4, slot_size=8)
+    attached = SharedRing(ring.name)
+    try:
+        assert (attached.slots, attached.slot_size) == (4, 8)
+        ring.push(b'hello')
+        assert attached.pop() == b'hello'
+        assert len(ring) == 0
+    finally:
+        attached.close()
+        ring.close()
+
+
+def test_snapshot_keeps_the_latest_record():
+    layout = struct.Struct('=d?')
+    snapshot = SharedSnapshot(layout)
+    attached = SharedSnapshot(layout, snapshot.name)
+    try:
+        assert attached.read() == (None, 0)
+        snapshot.write(1.5, False)
+        snapshot.write(2.5, True)
+        assert attached.read() == ((2.5, True), 2)
+        assert snapshot.version == 2
+    finally:
+        attached.close()
+        snapshot.close()
+
+
+def test_shared_control_loop_takes_the_latest_setpoint():
+    setpoints = SharedSnapshot(SETPOINT_LAYOUT)
+    sent = []
+    serial = type('Serial', (), {'send': lambda self, msg: sent.append(msg)})()
+    loop = SharedControlLoop(SharedSnapshot(SETPOINT_LAYOUT, setpoints.name), serial, lambda power: power / 100.,
+                             max_speed_step=None, max_steering_step=None)
+    try:
+        loop.step()
+        assert sent == []
+        nan = float('nan')
+        setpoints.write(10., nan, 4., False, True, nan, nan)
+        setpoints.write(20., nan, -4., False, True, nan, nan)
+        loop.step()
+        setpoints.write(nan, 0., 0., True, False, nan, nan)
+        loop.step()
+        assert sent == ['#MCTL:0.20;-4.00;;\r\n', '#BRAK:0.00;;\r\n']
+        assert loop.setpoint.timestamp is None
+    finally:
+        loop.shared_setpoints.close()
+        setpoints.close()
+
+
+def test_network_front_end_answers_other_commands_as_unsupported():
+    setpoints = SharedSnapshot(SETPOINT_LAYOUT)
+    spi_ring = SharedRing(slots=4, slot_size=64)
+    connection = type('Host', (), {'current_frame_received_at': None})()
+    network = NetworkFrontEnd(connection, setpoints, spi_ring, threading.Event())
+    try:
+        assert network.decode_command('$i10$d20 5') == RESPONSE_OK
+        assert network.decode_command(build_maneuver_package()) == RESPONSE_UNSUPPORTED
+        assert network.decode_command('$i14$dblink') == RESPONSE_UNSUPPORTED
+        assert network.unsupported_commands == {11, 14}
+        batch = pack_batch([build_maneuver_package().encode(), b'$i13$d0'])
+        assert network.decode_frame(Frame(FRAME_KIND_BATCH, 1, batch)) == RESPONSE_UNSUPPORTED
+        # the batch's brake is applied all the same
+        assert setpoints.read()[0][3]
+    finally:
+        spi_ring.close()
+        setpoints.close()
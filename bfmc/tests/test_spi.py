@@ -0,0 +1,79 @@
+import pytest
+
+from bfmc.utils.spi import (NOB_TO_N, SPI_CMD_LIGHTS, SPI_CMD_TURN_SIGNALS, SPI_FRAME_CACHE,
+                            SPI_MAX_EXTENDED_DATA_BYTES, build_spi_command, build_spi_frame, build_spi_package,
+                            decode_spi_frame, get_spi_frame_length, get_spi_passthrough_data, split_spi_frames)
+
+
+def build_baseline_spi_command(cmd_id, data):
+    """build_baseline_spi_command
+
+        The list-based frame builder the RC used before frames were built as bytes.
+    """
+    number_of_data_bytes = len(data)
+    if number_of_data_bytes <= 7:
+        extend = 0
+        n = NOB_TO_N[number_of_data_bytes + 1]
+        data_0_byte = False
+        frame_length = 1 << n
+    else:
+        number_of_data_bytes += 1
+        extend = 1
+        n = (number_of_data_bytes & 0b1100000000) >> 8
+        data_0_byte = number_of_data_bytes & 0xFF
+        frame_length = number_of_data_bytes + 2
+    spi_data = [(cmd_id << 3) | (extend << 2) | n]
+    if data_0_byte:
+        spi_data.append(data_0_byte)
+    spi_data.extend(data)
+    if extend == 0:
+        while len(spi_data) < frame_length:
+            spi_data.append(0)
+    return spi_data
+
+
+@pytest.mark.parametrize('length', list(range(8)) + [8, 100, 254, 256, 1000, SPI_MAX_EXTENDED_DATA_BYTES])
+def test_frames_match_the_baseline_builder(length):
+    data = [(index * 7 + 1) & 0xFF for index in range(length)]
+    frame = build_spi_frame(9, data)
+    assert isinstance(frame, bytes)
+    assert list(frame) == build_baseline_spi_command(9, data)
+    assert build_spi_frame(9, bytes(data)) == frame
+    assert build_spi_frame(9, memoryview(bytes(data))) == frame
+    assert get_spi_frame_length(frame[0], frame[1] if len(frame) > 1 else None) == len(frame)
+
+
+def test_extended_frame_keeps_a_zero_data_0_byte():
+    # 511 data bytes and the data 0 byte: the length's low byte is zero, the baseline builder dropped it
+    frame = build_spi_frame(2, [1] * 511)
+    assert list(frame[:2]) == [2 << 3 | 1 << 2 | 2, 0]
+    assert len(frame) == get_spi_frame_length(frame[0], frame[1]) == 513
+
+
+def test_invalid_commands_are_refused():
+    with pytest.raises(ValueError):
+        build_spi_frame(32, [])
+    with pytest.raises(ValueError):
+        build_spi_frame(1, [0] * (SPI_MAX_EXTENDED_DATA_BYTES + 1))
+
+
+def test_constant_frames_come_from_the_cache():
+    for cmd_id in (SPI_CMD_LIGHTS, SPI_CMD_TURN_SIGNALS):
+        for value in range(4):
+            frame = build_spi_command(cmd_id, [value])
+            assert frame is SPI_FRAME_CACHE[(cmd_id, (value,))]
+            assert frame == build_spi_frame(cmd_id, [value])
+    assert (SPI_CMD_LIGHTS, (4,)) not in SPI_FRAME_CACHE
+    assert build_spi_command(SPI_CMD_LIGHTS, [4]) == build_spi_frame(SPI_CMD_LIGHTS, [4])
+
+
+def test_passthrough_frames_are_split_and_decoded():
+    frames = [build_spi_command(SPI_CMD_LIGHTS, [2]), build_spi_command(3, list(range(20))),
+              build_spi_command(1, [13])]
+    package = build_spi_package(SPI_CMD_LIGHTS, [2]) + frames[1] + frames[2]
+    spi_data = get_spi_passthrough_data(package)
+    assert [bytes(frame) for frame in split_spi_frames(spi_data)] == frames
+    assert decode_spi_frame(frames[1]) == (3, bytes(range(20)))
+    assert decode_spi_frame(frames[0]) == (SPI_CMD_LIGHTS, b'\x02')
+    assert get_spi_passthrough_data('$i50$d') is None
+    assert get_spi_passthrough_data(b'$i10$d1 2') is None
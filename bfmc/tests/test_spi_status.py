@@ -0,0 +1,67 @@
+import pytest
+
+from bfmc.core import BFMC
+from bfmc.utils.driver.status import SpiStatusPoller
+from bfmc.utils.emulator import SerialEmulator, SpiEmulator
+from bfmc.utils.spi import SPI_CMD_QUERY, build_spi_command
+
+
+class QueryWorker:
+    """QueryWorker
+
+        SPI worker answering every query with the current value.
+    """
+    def __init__(self, value=0):
+        self.value = value
+        self.queries = []
+
+    def query(self, data, response_size):
+        self.queries.append(bytes(data))
+        return [self.value] * response_size
+
+
+QUERY = build_spi_command(SPI_CMD_QUERY, [13])
+
+
+def test_nothing_is_polled_unless_watched():
+    worker = QueryWorker()
+    poller = SpiStatusPoller(worker)
+    poller.poll()
+    assert worker.queries == []
+    assert poller.get(QUERY) is None
+
+
+def test_first_read_queries_at_once_then_polls():
+    worker = QueryWorker(value=7)
+    poller = SpiStatusPoller(worker)
+    assert poller.read(QUERY).value == (7,)
+    assert worker.queries == [bytes(QUERY)]
+
+    worker.value = 9
+    changes = []
+    poller.subscribe(changes.append)
+    poller.poll()
+    assert poller.get(QUERY).value == (9,)
+    assert [status.value for status in changes] == [(9,)]
+
+
+def test_client_queries_are_bounded_and_expire():
+    worker = QueryWorker()
+    poller = SpiStatusPoller(worker, max_client_queries=2, client_query_expiry=0.)
+    for register in range(3):
+        poller.read(build_spi_command(SPI_CMD_QUERY, [register]))
+    assert len(poller.snapshot) == 2
+    poller.poll()
+    assert poller.snapshot == {}
+    assert poller.expired == 3
+
+
+@pytest.mark.parametrize('watch_driver_status', [False, True])
+def test_car_answers_the_first_status_request(watch_driver_status):
+    car = BFMC(serial_connection=SerialEmulator(), spi=SpiEmulator(read_handler=lambda cmd_id, data: b'\x05'),
+               serve=False, watch_driver_status=watch_driver_status)
+    try:
+        assert bool(car.status_poller.__queries__) == watch_driver_status
+        assert car.decode_command('$i1$d' + str(bytes(QUERY), 'latin-1')) == '5'
+    finally:
+        car.shutdown()
@@ -0,0 +1,76 @@
+import pytest
+
+from bfmc.utils.spi import SPI_CMD_LIGHTS, SPI_CMD_TURN_SIGNALS, build_spi_command
+from bfmc.utils.spi_worker import SpiWorker
+
+SPI_CMD_MOVE = 2
+
+
+class RecordingDriver:
+    """RecordingDriver
+
+        Driver board keeping every transaction, answering queries with the request reversed.
+    """
+    def __init__(self):
+        self.transactions = []
+
+    def send_spi_data(self, data):
+        self.transactions.append(bytes(data))
+
+    def query_spi_data(self, data, response_size):
+        if response_size < 0:
+            raise IOError('Invalid response size!')
+        self.transactions.append(bytes(data))
+        return list(reversed(data))[:response_size]
+
+
+def test_queued_state_frames_are_superseded():
+    driver = RecordingDriver()
+    sent = []
+    worker = SpiWorker(driver, batch_window=10., sent_callback=lambda context, started: sent.append(context))
+    lights_on = build_spi_command(SPI_CMD_LIGHTS, [1])
+    lights_off = build_spi_command(SPI_CMD_LIGHTS, [0])
+    move = build_spi_command(SPI_CMD_MOVE, [20, 5])
+    hazard = build_spi_command(SPI_CMD_TURN_SIGNALS, [3])
+
+    worker.submit(lights_on, context='lights on')
+    worker.submit(move + lights_off, context='move')
+    worker.submit(hazard, context='hazard')
+    # stopping flushes the queue without waiting for the batch window
+    worker.start()
+    worker.stop()
+
+    # turn signals are sent first, the older lights frame is dropped and the rest share one transaction
+    assert driver.transactions == [hazard + move + lights_off]
+    assert sent == ['hazard', 'move']
+    statistics = worker.get_statistics()
+    assert (statistics['frames_sent'], statistics['frames_dropped'], statistics['batches']) == (3, 1, 1)
+    assert statistics['queue_depth'] == 0
+
+
+def test_sent_state_frame_is_not_superseded():
+    driver = RecordingDriver()
+    worker = SpiWorker(driver, batch_window=0.)
+    lights_on = build_spi_command(SPI_CMD_LIGHTS, [1])
+    lights_off = build_spi_command(SPI_CMD_LIGHTS, [0])
+    worker.start()
+    try:
+        worker.submit(lights_on)
+        assert worker.query([1, 2, 3], 2) == [3, 2]
+        worker.submit(lights_off)
+    finally:
+        worker.stop()
+
+    assert driver.transactions == [lights_on, b'\x01\x02\x03', lights_off]
+    assert worker.get_statistics()['frames_dropped'] == 0
+
+
+def test_query_errors_reach_the_caller():
+    worker = SpiWorker(RecordingDriver())
+    worker.start()
+    try:
+        with pytest.raises(IOError):
+            worker.query([1], -1)
+        assert worker.query(b'\x04\x05', 1) == [5]
+    finally:
+        worker.stop()
@@ -0,0 +1,73 @@
+import threading
+
+import pytest
+
+from bfmc.utils.async_client import AsyncClient
+from bfmc.utils.connection_utils import FRAME_KIND_BATCH, payload_to_string, unpack_batch
+from bfmc.utils.host import Host
+from bfmc.utils.transport import InProcessTransport, UnixTransport, get_transport
+
+PORT = 25871
+
+
+@pytest.fixture(params=['unix', 'inprocess'])
+def transport(request, tmp_path):
+    if request.param == 'unix':
+        return UnixTransport(path=str(tmp_path / 'bfmc.sock'))
+    return InProcessTransport()
+
+
+def serve(host, frames):
+    """serve
+
+        Answer every command with its payload, upper-cased, until the client is gone.
+    """
+    host.connect_with_client()
+    while True:
+        frame = host.get_frame()
+        if frame is None:
+            return
+        frames.append(frame)
+        packages = unpack_batch(frame.payload) if frame.kind == FRAME_KIND_BATCH else [frame.payload]
+        host.send_response(frame.request_id, ' '.join(payload_to_string(package).upper() for package in packages))
+
+
+def test_requests_and_batches_round_trip(transport):
+    host = Host(None, PORT, transport=transport)
+    assert host.start_server()
+    frames = []
+    server = threading.Thread(target=serve, args=(host, frames), daemon=True)
+    server.start()
+
+    client = AsyncClient('localhost', PORT, transport=transport)
+    client.connect_to_host()
+    try:
+        assert payload_to_string(client.send_package_async('$i13$d0', timestamp=4.).result(2.)) == '$I13$D0'
+        assert payload_to_string(client.send_batch_async(['$i10$d1 2', '$i13$d0']).result(2.)) == \
+            '$I10$D1 2 $I13$D0'
+    finally:
+        client.close()
+    server.join(2.)
+    host.stop_server()
+
+    assert frames[0].timestamp == 4.
+    # in-process frames are handed over as they are, without packing
+    assert isinstance(frames[0].payload, str) != transport.serializes
+
+
+def test_in_process_port_is_exclusive():
+    transport = InProcessTransport()
+    listener = transport.listen(PORT + 1, 1)
+    try:
+        with pytest.raises(OSError):
+            transport.listen(PORT + 1, 1)
+    finally:
+        listener.close()
+    with pytest.raises(ConnectionRefusedError):
+        transport.connect('localhost', PORT + 1)
+
+
+def test_unknown_transport_is_refused():
+    assert get_transport('unix').name == 'unix'
+    with pytest.raises(ValueError):
+        get_transport('carrier pigeon')